@@ -1,13 +1,24 @@
-from app.core.dependencies import get_file_service, set_qa_service
+from typing import List
+
+from app.core.dependencies import (
+    get_corpus_service,
+    get_file_service,
+    get_ingestion_service,
+    refresh_qa_service,
+)
 from app.core.logger import get_logger
+from app.models.corpus import DocumentInfo
+from app.models.ingestion import IngestionJobStatus
+from app.services.corpus_service import CorpusService
 from app.services.file_service import FileService
-from fastapi import APIRouter, Depends, File, Form, UploadFile
+from app.services.ingestion_service import IngestionService
+from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
 
 logger = get_logger()
 file_router = APIRouter()
 
 
-@file_router.post("/upload")
+@file_router.post("/upload", status_code=202)
 async def upload_file(
     file: UploadFile = File(...),
     original_filename: str = Form(...),
@@ -15,12 +26,53 @@ async def upload_file(
 ):
     logger.info(f"Received file upload request: {original_filename}")
 
-    result = await file_service.process_upload(file, original_filename)
-
-    if "qa_service" in result:
-        set_qa_service(result["qa_service"])
-        logger.info("QA service instance has been set")
-        del result["qa_service"]
+    result = await file_service.process_upload(
+        file, original_filename, on_complete=refresh_qa_service
+    )
 
-    logger.info(f"File upload processed successfully: {original_filename}")
+    logger.info(
+        f"File upload accepted: {original_filename}, job id: {result['job_id']}"
+    )
     return result
+
+
+@file_router.get("/jobs", response_model=List[IngestionJobStatus])
+async def list_jobs(
+    ingestion_service: IngestionService = Depends(get_ingestion_service),
+):
+    return [job.to_status() for job in ingestion_service.list_jobs()]
+
+
+@file_router.get("/jobs/{job_id}", response_model=IngestionJobStatus)
+async def get_job(
+    job_id: str,
+    ingestion_service: IngestionService = Depends(get_ingestion_service),
+):
+    job = ingestion_service.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job id: {job_id}")
+    return job.to_status()
+
+
+@file_router.get("/documents", response_model=List[DocumentInfo])
+async def list_documents(
+    corpus_service: CorpusService = Depends(get_corpus_service),
+):
+    return [
+        DocumentInfo.from_record(record) for record in corpus_service.list_documents()
+    ]
+
+
+@file_router.delete("/documents/{document_id}", response_model=DocumentInfo)
+def delete_document(
+    document_id: str,
+    corpus_service: CorpusService = Depends(get_corpus_service),
+):
+    logger.info(f"Received document delete request: {document_id}")
+    record = corpus_service.delete_document(document_id)
+    if record is None:
+        raise HTTPException(
+            status_code=404, detail=f"Unknown document id: {document_id}"
+        )
+    refresh_qa_service()
+    return DocumentInfo.from_record(record)
@@ -1,16 +1,39 @@
+import json
 import time
-from typing import Dict
+from typing import Dict, Optional
 
 import weave
+from app.core.config import settings
 from app.core.database import engine, get_db
-from app.core.dependencies import get_evaluation_service, get_qa_service
+from app.core.dependencies import (
+    ensure_llm_available,
+    get_answer_cache,
+    get_corpus_service,
+    get_evaluation_queue,
+    get_evaluation_service,
+    get_llm_scheduler,
+    get_qa_service,
+    get_single_flight,
+)
 from app.core.logger import get_logger
 from app.core.wandb_utils import finish_wandb, init_wandb, log_qa_metrics
-from app.models.evaluation import Base, EvaluationRecord
-from app.models.qa import Answer, Question
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
-from sqlalchemy import func
+from app.models.evaluation import Base
+from app.models.qa import (
+    Answer,
+    BatchAnswers,
+    BatchQuestions,
+    Question,
+    RetrieveRequest,
+    RetrieveResponse,
+)
+from app.models.routing import routing_stats
+from app.services.corpus_service import CorpusService
+from app.services.llm_scheduler import INTERACTIVE
+from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
 
 logger = get_logger()
 qa_router = APIRouter()
@@ -30,23 +53,28 @@ async def shutdown_event():
         finish_wandb()
 
 
+def _server_timing(timings: Dict[str, float]) -> str:
+    return ", ".join(
+        f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()
+    )
+
+
 @weave.op()
-@qa_router.post("/answer", response_model=Answer)
+@qa_router.post(
+    "/answer", response_model=Answer, dependencies=[Depends(ensure_llm_available)]
+)
 async def answer_question(
     question: Question,
-    background_tasks: BackgroundTasks,
+    response: Response,
     qa_service=Depends(get_qa_service),
-    evaluation_service=Depends(get_evaluation_service),
-    db: Session = Depends(get_db),
+    evaluation_queue=Depends(get_evaluation_queue),
 ):
     try:
         logger.info("Received question request")
         start_time = time.time()
         answer = await qa_service.answer_question(question)
-        # Add background task for evaluation and storage
-        background_tasks.add_task(
-            evaluation_service.evaluate_and_store, question.question, answer, db
-        )
+        response.headers["Server-Timing"] = _server_timing(answer.timings)
+        await evaluation_queue.enqueue([(question.question, answer)])
         execution_time = time.time() - start_time
         logger.info("Question answered successfully")
 
@@ -57,6 +85,8 @@ async def answer_question(
                 logger.error(f"Error logging metrics to W&B: {str(e)}")
 
         return answer
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception(f"Error processing question: {str(e)}")
         raise HTTPException(
@@ -64,37 +94,132 @@ async def answer_question(
         )
 
 
-@qa_router.get("/metrics", response_model=Dict[str, float])
-async def get_metrics(db: Session = Depends(get_db)):
+@qa_router.post(
+    "/answer/batch",
+    response_model=BatchAnswers,
+    dependencies=[Depends(ensure_llm_available)],
+)
+async def answer_batch(
+    batch: BatchQuestions,
+    qa_service=Depends(get_qa_service),
+    evaluation_queue=Depends(get_evaluation_queue),
+):
+    if len(batch.questions) > settings.QA.BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch exceeds {settings.QA.BATCH_MAX_QUESTIONS} questions",
+        )
     try:
-        logger.info("Retrieving evaluation metrics")
+        logger.info("Received batch question request")
+        results = await qa_service.answer_batch(
+            batch.questions, settings.QA.BATCH_MAX_CONCURRENCY
+        )
+    except Exception as e:
+        logger.exception(f"Error processing question batch: {str(e)}")
+        raise HTTPException(
+            status_code=500, detail="An error occurred while processing the batch"
+        )
 
-        total_evaluations = db.query(func.count(EvaluationRecord.id)).scalar()
-        relevant_evaluations = (
-            db.query(func.count(EvaluationRecord.id))
-            .filter(EvaluationRecord.relevance == "RELEVANT")
-            .scalar()
+    if batch.evaluate:
+        # Asked for explicitly, so every answer is evaluated, not a sample.
+        await evaluation_queue.enqueue(
+            [
+                (item.question, item.answer)
+                for item in results
+                if item.answer is not None
+            ],
+            sample=False,
         )
+    return BatchAnswers(results=results)
+
+
+@qa_router.post("/retrieve", response_model=RetrieveResponse)
+async def retrieve(
+    request: RetrieveRequest,
+    qa_service=Depends(get_qa_service),
+    corpus_service: CorpusService = Depends(get_corpus_service),
+):
+    sources = None
+    if request.document_id is not None or request.filename is not None:
+        # Chunks carry the stored file path as their source; resolve the
+        # requested document(s) to those paths.
+        sources = {
+            record.file_path
+            for record in corpus_service.list_documents()
+            if request.document_id in (None, record.document_id)
+            and request.filename in (None, record.original_filename)
+        }
+        if not sources:
+            raise HTTPException(status_code=404, detail="Document not found")
 
-        hit_rate = (
-            relevant_evaluations / total_evaluations if total_evaluations > 0 else 0
+    try:
+        chunks = await run_in_threadpool(
+            qa_service.retrieve,
+            request.question,
+            request.k,
+            request.fetch_k,
+            request.min_score,
+            sources,
+            request.page_from,
+            request.page_to,
+        )
+    except Exception as e:
+        logger.exception(f"Error retrieving chunks: {str(e)}")
+        raise HTTPException(
+            status_code=500, detail="An error occurred while retrieving chunks"
         )
+    return RetrieveResponse(chunks=chunks)
 
-        # Calculate MRR
-        evaluations = db.query(EvaluationRecord).all()
-        reciprocal_ranks = []
-        for eval in evaluations:
-            if eval.relevance == "RELEVANT":
-                reciprocal_ranks.append(1)
-            elif eval.relevance == "PARTLY_RELEVANT":
-                reciprocal_ranks.append(0.5)
-            else:
-                reciprocal_ranks.append(0)
 
-        mrr = sum(reciprocal_ranks) / len(reciprocal_ranks) if reciprocal_ranks else 0
+def _format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-        metrics = {"hit_rate": hit_rate, "mrr": mrr}
 
+@qa_router.post("/answer/stream", dependencies=[Depends(ensure_llm_available)])
+async def stream_answer(
+    question: Question,
+    qa_service=Depends(get_qa_service),
+    evaluation_queue=Depends(get_evaluation_queue),
+    llm_scheduler=Depends(get_llm_scheduler),
+):
+    logger.info("Received streaming question request")
+    # Once streaming starts the status code is sent; reject overload up front.
+    llm_scheduler.check_admission(INTERACTIVE)
+    completed = {}
+
+    async def event_stream():
+        try:
+            async for event in qa_service.stream_answer(question):
+                if event["event"] == "done":
+                    completed["answer"] = event["answer"]
+                yield _format_sse(event["event"], event["data"])
+        except Exception as e:
+            logger.exception(f"Error streaming answer: {str(e)}")
+            error = {"detail": "An error occurred while processing the question"}
+            yield _format_sse("error", error)
+
+    async def evaluate():
+        if "answer" in completed:
+            await evaluation_queue.enqueue([(question.question, completed["answer"])])
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(evaluate),
+    )
+
+
+@qa_router.get("/metrics", response_model=Dict[str, float])
+def get_metrics(
+    window_seconds: Optional[float] = None,
+    document_id: Optional[str] = None,
+    evaluation_service=Depends(get_evaluation_service),
+    db: Session = Depends(get_db),
+):
+    try:
+        logger.info("Retrieving evaluation metrics")
+        metrics = evaluation_service.get_metrics(db, window_seconds, document_id)
         logger.info("Metrics retrieved successfully")
         return metrics
     except Exception as e:
@@ -102,3 +227,30 @@ async def get_metrics(db: Session = Depends(get_db)):
         raise HTTPException(
             status_code=500, detail="An error occurred while retrieving metrics"
         )
+
+
+@qa_router.get("/evaluations", response_model=Dict[str, int])
+def get_evaluation_queue_stats(evaluation_queue=Depends(get_evaluation_queue)):
+    return evaluation_queue.stats()
+
+
+@qa_router.get("/cache", response_model=Dict[str, float])
+async def get_cache_stats(answer_cache=Depends(get_answer_cache)):
+    if answer_cache is None:
+        raise HTTPException(status_code=404, detail="Answer cache is disabled")
+    return answer_cache.stats()
+
+
+@qa_router.get("/coalescing", response_model=Dict[str, int])
+async def get_coalescing_stats(single_flight=Depends(get_single_flight)):
+    return single_flight.stats()
+
+
+@qa_router.get("/scheduler", response_model=Dict[str, float])
+async def get_scheduler_stats(llm_scheduler=Depends(get_llm_scheduler)):
+    return llm_scheduler.stats()
+
+
+@qa_router.get("/endpoints", response_model=Dict[str, Dict[str, float]])
+async def get_endpoint_stats():
+    return routing_stats()
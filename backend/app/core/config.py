@@ -1,4 +1,5 @@
 import os
+from typing import Dict, List
 
 import toml
 from pydantic import BaseModel
@@ -8,6 +9,7 @@ class ProviderSettings(BaseModel):
     PROVIDER_TYPE: str
     NAME: str
     BASE_URL: str = ""
+    BASE_URLS: List[str] = []
     API_KEY: str = ""
 
 
@@ -18,6 +20,110 @@ class LoggingSettings(BaseModel):
     RETENTION: str
 
 
+class UploadSettings(BaseModel):
+    CHUNK_SIZE: int = 1024 * 1024
+    MAX_SIZE_MB: int = 512
+
+    @property
+    def MAX_SIZE_BYTES(self) -> int:
+        return self.MAX_SIZE_MB * 1024 * 1024
+
+
+class IngestionSettings(BaseModel):
+    MAX_WORKERS: int = 2
+    MAX_PENDING_JOBS: int = 16
+    JOB_HISTORY: int = 100
+
+
+class DocumentProcessingSettings(BaseModel):
+    CHUNK_SIZE: int = 1500
+    CHUNK_OVERLAP: int = 100
+    MAX_WORKERS: int = 1
+    PAGES_PER_TASK: int = 50
+    PARALLEL_MIN_PAGES: int = 100
+
+
+class IndexSettings(BaseModel):
+    TYPE: str = "auto"
+    AUTO_FLAT_MAX_VECTORS: int = 50_000
+    AUTO_HNSW_MAX_VECTORS: int = 1_000_000
+    HNSW_M: int = 32
+    HNSW_EF_CONSTRUCTION: int = 200
+    HNSW_EF_SEARCH: int = 64
+    IVF_NLIST: int = 0
+    IVF_NPROBE: int = 16
+    PQ_M: int = 64
+    PQ_NBITS: int = 8
+
+
+class VectorStoreSettings(BaseModel):
+    EMBEDDING_BATCH_SIZE: int = 64
+    MAX_CONCURRENT_BATCHES: int = 4
+    MAX_RETRIES: int = 3
+    RETRY_BACKOFF_SECONDS: float = 1.0
+    INDEX_DIR: str = "indexes"
+    KEEP_VERSIONS: int = 3
+    MMAP: bool = True
+    COMPACT_AFTER_DELTAS: int = 20
+    INDEX: IndexSettings = IndexSettings()
+
+
+class EmbeddingCacheSettings(BaseModel):
+    ENABLED: bool = True
+    PATH: str = "db/embedding_cache.db"
+    MAX_ENTRIES: int = 500_000
+
+
+class AnswerCacheSettings(BaseModel):
+    ENABLED: bool = True
+    SIMILARITY_THRESHOLD: float = 0.95
+    MAX_ENTRIES: int = 1000
+    TTL_SECONDS: float = 3600
+
+
+class ModelSettings(BaseModel):
+    AVAILABILITY_TTL_SECONDS: float = 300
+    AVAILABILITY_TIMEOUT_SECONDS: float = 5
+
+
+class LLMSchedulerSettings(BaseModel):
+    MAX_CONCURRENCY: int = 2
+    MAX_QUEUED: Dict[str, int] = {"interactive": 32, "batch": 64, "evaluation": 1000}
+    MAX_WAIT_SECONDS: Dict[str, float] = {"interactive": 30, "batch": 300}
+
+
+class RoutingSettings(BaseModel):
+    EJECT_AFTER_FAILURES: int = 3
+    EJECTION_SECONDS: float = 30
+    HEDGE_AFTER_SECONDS: float = 0
+
+
+class EvaluationSettings(BaseModel):
+    SAMPLE_RATE: float = 0.05
+    DOCUMENT_SAMPLE_RATES: Dict[str, float] = {}
+    LOW_CONFIDENCE_QUANTILE: float = 0.05
+    CONFIDENCE_WINDOW: int = 1000
+    WORKERS: int = 2
+    BATCH_SIZE: int = 8
+    MAX_ATTEMPTS: int = 5
+    RETRY_BACKOFF_SECONDS: float = 30
+    POLL_SECONDS: float = 5
+    LEASE_SECONDS: float = 120
+
+
+class RecordingSettings(BaseModel):
+    MODE: str = "off"
+    PATH: str = "db/recordings.db"
+
+
+class QASettings(BaseModel):
+    ANSWER_MODE: str = "structured"
+    BATCH_MAX_QUESTIONS: int = 1000
+    BATCH_MAX_CONCURRENCY: int = 4
+    CONTEXT_MAX_TOKENS: int = 1200
+    CHARS_PER_TOKEN: float = 4.0
+
+
 class Settings(BaseModel):
     PROJECT_NAME: str
     UPLOAD_DIR: str
@@ -29,6 +135,18 @@ class Settings(BaseModel):
     LOGGING: LoggingSettings
     LLM: ProviderSettings
     EMBEDDING: ProviderSettings
+    UPLOAD: UploadSettings = UploadSettings()
+    INGESTION: IngestionSettings = IngestionSettings()
+    DOCUMENT_PROCESSING: DocumentProcessingSettings = DocumentProcessingSettings()
+    VECTOR_STORE: VectorStoreSettings = VectorStoreSettings()
+    EMBEDDING_CACHE: EmbeddingCacheSettings = EmbeddingCacheSettings()
+    ANSWER_CACHE: AnswerCacheSettings = AnswerCacheSettings()
+    QA: QASettings = QASettings()
+    MODELS: ModelSettings = ModelSettings()
+    LLM_SCHEDULER: LLMSchedulerSettings = LLMSchedulerSettings()
+    ROUTING: RoutingSettings = RoutingSettings()
+    EVALUATION: EvaluationSettings = EvaluationSettings()
+    RECORDING: RecordingSettings = RecordingSettings()
 
     @property
     def LOG_LEVEL(self) -> str:
@@ -74,6 +192,12 @@ def load_config(config_path: str = "config.toml") -> Settings:
         "PROVIDER_TYPE": embedding_provider,
     }
 
+    # [vector_store.index] loads as a lowercase nested table.
+    vector_store_settings = dict(config_dict.get("vector_store", {}))
+    vector_store_settings["INDEX"] = IndexSettings(
+        **vector_store_settings.pop("index", {})
+    )
+
     return Settings(
         PROJECT_NAME=config_dict["general"]["project_name"],
         UPLOAD_DIR=config_dict["general"]["upload_dir"],
@@ -85,6 +209,22 @@ def load_config(config_path: str = "config.toml") -> Settings:
         LOGGING=LoggingSettings(**config_dict["logging"]),
         LLM=ProviderSettings(**llm_settings),
         EMBEDDING=ProviderSettings(**embedding_settings),
+        UPLOAD=UploadSettings(**config_dict.get("upload", {})),
+        INGESTION=IngestionSettings(**config_dict.get("ingestion", {})),
+        DOCUMENT_PROCESSING=DocumentProcessingSettings(
+            **config_dict.get("document_processing", {})
+        ),
+        VECTOR_STORE=VectorStoreSettings(**vector_store_settings),
+        EMBEDDING_CACHE=EmbeddingCacheSettings(
+            **config_dict.get("embedding_cache", {})
+        ),
+        ANSWER_CACHE=AnswerCacheSettings(**config_dict.get("answer_cache", {})),
+        QA=QASettings(**config_dict.get("qa", {})),
+        MODELS=ModelSettings(**config_dict.get("models", {})),
+        LLM_SCHEDULER=LLMSchedulerSettings(**config_dict.get("llm_scheduler", {})),
+        ROUTING=RoutingSettings(**config_dict.get("routing", {})),
+        EVALUATION=EvaluationSettings(**config_dict.get("evaluation", {})),
+        RECORDING=RecordingSettings(**config_dict.get("recording", {})),
     )
 
 
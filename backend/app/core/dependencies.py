@@ -1,9 +1,19 @@
-from typing import Callable
+from typing import Callable, Optional
 
+from app.core.concurrency import SingleFlight
+from app.core.config import settings
+from app.core.database import SessionLocal
 from app.core.logger import get_logger
-from app.services.document_processor import PDFProcessor
+from app.factories.llm_factory import check_llm_available
+from app.services.answer_cache import SemanticAnswerCache
+from app.services.corpus_service import CorpusService
 from app.services.document_service import DocumentService
+from app.services.embedding_cache import EmbeddingCache
+from app.services.evaluation_queue import EvaluationQueue
+from app.services.evaluation_sampler import EvaluationSampler
 from app.services.evaluation_service import EvaluationService
+from app.services.ingestion_service import IngestionService
+from app.services.llm_scheduler import LLMScheduler
 from app.services.qa_service import QAService
 from app.services.vector_store_service import FAISSVectorStoreService
 from fastapi import Depends, HTTPException
@@ -12,6 +22,25 @@ logger = get_logger()
 
 qa_service_instance = None
 evaluation_service_instance = None
+evaluation_queue_instance = None
+ingestion_service_instance = None
+embedding_cache_instance = None
+corpus_service_instance = None
+answer_cache_instance = None
+question_single_flight = SingleFlight()
+llm_scheduler = LLMScheduler(
+    max_concurrency=settings.LLM_SCHEDULER.MAX_CONCURRENCY,
+    max_queued=settings.LLM_SCHEDULER.MAX_QUEUED,
+    max_wait_seconds=settings.LLM_SCHEDULER.MAX_WAIT_SECONDS,
+)
+
+
+async def ensure_llm_available():
+    # Cached for [models] AVAILABILITY_TTL_SECONDS, so this is rarely a round-trip.
+    try:
+        await check_llm_available()
+    except (ConnectionError, ValueError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
 
 def get_qa_service():
@@ -25,17 +54,20 @@ def get_qa_service():
     return qa_service_instance
 
 
-def set_qa_service(new_qa_service: QAService):
+def set_qa_service(new_qa_service: Optional[QAService]):
     global qa_service_instance
     qa_service_instance = new_qa_service
-    logger.info("QA service has been initialized")
+    if new_qa_service is None:
+        logger.info("QA service has been cleared, the corpus is empty")
+    else:
+        logger.info("QA service has been initialized")
 
 
 def get_evaluation_service():
     global evaluation_service_instance
     if evaluation_service_instance is None:
         logger.info("Evaluation service not initialized. Initializing now.")
-        evaluation_service_instance = EvaluationService()
+        evaluation_service_instance = EvaluationService(llm_scheduler=llm_scheduler)
     return evaluation_service_instance
 
 
@@ -45,24 +77,145 @@ def set_evaluation_service(new_evaluation_service: EvaluationService):
     logger.info("Evaluation service has been initialized")
 
 
-def get_document_processor():
-    return PDFProcessor()
+def get_evaluation_queue():
+    global evaluation_queue_instance
+    if evaluation_queue_instance is None:
+        evaluation_queue_instance = EvaluationQueue(
+            get_evaluation_service(),
+            sampler=EvaluationSampler(
+                sample_rate=settings.EVALUATION.SAMPLE_RATE,
+                document_sample_rates=settings.EVALUATION.DOCUMENT_SAMPLE_RATES,
+                low_confidence_quantile=settings.EVALUATION.LOW_CONFIDENCE_QUANTILE,
+                confidence_window=settings.EVALUATION.CONFIDENCE_WINDOW,
+            ),
+            session_factory=SessionLocal,
+            workers=settings.EVALUATION.WORKERS,
+            batch_size=settings.EVALUATION.BATCH_SIZE,
+            max_attempts=settings.EVALUATION.MAX_ATTEMPTS,
+            retry_backoff_seconds=settings.EVALUATION.RETRY_BACKOFF_SECONDS,
+            poll_seconds=settings.EVALUATION.POLL_SECONDS,
+            lease_seconds=settings.EVALUATION.LEASE_SECONDS,
+        )
+    return evaluation_queue_instance
+
+
+def get_ingestion_service():
+    global ingestion_service_instance
+    if ingestion_service_instance is None:
+        logger.info("Ingestion service not initialized. Initializing now.")
+        ingestion_service_instance = IngestionService(
+            max_workers=settings.INGESTION.MAX_WORKERS,
+            max_pending_jobs=settings.INGESTION.MAX_PENDING_JOBS,
+            job_history=settings.INGESTION.JOB_HISTORY,
+        )
+    return ingestion_service_instance
+
+
+def get_embedding_cache():
+    global embedding_cache_instance
+    if not settings.EMBEDDING_CACHE.ENABLED:
+        return None
+    if embedding_cache_instance is None:
+        embedding_cache_instance = EmbeddingCache(
+            path=settings.EMBEDDING_CACHE.PATH,
+            max_entries=settings.EMBEDDING_CACHE.MAX_ENTRIES,
+        )
+    return embedding_cache_instance
 
 
 def get_vector_store_service():
-    return FAISSVectorStoreService()
+    return FAISSVectorStoreService(
+        batch_size=settings.VECTOR_STORE.EMBEDDING_BATCH_SIZE,
+        max_concurrent_batches=settings.VECTOR_STORE.MAX_CONCURRENT_BATCHES,
+        max_retries=settings.VECTOR_STORE.MAX_RETRIES,
+        retry_backoff_seconds=settings.VECTOR_STORE.RETRY_BACKOFF_SECONDS,
+        index_dir=settings.VECTOR_STORE.INDEX_DIR,
+        keep_versions=settings.VECTOR_STORE.KEEP_VERSIONS,
+        mmap=settings.VECTOR_STORE.MMAP,
+        index_settings=settings.VECTOR_STORE.INDEX,
+    )
+
+
+def get_answer_cache():
+    global answer_cache_instance
+    if not settings.ANSWER_CACHE.ENABLED:
+        return None
+    if answer_cache_instance is None:
+        answer_cache_instance = SemanticAnswerCache(
+            similarity_threshold=settings.ANSWER_CACHE.SIMILARITY_THRESHOLD,
+            max_entries=settings.ANSWER_CACHE.MAX_ENTRIES,
+            ttl_seconds=settings.ANSWER_CACHE.TTL_SECONDS,
+        )
+    return answer_cache_instance
+
+
+def get_single_flight():
+    return question_single_flight
+
+
+def get_llm_scheduler():
+    return llm_scheduler
+
+
+def get_corpus_service():
+    global corpus_service_instance
+    if corpus_service_instance is None:
+        corpus_service_instance = CorpusService(
+            get_vector_store_service(),
+            compact_after_deltas=settings.VECTOR_STORE.COMPACT_AFTER_DELTAS,
+        )
+    return corpus_service_instance
 
 
 def get_document_service(
-    document_processor: PDFProcessor = Depends(get_document_processor),
-    vector_store_service: FAISSVectorStoreService = Depends(get_vector_store_service),
+    corpus_service: CorpusService = Depends(get_corpus_service),
+    embedding_cache: EmbeddingCache = Depends(get_embedding_cache),
 ):
-    return DocumentService(vector_store_service)
+    return DocumentService(corpus_service, embedding_cache)
 
 
 def get_file_service(
     document_service: DocumentService = Depends(get_document_service),
+    ingestion_service: IngestionService = Depends(get_ingestion_service),
 ) -> Callable:
     from app.services.file_service import FileService
 
-    return FileService(document_service)
+    return FileService(document_service, ingestion_service)
+
+
+def refresh_qa_service():
+    corpus_service = get_corpus_service()
+    answer_cache = get_answer_cache()
+    if answer_cache is not None:
+        answer_cache.invalidate(corpus_service.version)
+    if corpus_service.is_empty():
+        set_qa_service(None)
+        return
+    set_qa_service(
+        QAService(
+            corpus_service.vector_store,
+            index_version=corpus_service.version,
+            index_lock=corpus_service.index_lock,
+            answer_cache=answer_cache,
+            single_flight=question_single_flight,
+            llm_scheduler=llm_scheduler,
+            document_ids={
+                record.file_path: record.document_id
+                for record in corpus_service.list_documents()
+            },
+        )
+    )
+
+
+def load_persisted_qa_service():
+    document_service = get_document_service(
+        corpus_service=get_corpus_service(),
+        embedding_cache=get_embedding_cache(),
+    )
+    try:
+        if not document_service.load_corpus():
+            logger.info("No persisted index found. File upload required.")
+            return
+        refresh_qa_service()
+    except Exception as e:
+        logger.exception(f"Failed to restore QA service from disk: {str(e)}")
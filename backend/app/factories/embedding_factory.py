@@ -16,6 +16,7 @@ class EmbeddingFactory:
             provider=settings.EMBEDDING.PROVIDER_TYPE,
             model_name=settings.EMBEDDING.NAME,
             base_url=settings.EMBEDDING.BASE_URL,
+            base_urls=tuple(settings.EMBEDDING.BASE_URLS),
             api_key=settings.EMBEDDING.API_KEY,
         )
         try:
@@ -8,17 +8,21 @@ logger = get_logger()
 
 class LLMFactory:
     @staticmethod
-    def create_llm():
-        logger.info(f"Creating LLM with provider: {settings.LLM.PROVIDER_TYPE}")
-        config = ModelConfig(
+    def create_config() -> ModelConfig:
+        return ModelConfig(
             provider=settings.LLM.PROVIDER_TYPE,
             model_name=settings.LLM.NAME,
             base_url=settings.LLM.BASE_URL,
+            base_urls=tuple(settings.LLM.BASE_URLS),
             api_key=settings.LLM.API_KEY,
         )
+
+    @staticmethod
+    def create_llm():
+        logger.info(f"Getting LLM with provider: {settings.LLM.PROVIDER_TYPE}")
         try:
-            llm = model_service.get_llm(config)
-            logger.info(f"LLM created successfully: {type(llm).__name__}")
+            llm = model_service.get_llm(LLMFactory.create_config())
+            logger.info(f"LLM ready: {type(llm).__name__}")
             return llm
         except Exception as e:
             logger.error(f"Error creating LLM: {str(e)}")
@@ -27,3 +31,7 @@ class LLMFactory:
 
 def get_llm():
     return LLMFactory.create_llm()
+
+
+async def check_llm_available():
+    await model_service.check_llm_available(LLMFactory.create_config())
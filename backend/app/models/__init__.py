@@ -1,40 +1,116 @@
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from app.core.concurrency import SingleFlight
+from app.core.config import settings
 from app.core.logger import get_logger
 
 from .base import ModelConfig
+from .embedding.fake import FakeEmbedding
 from .embedding.ollama import OllamaEmbedding
 from .embedding.openai import OpenAIEmbedding
+from .llm.fake import FakeLLM
 from .llm.ollama import OllamaLLM
 from .llm.openai import OpenAILLM
+from .recording import OFF, ModelRecorder, RecordingStore
 
 logger = get_logger()
 
 
 class ModelService:
-    def __init__(self):
+    """Process-wide registry of model clients, one per ModelConfig.
+
+    Clients hold their HTTP connection pools, so every service built on the
+    same config shares open keep-alive connections. With a recorder, clients
+    record their calls and replay them from its store.
+    """
+
+    def __init__(
+        self,
+        availability_ttl_seconds: float,
+        availability_timeout: float,
+        recorder: Optional[ModelRecorder] = None,
+    ):
         self.llm_factories = {
             "ollama": OllamaLLM(),
             "openai": OpenAILLM(),
+            "fake": FakeLLM(),
         }
         self.embedding_factories = {
             "ollama": OllamaEmbedding(),
             "openai": OpenAIEmbedding(),
+            "fake": FakeEmbedding(),
         }
+        self.availability_ttl_seconds = availability_ttl_seconds
+        self.availability_timeout = availability_timeout
+        self.recorder = recorder
+        self._llms: Dict[ModelConfig, Any] = {}
+        self._embedding_models: Dict[ModelConfig, Any] = {}
+        self._available_until: Dict[ModelConfig, float] = {}
+        self._availability_checks = SingleFlight()
+        self._lock = threading.Lock()
 
     def get_llm(self, config: ModelConfig):
-        factory = self.llm_factories.get(config.provider.lower())
-        if not factory:
-            raise ValueError(f"Unsupported LLM provider: {config.provider}")
-        return factory.get_chat_model(config)
+        with self._lock:
+            llm = self._llms.get(config)
+            if llm is None:
+                llm = self._llm_factory(config).get_chat_model(config)
+                if self.recorder is not None:
+                    llm = self.recorder.wrap_llm(llm, config)
+                self._llms[config] = llm
+            return llm
 
     def get_embedding_model(self, config: ModelConfig):
-        factory = self.embedding_factories.get(config.provider.lower())
+        with self._lock:
+            embedding_model = self._embedding_models.get(config)
+            if embedding_model is None:
+                factory = self.embedding_factories.get(config.provider.lower())
+                if not factory:
+                    raise ValueError(
+                        f"Unsupported embedding provider: {config.provider}"
+                    )
+                embedding_model = factory.get_embedding_model(config)
+                if self.recorder is not None:
+                    embedding_model = self.recorder.wrap_embedding_model(
+                        embedding_model, config
+                    )
+                self._embedding_models[config] = embedding_model
+            return embedding_model
+
+    async def check_llm_available(self, config: ModelConfig):
+        if time.monotonic() < self._available_until.get(config, 0.0):
+            return
+        # Concurrent callers share one check; only success is remembered.
+        await self._availability_checks.do(
+            config,
+            lambda: self._llm_factory(config).check_available(
+                config, self.availability_timeout
+            ),
+        )
+        self._available_until[config] = (
+            time.monotonic() + self.availability_ttl_seconds
+        )
+
+    def _llm_factory(self, config: ModelConfig):
+        factory = self.llm_factories.get(config.provider.lower())
         if not factory:
-            raise ValueError(f"Unsupported embedding provider: {config.provider}")
-        return factory.get_embedding_model(config)
+            raise ValueError(f"Unsupported LLM provider: {config.provider}")
+        return factory
 
 
 def get_model_service() -> ModelService:
-    return ModelService()
+    recorder = None
+    if settings.RECORDING.MODE != OFF:
+        recorder = ModelRecorder(
+            RecordingStore(settings.RECORDING.PATH), settings.RECORDING.MODE
+        )
+        logger.info(f"Model calls are recorded in {settings.RECORDING.MODE} mode")
+    return ModelService(
+        availability_ttl_seconds=settings.MODELS.AVAILABILITY_TTL_SECONDS,
+        availability_timeout=settings.MODELS.AVAILABILITY_TIMEOUT_SECONDS,
+        recorder=recorder,
+    )
 
 
 model_service = get_model_service()
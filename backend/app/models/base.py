@@ -1,14 +1,23 @@
 from abc import ABC, abstractmethod
+from typing import Tuple
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 
 class ModelConfig(BaseModel):
+    # Frozen so configs can key the client registry.
+    model_config = ConfigDict(frozen=True)
+
     provider: str
     model_name: str
     base_url: str = ""
+    base_urls: Tuple[str, ...] = ()
     api_key: str = ""
 
+    @property
+    def endpoints(self) -> Tuple[str, ...]:
+        return self.base_urls or (self.base_url,)
+
 
 class LLMFactory(ABC):
     @abstractmethod
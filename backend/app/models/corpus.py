@@ -0,0 +1,34 @@
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+
+class DocumentRecord(BaseModel):
+    document_id: str
+    original_filename: str
+    file_path: str
+    sha256: str
+    chunk_ids: List[str]
+    chunk_hashes: List[str] = []
+    created_at: float
+    updated_at: Optional[float] = None
+
+
+class DocumentInfo(BaseModel):
+    document_id: str
+    original_filename: str
+    sha256: str
+    num_chunks: int
+    created_at: float
+    updated_at: Optional[float] = None
+
+    @classmethod
+    def from_record(cls, record: DocumentRecord) -> "DocumentInfo":
+        return cls(
+            document_id=record.document_id,
+            original_filename=record.original_filename,
+            sha256=record.sha256,
+            num_chunks=len(record.chunk_ids),
+            created_at=record.created_at,
+            updated_at=record.updated_at,
+        )
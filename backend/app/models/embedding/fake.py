@@ -0,0 +1,53 @@
+import hashlib
+import re
+import time
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app.models.base import ModelConfig
+from app.models.embedding.base import BaseEmbedding
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic stand-in embeddings for benchmarks and offline runs.
+
+    Each word is hashed to one signed dimension and the counts are
+    normalised, so texts sharing words are similar and retrieval still
+    returns sensible chunks. Each call takes latency_seconds.
+    """
+
+    def __init__(self, size: int, latency_seconds: float):
+        self.size = size
+        self.latency_seconds = latency_seconds
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency_seconds)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency_seconds)
+        return self._embed(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_documents(texts)
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        for word in WORD_PATTERN.findall(text.lower()):
+            digest = int.from_bytes(hashlib.md5(word.encode()).digest()[:8], "little")
+            vector[digest % self.size] += 1.0 if digest & (1 << 63) else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+
+class FakeEmbedding(BaseEmbedding):
+    def __init__(self, size: int = 256, latency_seconds: float = 0.0):
+        self.size = size
+        self.latency_seconds = latency_seconds
+
+    def get_embedding_model(self, config: ModelConfig):
+        return HashingEmbeddings(self.size, self.latency_seconds)
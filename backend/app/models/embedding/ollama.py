@@ -1,19 +1,69 @@
+from typing import Any, List
+
+import httpx
 from langchain_community.embeddings import OllamaEmbeddings
 
 from app.core.logger import get_logger
 from app.models.base import ModelConfig
 from app.models.embedding.base import BaseEmbedding
+from app.models.routing import RoutingTransport, get_router
 
 logger = get_logger()
 
 
+class RoutedOllamaEmbeddings(OllamaEmbeddings):
+    """OllamaEmbeddings that sends requests through a pooled, replica-aware
+    httpx client instead of a fresh requests connection per text."""
+
+    http_client: Any = None
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embeds several queries, each with the query instruction prefix."""
+        return [
+            self._process_emb_response(f"{self.query_instruction}{text}")
+            for text in texts
+        ]
+
+    def _process_emb_response(self, input: str) -> List[float]:
+        headers = {"Content-Type": "application/json", **(self.headers or {})}
+        try:
+            response = self.http_client.post(
+                "/api/embeddings",
+                headers=headers,
+                json={"model": self.model, "prompt": input, **self._default_params},
+            )
+        except httpx.HTTPError as e:
+            raise ValueError(f"Error raised by inference endpoint: {e}")
+        if response.status_code != 200:
+            raise ValueError(
+                "Error raised by inference API HTTP code: "
+                f"{response.status_code}, {response.text}"
+            )
+        try:
+            return response.json()["embedding"]
+        except (ValueError, KeyError) as e:
+            raise ValueError(
+                f"Error raised by inference API: {e}.\nResponse: {response.text}"
+            )
+
+
 class OllamaEmbedding(BaseEmbedding):
     def get_embedding_model(self, config: ModelConfig):
         try:
             logger.info(
-                f"Initializing OllamaEmbeddings with model: {config.model_name}"
+                f"Initializing OllamaEmbeddings with model: {config.model_name} "
+                f"on {', '.join(config.endpoints)}"
+            )
+            http_client = httpx.Client(
+                base_url=config.endpoints[0],
+                timeout=None,
+                transport=RoutingTransport(get_router(config.endpoints)),
+            )
+            return RoutedOllamaEmbeddings(
+                model=config.model_name,
+                base_url=config.endpoints[0],
+                http_client=http_client,
             )
-            return OllamaEmbeddings(model=config.model_name, base_url=config.base_url)
         except Exception as err:
             logger.error(f"Failed to initialize OllamaEmbeddings: {str(err)}")
             raise RuntimeError("Failed to initialize OllamaEmbeddings.") from err
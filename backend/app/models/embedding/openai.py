@@ -1,9 +1,19 @@
+from typing import List
+
 from langchain_openai.embeddings import OpenAIEmbeddings
 
 from app.models.base import ModelConfig
 from app.models.embedding.base import BaseEmbedding
 
 
+class BatchedOpenAIEmbeddings(OpenAIEmbeddings):
+    """OpenAIEmbeddings that can embed several queries in one request."""
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        # OpenAI embeds queries and documents alike.
+        return self.embed_documents(texts)
+
+
 class OpenAIEmbedding(BaseEmbedding):
     def get_embedding_model(self, config: ModelConfig):
-        return OpenAIEmbeddings(model=config.model_name, api_key=config.api_key)
+        return BatchedOpenAIEmbeddings(model=config.model_name, api_key=config.api_key)
@@ -1,8 +1,11 @@
 # app/models/evaluation.py
 import hashlib
+import json
+from enum import Enum
+from typing import List
 
 from app.core.database import engine
-from sqlalchemy import Column, String, Text
+from sqlalchemy import Column, Float, Index, Integer, String, Text, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -10,18 +13,104 @@ Base = declarative_base()
 
 class EvaluationRecord(Base):
     __tablename__ = "evaluations"
+    # Covers time-windowed metrics without touching the text columns.
+    __table_args__ = (
+        Index("ix_evaluations_evaluated_at_relevance", "evaluated_at", "relevance"),
+    )
 
     id = Column(String(32), primary_key=True)
     question = Column(Text, nullable=False)
     answer = Column(Text, nullable=False)
     sources = Column(Text, nullable=False)
-    relevance = Column(String(20), nullable=False)
+    relevance = Column(String(20), nullable=False, index=True)
     explanation = Column(Text, nullable=False)  # Added explanation column
+    evaluated_at = Column(Float)
+    content_hash = Column(String(64))
+    # 1 / the chance this answer had of being sampled for evaluation.
+    sample_weight = Column(Float, nullable=False, default=1.0)
 
     @classmethod
     def create_id(cls, question: str) -> str:
         return hashlib.md5(question.encode()).hexdigest()
 
+    @classmethod
+    def create_content_hash(cls, answer: str, sources: List[str]) -> str:
+        return hashlib.sha256(json.dumps([answer, sources]).encode()).hexdigest()
+
+
+class EvaluationDocument(Base):
+    """Corpus documents an evaluated answer drew on, for per-document metrics."""
+
+    __tablename__ = "evaluation_documents"
+
+    evaluation_id = Column(String(32), primary_key=True)
+    document_id = Column(String(32), primary_key=True, index=True)
+
+
+class EvaluationJobState(str, Enum):
+    PENDING = "PENDING"
+    RUNNING = "RUNNING"
+    FAILED = "FAILED"
+
+
+class EvaluationJob(Base):
+    """An answer waiting to be judged; deleted once its evaluation is stored."""
+
+    __tablename__ = "evaluation_jobs"
+    __table_args__ = (
+        Index("ix_evaluation_jobs_state_available_at", "state", "available_at"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    question = Column(Text, nullable=False)
+    answer = Column(Text, nullable=False)
+    sources = Column(Text, nullable=False)  # JSON list
+    document_ids = Column(Text, nullable=False)  # JSON list
+    content_hash = Column(String(64), index=True)
+    sample_weight = Column(Float, nullable=False, default=1.0)
+    state = Column(String(10), nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    # Not claimed before this time; pushed back after a failed attempt.
+    available_at = Column(Float, nullable=False)
+    claim = Column(String(32), index=True)
+    # When the claim was taken or last renewed; a claim not renewed within the
+    # lease is presumed dead and the job is claimed again.
+    claimed_at = Column(Float)
+    last_error = Column(Text)
+    created_at = Column(Float, nullable=False)
+
+
+# Columns added after a table was first released, with their DDL.
+ADDED_COLUMNS = {
+    "evaluations": {
+        "evaluated_at": "FLOAT",
+        "content_hash": "VARCHAR(64)",
+        "sample_weight": "FLOAT NOT NULL DEFAULT 1.0",
+    },
+    "evaluation_jobs": {
+        "content_hash": "VARCHAR(64)",
+        "sample_weight": "FLOAT NOT NULL DEFAULT 1.0",
+        "claimed_at": "FLOAT",
+    },
+}
+
+
+def _migrate():
+    # create_all leaves existing tables alone; add what older databases lack.
+    inspector = inspect(engine)
+    for table, added in ADDED_COLUMNS.items():
+        columns = {column["name"] for column in inspector.get_columns(table)}
+        with engine.begin() as connection:
+            for name, ddl in added.items():
+                if name not in columns:
+                    connection.execute(
+                        text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}")
+                    )
+    for model in (EvaluationRecord, EvaluationJob):
+        for index in model.__table__.indexes:
+            index.create(bind=engine, checkfirst=True)
+
 
 # Create the table
 Base.metadata.create_all(bind=engine)
+_migrate()
@@ -0,0 +1,35 @@
+from enum import Enum
+from typing import Any, Callable, Dict, Optional
+
+from pydantic import BaseModel
+
+# Called as progress_callback(stage, done, total) while a document is ingested.
+ProgressCallback = Callable[[str, int, Optional[int]], None]
+
+
+class JobState(str, Enum):
+    QUEUED = "QUEUED"
+    RUNNING = "RUNNING"
+    COMPLETED = "COMPLETED"
+    FAILED = "FAILED"
+
+
+class IngestionProgress(BaseModel):
+    stage: str = "queued"
+    pages_parsed: int = 0
+    chunks_total: Optional[int] = None
+    chunks_embedded: int = 0
+    eta_seconds: Optional[float] = None
+
+
+class IngestionJobStatus(BaseModel):
+    job_id: str
+    original_filename: str
+    saved_filename: str
+    state: JobState
+    progress: IngestionProgress
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
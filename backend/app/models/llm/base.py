@@ -7,3 +7,6 @@ class BaseLLM(ABC):
     @abstractmethod
     def get_chat_model(self, config: ModelConfig):
         pass
+
+    async def check_available(self, config: ModelConfig, timeout: float):
+        pass
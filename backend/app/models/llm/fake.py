@@ -0,0 +1,129 @@
+import asyncio
+import hashlib
+import random
+import time
+from enum import Enum
+from typing import Any, AsyncIterator, Dict, Iterator, List, get_origin, get_type_hints
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+from pydantic import BaseModel
+
+from app.models.base import ModelConfig
+from app.models.llm.base import BaseLLM
+
+VOCABULARY = (
+    "the system document section value process step result table figure "
+    "required default configured response request page limit rate"
+).split()
+
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic stand-in chat model for benchmarks and offline runs.
+
+    The reply is derived from a hash of the prompt, so a prompt always gets
+    the same reply, and cites passage [1]. Each call takes latency_seconds,
+    spread over the streamed words. Structured output fills the schema's
+    fields from the same hash.
+    """
+
+    latency_seconds: float = 0.0
+    answer_words: int = 40
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _generate(
+        self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs
+    ) -> ChatResult:
+        time.sleep(self.latency_seconds)
+        return self._result(messages)
+
+    async def _agenerate(
+        self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs
+    ) -> ChatResult:
+        await asyncio.sleep(self.latency_seconds)
+        return self._result(messages)
+
+    def _stream(
+        self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs
+    ) -> Iterator[ChatGenerationChunk]:
+        words = self._reply(self._prompt(messages)).split(" ")
+        for word in words:
+            time.sleep(self.latency_seconds / len(words))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+
+    async def _astream(
+        self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        words = self._reply(self._prompt(messages)).split(" ")
+        for word in words:
+            await asyncio.sleep(self.latency_seconds / len(words))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+
+    def with_structured_output(self, schema, **kwargs):
+        def invoke(prompt_value: Any):
+            time.sleep(self.latency_seconds)
+            return self._structured(schema, self._input_text(prompt_value))
+
+        async def ainvoke(prompt_value: Any):
+            await asyncio.sleep(self.latency_seconds)
+            return self._structured(schema, self._input_text(prompt_value))
+
+        return RunnableLambda(invoke, afunc=ainvoke)
+
+    def _result(self, messages: List[BaseMessage]) -> ChatResult:
+        reply = AIMessage(content=self._reply(self._prompt(messages)))
+        return ChatResult(generations=[ChatGeneration(message=reply)])
+
+    def _reply(self, prompt: str) -> str:
+        words = random.Random(self._digest(prompt)).choices(
+            VOCABULARY, k=self.answer_words
+        )
+        return " ".join(words) + " [1]."
+
+    def _structured(self, schema, prompt: str):
+        digest = self._digest(prompt)
+        if isinstance(schema, type) and issubclass(schema, BaseModel):
+            fields = {
+                name: field.annotation for name, field in schema.model_fields.items()
+            }
+        else:
+            fields = get_type_hints(schema)
+        values: Dict[str, Any] = {}
+        for position, (name, annotation) in enumerate(fields.items()):
+            if isinstance(annotation, type) and issubclass(annotation, Enum):
+                members = list(annotation)
+                values[name] = members[int(digest[position], 16) % len(members)]
+            elif get_origin(annotation) in (list, List):
+                values[name] = []
+            else:
+                values[name] = self._reply(prompt)
+        if isinstance(schema, type) and issubclass(schema, BaseModel):
+            return schema(**values)
+        return values
+
+    @staticmethod
+    def _prompt(messages: List[BaseMessage]) -> str:
+        return "\n".join(str(message.content) for message in messages)
+
+    @staticmethod
+    def _input_text(prompt_value: Any) -> str:
+        if hasattr(prompt_value, "to_string"):
+            return prompt_value.to_string()
+        return str(prompt_value)
+
+    @staticmethod
+    def _digest(text: str) -> str:
+        return hashlib.sha256(text.encode()).hexdigest()
+
+
+class FakeLLM(BaseLLM):
+    def __init__(self, latency_seconds: float = 0.0):
+        self.latency_seconds = latency_seconds
+
+    def get_chat_model(self, config: ModelConfig):
+        return FakeChatModel(latency_seconds=self.latency_seconds)
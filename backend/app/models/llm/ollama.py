@@ -1,44 +1,71 @@
-import requests
+from typing import Dict, Tuple
+
+import httpx
 from langchain_ollama import ChatOllama
 
 from app.core.logger import get_logger
 from app.models.base import ModelConfig
 from app.models.llm.base import BaseLLM
+from app.models.routing import RoutingTransport, get_router
 
 logger = get_logger()
 
 
 class OllamaLLM(BaseLLM):
+    def __init__(self):
+        self._clients: Dict[Tuple[str, ...], httpx.AsyncClient] = {}
+
     def get_chat_model(self, config: ModelConfig):
-        self._check_ollama_service(config)
         try:
-            logger.info(f"Initializing ChatOllama with model: {config.model_name}")
+            logger.info(
+                f"Initializing ChatOllama with model: {config.model_name} "
+                f"on {', '.join(config.endpoints)}"
+            )
             return ChatOllama(
-                model=config.model_name, temperature=0, base_url=config.base_url
+                model=config.model_name,
+                temperature=0,
+                base_url=config.endpoints[0],
+                client_kwargs={
+                    "transport": RoutingTransport(get_router(config.endpoints))
+                },
             )
         except Exception as err:
             logger.error(f"Failed to initialize ChatOllama: {str(err)}")
             raise RuntimeError("Failed to initialize ChatOllama.") from err
 
-    def _check_ollama_service(self, config: ModelConfig):
+    async def check_available(self, config: ModelConfig, timeout: float):
+        client = self._clients.get(config.endpoints)
+        if client is None:
+            client = httpx.AsyncClient(
+                base_url=config.endpoints[0],
+                timeout=timeout,
+                transport=RoutingTransport(get_router(config.endpoints)),
+            )
+            self._clients[config.endpoints] = client
         try:
-            response = requests.get(f"{config.base_url}/api/tags")
+            response = await client.get("/api/tags")
             response.raise_for_status()
-            available_models = response.json()
-            if config.model_name not in [
-                model["name"] for model in available_models["models"]
-            ]:
-                logger.error(
-                    f"Model '{config.model_name}' is not available. Available models: {[model['name'] for model in available_models['models']]}"
-                )
-                raise ValueError(f"Model '{config.model_name}' is not available.")
-            logger.info(
-                f"Ollama service checked. Model '{config.model_name}' is available."
-            )
-        except requests.RequestException as err:
+        except httpx.HTTPError as err:
             logger.error(
-                f"Failed to connect to Ollama service at {config.base_url}: {str(err)}"
+                f"Failed to connect to Ollama service at "
+                f"{', '.join(config.endpoints)}: {str(err)}"
             )
             raise ConnectionError(
-                f"Unable to connect to Ollama service at {config.base_url}."
+                f"Unable to connect to Ollama service at {', '.join(config.endpoints)}."
             ) from err
+        try:
+            available_models = [
+                model["name"] for model in response.json().get("models", [])
+            ]
+        except (ValueError, AttributeError, KeyError, TypeError) as err:
+            logger.error(f"Unexpected response from Ollama service: {response.text}")
+            raise ValueError("Unexpected response from Ollama service.") from err
+        if config.model_name not in available_models:
+            logger.error(
+                f"Model '{config.model_name}' is not available. "
+                f"Available models: {available_models}"
+            )
+            raise ValueError(f"Model '{config.model_name}' is not available.")
+        logger.info(
+            f"Ollama service checked. Model '{config.model_name}' is available."
+        )
@@ -1,7 +1,7 @@
 from enum import Enum
-from typing import Annotated, List, TypedDict
+from typing import Annotated, Any, Dict, List, Optional, TypedDict
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class Question(BaseModel):
@@ -22,6 +22,51 @@ class AnswerWithSources(TypedDict):
 class Answer(BaseModel):
     answer: str
     sources: List[str]
+    # Corpus documents behind the answer; kept for evaluation, not returned.
+    document_ids: List[str] = Field(default_factory=list, exclude=True)
+    # Best retrieval relevance of the chunks behind the answer, if known; used
+    # to pick answers for evaluation, not returned.
+    confidence: Optional[float] = Field(default=None, exclude=True)
+    # Seconds spent per stage producing this answer, reported as Server-Timing.
+    timings: Dict[str, float] = Field(default_factory=dict, exclude=True)
+
+
+class BatchQuestions(BaseModel):
+    questions: List[str] = Field(..., min_length=1)
+    evaluate: bool = False
+
+
+class BatchAnswerItem(BaseModel):
+    question: str
+    answer: Optional[Answer] = None
+    error: Optional[str] = None
+
+
+class BatchAnswers(BaseModel):
+    results: List[BatchAnswerItem]
+
+
+class RetrieveRequest(BaseModel):
+    question: str
+    k: int = Field(4, ge=1)
+    fetch_k: int = Field(20, ge=1)
+    # Cosine similarity between the question and a chunk, from -1 to 1.
+    min_score: Optional[float] = Field(None, ge=-1, le=1)
+    document_id: Optional[str] = None
+    filename: Optional[str] = None
+    page_from: Optional[int] = None
+    page_to: Optional[int] = None
+
+
+class RetrievedChunk(BaseModel):
+    content: str
+    # Cosine similarity to the question, from -1 to 1.
+    score: float
+    metadata: Dict[str, Any]
+
+
+class RetrieveResponse(BaseModel):
+    chunks: List[RetrievedChunk]
 
 
 class Relevance(str, Enum):
@@ -33,3 +78,11 @@ class Relevance(str, Enum):
 class EvaluationResult(BaseModel):
     relevance: Relevance
     explanation: str
+
+
+class ItemEvaluation(EvaluationResult):
+    item: int
+
+
+class BatchEvaluationResult(BaseModel):
+    evaluations: List[ItemEvaluation]
@@ -0,0 +1,232 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.embeddings import Embeddings
+from langchain_core.load import dumps, loads
+
+from app.core.logger import get_logger
+from app.models.base import ModelConfig
+
+logger = get_logger()
+
+OFF = "off"
+# Call the provider for every request and store the response.
+RECORD = "record"
+# Serve stored responses; call the provider and store the response on a miss.
+REPLAY = "replay"
+# Serve stored responses; a miss is an error, the provider is never called.
+STRICT = "strict"
+MODES = (OFF, RECORD, REPLAY, STRICT)
+
+CHAT = "chat"
+DOCUMENT = "document"
+QUERY = "query"
+
+
+class RecordingMissError(LookupError):
+    """A model call with no recording, in strict mode."""
+
+
+class RecordingStore:
+    """SQLite store of recorded model responses keyed on a request hash."""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS recordings (
+                request_hash TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                model_name TEXT NOT NULL,
+                response BLOB NOT NULL,
+                recorded_at REAL NOT NULL
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.commit()
+        logger.info(f"Model call recordings opened at {path}")
+
+    @staticmethod
+    def hash_request(*parts: str) -> str:
+        return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+    def get_many(self, request_hashes: Sequence[str]) -> Dict[str, bytes]:
+        found = {}
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit.
+            for start in range(0, len(request_hashes), 500):
+                chunk = request_hashes[start : start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    "SELECT request_hash, response FROM recordings "
+                    f"WHERE request_hash IN ({placeholders})",
+                    chunk,
+                ).fetchall()
+                found.update(rows)
+        return found
+
+    def put_many(self, kind: str, model_name: str, responses: Dict[str, bytes]):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO recordings "
+                "(request_hash, kind, model_name, response, recorded_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (request_hash, kind, model_name, response, now)
+                    for request_hash, response in responses.items()
+                ],
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM recordings")
+            self._conn.commit()
+
+
+class ModelRecorder:
+    """Records model calls to a RecordingStore and serves them back.
+
+    Chat models get a LangChain cache backed by the store; embedding models
+    are wrapped in RecordingEmbeddings. Requests are keyed on the provider,
+    model, prompt or text, and call parameters.
+    """
+
+    def __init__(self, store: RecordingStore, mode: str):
+        if mode not in MODES:
+            raise ValueError(f"Unknown recording mode: {mode}")
+        self.store = store
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def wrap_llm(self, llm, config: ModelConfig):
+        llm.cache = RecordingCache(self, config)
+        # LangChain's cache is skipped for streamed calls; generate them in
+        # one piece so they are recorded and replayed like the rest.
+        llm.disable_streaming = True
+        return llm
+
+    def wrap_embedding_model(self, embedding_model: Embeddings, config: ModelConfig):
+        return RecordingEmbeddings(embedding_model, self, config)
+
+    def lookup(self, request_hashes: Sequence[str]) -> Dict[str, bytes]:
+        found = {} if self.mode == RECORD else self.store.get_many(request_hashes)
+        missing = len(set(request_hashes) - found.keys())
+        with self._lock:
+            self.hits += len(found)
+            self.misses += missing
+        if missing and self.mode == STRICT:
+            raise RecordingMissError(
+                f"{missing} model call(s) have no recording in {self.store.path}"
+            )
+        return found
+
+    def record(self, kind: str, model_name: str, responses: Dict[str, bytes]):
+        self.store.put_many(kind, model_name, responses)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+class RecordingCache(BaseCache):
+    def __init__(self, recorder: ModelRecorder, config: ModelConfig):
+        self.recorder = recorder
+        self.config = config
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        request_hash = self._hash(prompt, llm_string)
+        response = self.recorder.lookup([request_hash]).get(request_hash)
+        if response is None:
+            return None
+        return [loads(generation) for generation in json.loads(response)]
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE):
+        response = json.dumps([dumps(generation) for generation in return_val])
+        self.recorder.record(
+            CHAT,
+            self.config.model_name,
+            {self._hash(prompt, llm_string): response.encode()},
+        )
+
+    def clear(self, **kwargs):
+        self.recorder.store.clear()
+
+    def _hash(self, prompt: str, llm_string: str) -> str:
+        return RecordingStore.hash_request(
+            CHAT, self.config.provider, self.config.model_name, prompt, llm_string
+        )
+
+
+class RecordingEmbeddings(Embeddings):
+    """Wraps an embedding model so its vectors are recorded and replayed."""
+
+    def __init__(
+        self, embedding_model: Embeddings, recorder: ModelRecorder, config: ModelConfig
+    ):
+        self.embedding_model = embedding_model
+        self.recorder = recorder
+        self.config = config
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._recorded(DOCUMENT, texts, self.embedding_model.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._recorded(
+            QUERY, [text], lambda texts: [self.embedding_model.embed_query(texts[0])]
+        )[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return self._recorded(QUERY, texts, self.embedding_model.embed_queries)
+
+    def _recorded(
+        self,
+        kind: str,
+        texts: List[str],
+        embed: Callable[[List[str]], List[List[float]]],
+    ) -> List[List[float]]:
+        """Vectors for texts, calling embed only for those not replayed."""
+        request_hashes = [
+            RecordingStore.hash_request(
+                kind, self.config.provider, self.config.model_name, text
+            )
+            for text in texts
+        ]
+        found = self.recorder.lookup(request_hashes)
+        vectors = {
+            request_hash: np.frombuffer(response, dtype=np.float32).tolist()
+            for request_hash, response in found.items()
+        }
+
+        missing = {}
+        for request_hash, text in zip(request_hashes, texts):
+            if request_hash not in vectors:
+                missing.setdefault(request_hash, text)
+        if missing:
+            computed = dict(zip(missing, embed(list(missing.values()))))
+            self.recorder.record(
+                kind,
+                self.config.model_name,
+                {
+                    request_hash: np.asarray(vector, dtype=np.float32).tobytes()
+                    for request_hash, vector in computed.items()
+                },
+            )
+            vectors.update(computed)
+        return [vectors[request_hash] for request_hash in request_hashes]
@@ -0,0 +1,341 @@
+import asyncio
+import threading
+import time
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import httpx
+
+from app.core.config import settings
+from app.core.logger import get_logger
+
+logger = get_logger()
+
+
+class Endpoint:
+    def __init__(self, url: str):
+        self.url = httpx.URL(url)
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.hedges = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.latency: Optional[float] = None
+
+
+class EndpointRouter:
+    """Spreads requests over the replicas of one model server.
+
+    Each request goes to the healthy replica with the fewest requests in
+    flight. A replica that fails eject_after_failures times in a row is
+    skipped for ejection_seconds; if every replica is ejected, the one due
+    back soonest is used anyway.
+    """
+
+    def __init__(
+        self,
+        urls: Sequence[str],
+        eject_after_failures: int,
+        ejection_seconds: float,
+        hedge_after_seconds: float,
+    ):
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.eject_after_failures = eject_after_failures
+        self.ejection_seconds = ejection_seconds
+        self.hedge_after_seconds = hedge_after_seconds
+        self._lock = threading.Lock()
+
+    def acquire(self, exclude: Sequence[Endpoint] = ()) -> Endpoint:
+        with self._lock:
+            now = time.monotonic()
+            candidates = [e for e in self.endpoints if e not in exclude]
+            candidates = candidates or self.endpoints
+            healthy = [e for e in candidates if e.ejected_until <= now]
+            if not healthy:
+                healthy = [min(candidates, key=lambda e: e.ejected_until)]
+            endpoint = min(
+                healthy, key=lambda e: (e.outstanding, e.latency or 0.0, e.requests)
+            )
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def release(
+        self, endpoint: Endpoint, ok: Optional[bool], latency: Optional[float] = None
+    ):
+        # ok=None: the request was abandoned (e.g. a losing hedge), which says
+        # nothing about the replica's health.
+        with self._lock:
+            endpoint.outstanding -= 1
+            if ok is None:
+                return
+            if ok:
+                endpoint.consecutive_failures = 0
+                if latency is not None:
+                    endpoint.latency = (
+                        latency
+                        if endpoint.latency is None
+                        else 0.8 * endpoint.latency + 0.2 * latency
+                    )
+                return
+            endpoint.failures += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.consecutive_failures >= self.eject_after_failures:
+                endpoint.consecutive_failures = 0
+                endpoint.ejected_until = time.monotonic() + self.ejection_seconds
+                logger.warning(
+                    f"Ejecting {endpoint.url} for {self.ejection_seconds}s "
+                    f"after {self.eject_after_failures} consecutive failures"
+                )
+
+    def record_hedge(self, endpoint: Endpoint):
+        with self._lock:
+            endpoint.hedges += 1
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            now = time.monotonic()
+            return {
+                str(endpoint.url): {
+                    "outstanding": endpoint.outstanding,
+                    "requests": endpoint.requests,
+                    "failures": endpoint.failures,
+                    "hedges": endpoint.hedges,
+                    "ejected": float(endpoint.ejected_until > now),
+                    "latency_seconds": endpoint.latency or 0.0,
+                }
+                for endpoint in self.endpoints
+            }
+
+
+class _ReleasingStream(httpx.SyncByteStream, httpx.AsyncByteStream):
+    # Keeps the replica counted as busy until the response body is consumed,
+    # so streamed generations count as outstanding for their whole length.
+    def __init__(self, stream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+        self._closed = False
+
+    def __iter__(self) -> Iterator[bytes]:
+        yield from self._stream
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._release()
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+    def _release(self):
+        if not self._closed:
+            self._closed = True
+            self._on_close()
+
+
+class RoutingTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """httpx transport that sends each request to a replica chosen by a router.
+
+    Clients are built against the first replica's URL; the scheme, host and
+    port are swapped per request, so replicas must share the path prefix.
+    Connection errors and 5xx responses are retried on another replica. With
+    hedging enabled, an async request still waiting for headers after
+    hedge_after_seconds is also sent to a second replica; the first response
+    wins.
+    """
+
+    def __init__(
+        self,
+        router: EndpointRouter,
+        transport: Optional[httpx.BaseTransport] = None,
+        async_transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.router = router
+        self.transport = transport or httpx.HTTPTransport()
+        self.async_transport = async_transport or httpx.AsyncHTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        content = request.read()
+        tried: List[Endpoint] = []
+        while True:
+            endpoint = self.router.acquire(exclude=tried)
+            tried.append(endpoint)
+            start = time.monotonic()
+            try:
+                response = self.transport.handle_request(
+                    self._rewrite(request, content, endpoint)
+                )
+            except Exception as err:
+                self.router.release(endpoint, ok=False)
+                retryable = isinstance(err, httpx.TransportError)
+                if not retryable or len(tried) >= len(self.router.endpoints):
+                    raise
+                continue
+            response = self._track(response, endpoint, time.monotonic() - start)
+            if response.status_code >= 500 and len(tried) < len(self.router.endpoints):
+                response.close()
+                continue
+            return response
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        content = await request.aread()
+        tried: List[Endpoint] = []
+        while True:
+            endpoint = self.router.acquire(exclude=tried)
+            tried.append(endpoint)
+            try:
+                if self.router.hedge_after_seconds and len(tried) < len(
+                    self.router.endpoints
+                ):
+                    response = await self._send_hedged(
+                        request, content, endpoint, tried
+                    )
+                else:
+                    response = await self._send(request, content, endpoint)
+            except httpx.TransportError:
+                if len(tried) >= len(self.router.endpoints):
+                    raise
+                continue
+            if response.status_code >= 500 and len(tried) < len(self.router.endpoints):
+                await response.aclose()
+                continue
+            return response
+
+    def close(self):
+        self.transport.close()
+
+    async def aclose(self):
+        await self.async_transport.aclose()
+
+    async def _send(
+        self, request: httpx.Request, content: bytes, endpoint: Endpoint
+    ) -> httpx.Response:
+        start = time.monotonic()
+        try:
+            response = await self.async_transport.handle_async_request(
+                self._rewrite(request, content, endpoint)
+            )
+        except asyncio.CancelledError:
+            self.router.release(endpoint, ok=None)
+            raise
+        except Exception:
+            self.router.release(endpoint, ok=False)
+            raise
+        return self._track(response, endpoint, time.monotonic() - start)
+
+    async def _send_hedged(
+        self,
+        request: httpx.Request,
+        content: bytes,
+        endpoint: Endpoint,
+        tried: List[Endpoint],
+    ) -> httpx.Response:
+        primary = asyncio.ensure_future(self._send(request, content, endpoint))
+        tasks = [primary]
+        winner = None
+        try:
+            done, _ = await asyncio.wait(
+                tasks, timeout=self.router.hedge_after_seconds
+            )
+            if not done:
+                backup_endpoint = self.router.acquire(exclude=tried)
+                tried.append(backup_endpoint)
+                self.router.record_hedge(backup_endpoint)
+                logger.info(
+                    f"Hedging slow request to {endpoint.url} on {backup_endpoint.url}"
+                )
+                tasks.append(
+                    asyncio.ensure_future(
+                        self._send(request, content, backup_endpoint)
+                    )
+                )
+            pending = set(tasks)
+            while pending and winner is None:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                winner = next(
+                    (task for task in done if task.exception() is None), None
+                )
+            # If every attempt failed, surface the primary's error.
+            return (winner or primary).result()
+        finally:
+            for task in tasks:
+                if task is winner:
+                    continue
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled() and task.exception() is None:
+                    await task.result().aclose()
+
+    def _track(
+        self, response: httpx.Response, endpoint: Endpoint, latency: float
+    ) -> httpx.Response:
+        ok = response.status_code < 500
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_ReleasingStream(
+                response.stream,
+                lambda: self.router.release(endpoint, ok=ok, latency=latency),
+            ),
+            extensions=response.extensions,
+        )
+
+    @staticmethod
+    def _rewrite(
+        request: httpx.Request, content: bytes, endpoint: Endpoint
+    ) -> httpx.Request:
+        url = request.url.copy_with(
+            scheme=endpoint.url.scheme, host=endpoint.url.host, port=endpoint.url.port
+        )
+        headers = [
+            (name, value)
+            for name, value in request.headers.raw
+            if name.lower() != b"host"
+        ]
+        return httpx.Request(
+            request.method,
+            url,
+            headers=headers,
+            content=content,
+            extensions=request.extensions,
+        )
+
+
+_routers: Dict[Tuple[str, ...], EndpointRouter] = {}
+_routers_lock = threading.Lock()
+
+
+def get_router(urls: Sequence[str]) -> EndpointRouter:
+    # One router per set of replicas, shared by every client that talks to
+    # them, so chat and embedding traffic are balanced together.
+    key = tuple(urls)
+    with _routers_lock:
+        router = _routers.get(key)
+        if router is None:
+            router = EndpointRouter(
+                key,
+                eject_after_failures=settings.ROUTING.EJECT_AFTER_FAILURES,
+                ejection_seconds=settings.ROUTING.EJECTION_SECONDS,
+                hedge_after_seconds=settings.ROUTING.HEDGE_AFTER_SECONDS,
+            )
+            _routers[key] = router
+        return router
+
+
+def routing_stats() -> Dict[str, Dict[str, float]]:
+    with _routers_lock:
+        routers = list(_routers.values())
+    stats = {}
+    for router in routers:
+        stats.update(router.stats())
+    return stats
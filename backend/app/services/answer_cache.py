@@ -0,0 +1,156 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.core.logger import get_logger
+from app.models.qa import Answer
+
+logger = get_logger()
+
+
+class CachedAnswer:
+    def __init__(self, question: str, answer: Answer, latency: float):
+        self.question = question
+        self.answer = answer
+        self.latency = latency
+        self.created_at = time.time()
+
+
+class SemanticAnswerCache:
+    """Answers keyed by question embedding, matched on cosine similarity.
+
+    Entries belong to one index version; any lookup or store for another
+    version drops them, since answers over a changed corpus may be stale.
+    """
+
+    def __init__(
+        self, similarity_threshold: float, max_entries: int, ttl_seconds: float
+    ):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.index_version: Optional[str] = None
+        # Entries are keyed by their row in _vectors, in least recently used
+        # order. Rows are preallocated so a lookup is one matrix-vector
+        # product; _occupied masks out the free ones.
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        self._vectors: Optional[np.ndarray] = None
+        self._occupied = np.zeros(max_entries, dtype=bool)
+        self._free_rows = list(range(max_entries - 1, -1, -1))
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.latency_saved_seconds = 0.0
+
+    def lookup(
+        self, embedding: List[float], index_version: Optional[str]
+    ) -> Optional[Answer]:
+        vector = self._normalize(embedding)
+        with self._lock:
+            self._check_version(index_version)
+            self._expire()
+            best_row, best_similarity = None, -1.0
+            if self._entries and self._vectors.shape[1] == vector.shape[0]:
+                similarities = np.where(
+                    self._occupied, self._vectors @ vector, -np.inf
+                )
+                best_row = int(np.argmax(similarities))
+                best_similarity = float(similarities[best_row])
+
+            if best_row is None or best_similarity < self.similarity_threshold:
+                self.misses += 1
+                return None
+
+            entry = self._entries[best_row]
+            self._entries.move_to_end(best_row)
+            self.hits += 1
+            self.latency_saved_seconds += entry.latency
+            logger.info(
+                f"Answer cache hit (similarity {best_similarity:.3f}) "
+                f"for cached question: {entry.question}"
+            )
+            return entry.answer
+
+    def store(
+        self,
+        question: str,
+        embedding: List[float],
+        answer: Answer,
+        latency: float,
+        index_version: Optional[str],
+    ):
+        vector = self._normalize(embedding)
+        with self._lock:
+            self._check_version(index_version)
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                self._clear()
+                self._vectors = np.zeros(
+                    (self.max_entries, vector.shape[0]), dtype=np.float32
+                )
+            while self._entries and not self._free_rows:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            if not self._free_rows:
+                return
+            row = self._free_rows.pop()
+            self._entries[row] = CachedAnswer(question, answer, latency)
+            self._vectors[row] = vector
+            self._occupied[row] = True
+
+    def invalidate(self, index_version: Optional[str]):
+        with self._lock:
+            self._check_version(index_version)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "latency_saved_seconds": self.latency_saved_seconds,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _check_version(self, index_version: Optional[str]):
+        if index_version != self.index_version:
+            if self._entries:
+                logger.info(
+                    f"Index changed ({self.index_version} -> {index_version}), "
+                    f"dropping {len(self._entries)} cached answers"
+                )
+                self.invalidations += 1
+            self._clear()
+            self.index_version = index_version
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl_seconds
+        expired = [
+            row for row, entry in self._entries.items() if entry.created_at < cutoff
+        ]
+        for row in expired:
+            self._remove(row)
+            self.evictions += 1
+
+    def _remove(self, row: int):
+        del self._entries[row]
+        self._occupied[row] = False
+        self._free_rows.append(row)
+
+    def _clear(self):
+        self._entries.clear()
+        self._occupied[:] = False
+        self._free_rows = list(range(self.max_entries - 1, -1, -1))
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
@@ -0,0 +1,80 @@
+import math
+from typing import List, Tuple
+
+from langchain.docstore.document import Document
+
+# Shorter shared edges between chunks are more likely coincidence than overlap.
+MIN_OVERLAP_CHARS = 20
+
+
+class ContextPacker:
+    """Fits retrieved chunks into a prompt token budget.
+
+    Chunks are packed in the order the retriever ranked them, best first, so
+    packing never depends on the scale of their scores. Text that repeats an
+    already packed chunk through the splitter's overlap is trimmed. Chunks that
+    no longer fit are dropped. Packed chunks carry their score as
+    "relevance_score" metadata.
+    """
+
+    def __init__(self, max_tokens: int, chunk_overlap: int, chars_per_token: float):
+        self.max_tokens = max_tokens
+        self.chunk_overlap = chunk_overlap
+        self.chars_per_token = chars_per_token
+
+    def estimate_tokens(self, text: str) -> int:
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def pack(
+        self, documents_and_scores: List[Tuple[Document, float]]
+    ) -> List[Document]:
+        packed, used = [], 0
+        for document, score in documents_and_scores:
+            text = self._trim_overlap(document, packed)
+            if not text:
+                continue
+            tokens = self.estimate_tokens(text)
+            if used + tokens > self.max_tokens:
+                if packed:
+                    continue
+                # Never send an empty context; cut the best chunk down instead.
+                text = text[: int(self.max_tokens * self.chars_per_token)]
+                tokens = self.estimate_tokens(text)
+            packed.append(
+                Document(
+                    page_content=text,
+                    metadata={**document.metadata, "relevance_score": score},
+                )
+            )
+            used += tokens
+        return packed
+
+    @staticmethod
+    def format(documents: List[Document]) -> str:
+        return "\n\n".join(document.page_content for document in documents)
+
+    @staticmethod
+    def format_numbered(documents: List[Document]) -> str:
+        return "\n\n".join(
+            f"[{number}] {document.page_content}"
+            for number, document in enumerate(documents, start=1)
+        )
+
+    def _trim_overlap(self, document: Document, packed: List[Document]) -> str:
+        text = document.page_content.strip()
+        for other in packed:
+            if other.metadata.get("source") != document.metadata.get("source"):
+                continue
+            if text in other.page_content:
+                return ""
+            text = text[self._overlap(other.page_content, text) :]
+            text = text[: len(text) - self._overlap(text, other.page_content)]
+        return text.strip()
+
+    def _overlap(self, head: str, tail: str) -> int:
+        # Length of the longest end of `head` that `tail` starts with.
+        limit = min(len(head), len(tail), self.chunk_overlap)
+        for size in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+            if head.endswith(tail[:size]):
+                return size
+        return 0
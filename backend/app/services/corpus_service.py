@@ -0,0 +1,471 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.docstore.document import Document
+from langchain.embeddings.base import Embeddings
+from langchain.vectorstores import VectorStore
+
+from app.core.concurrency import ReadWriteLock
+from app.core.config import settings
+from app.core.logger import get_logger
+from app.models.corpus import DocumentRecord
+from app.models.ingestion import ProgressCallback
+from app.services.vector_store_service import VectorStoreService
+
+logger = get_logger()
+
+
+class CorpusService:
+    """A single vector index shared by every uploaded document, plus a registry of
+    which chunk ids belong to which document."""
+
+    def __init__(
+        self, vector_store_service: VectorStoreService, compact_after_deltas: int = 20
+    ):
+        self.vector_store_service = vector_store_service
+        self.compact_after_deltas = compact_after_deltas
+        self.vector_store: Optional[VectorStore] = None
+        self.documents: Dict[str, DocumentRecord] = {}
+        self.version: Optional[str] = None
+        # Readers (retrieval) share index_lock; writers also hold _mutation_lock
+        # for the whole add/delete/log so corpus versions are applied in order.
+        self.index_lock = ReadWriteLock()
+        self._mutation_lock = threading.Lock()
+        self._read_only = False
+        # Each change is logged as a delta; a snapshot of the whole index is
+        # only written, in the background, once enough deltas pile up.
+        self._snapshot_version: Optional[str] = None
+        self._snapshot_delta = 0
+        self._last_delta = 0
+        self._compacting = False
+        logger.info("CorpusService initialized")
+
+    @property
+    def num_chunks(self) -> int:
+        return sum(len(record.chunk_ids) for record in self.documents.values())
+
+    def load(self, embedding_model: Embeddings) -> bool:
+        with self._mutation_lock:
+            loaded = self.vector_store_service.load_latest_vector_store(
+                embedding_model, self.index_manifest()
+            )
+            vector_store, manifest = loaded or (None, {})
+            documents = {
+                record["document_id"]: DocumentRecord(**record)
+                for record in manifest.get("documents", [])
+            }
+            if (
+                vector_store is not None
+                and not documents
+                and vector_store.index_to_docstore_id
+            ):
+                # Indexes saved before the registry existed hold a single document.
+                legacy = DocumentRecord(
+                    document_id=f"legacy-{manifest['version']}",
+                    original_filename="(restored index)",
+                    file_path="",
+                    sha256="",
+                    chunk_ids=list(vector_store.index_to_docstore_id.values()),
+                    created_at=manifest.get("created_at", time.time()),
+                )
+                documents = {legacy.document_id: legacy}
+            with self.index_lock.write():
+                self.vector_store = vector_store
+                self.documents = documents
+                self.version = manifest.get("version")
+                self._read_only = manifest.get("mmapped", False)
+            self._snapshot_version = manifest.get("version")
+            self._snapshot_delta = self._last_delta = manifest.get(
+                "delta_sequence", 0
+            )
+            self._replay(embedding_model, snapshot_loaded=loaded is not None)
+            if self.vector_store is None:
+                return False
+            logger.info(
+                f"Corpus restored: {len(self.documents)} documents, "
+                f"{self.num_chunks} chunks, version {self.version}"
+            )
+        self._maybe_compact()
+        return True
+
+    def _replay(self, embedding_model: Embeddings, snapshot_loaded: bool):
+        replayed = 0
+        for sequence, delta in self.vector_store_service.load_deltas(
+            self._last_delta
+        ):
+            # A gap means the snapshot these deltas were logged against is gone.
+            if snapshot_loaded and sequence != self._last_delta + 1:
+                logger.warning(
+                    f"Index delta {self._last_delta + 1} is missing, "
+                    f"not replaying deltas from {sequence} on"
+                )
+                break
+            self._last_delta = sequence
+            mismatched = {
+                key: delta.get(key)
+                for key, value in self.index_manifest().items()
+                if delta.get(key) != value
+            }
+            if mismatched:
+                logger.warning(
+                    f"Skipping index delta {sequence}, built with {mismatched}"
+                )
+                continue
+            self._ensure_writable()
+            self._apply(delta, embedding_model)
+            replayed += 1
+        if replayed:
+            self.version = self._delta_version()
+            logger.info(f"Replayed {replayed} index deltas")
+
+    def add_document(
+        self,
+        original_filename: str,
+        file_path: str,
+        sha256: str,
+        chunks: List[Document],
+        embedding_model: Embeddings,
+        progress_callback: Optional[ProgressCallback] = None,
+    ) -> Tuple[DocumentRecord, Dict[str, int]]:
+        with self._mutation_lock:
+            result = self._add(
+                original_filename,
+                file_path,
+                sha256,
+                chunks,
+                embedding_model,
+                progress_callback,
+            )
+        self._maybe_compact()
+        return result
+
+    def update_document(
+        self,
+        document_id: str,
+        file_path: str,
+        sha256: str,
+        chunks: List[Document],
+        embedding_model: Embeddings,
+        progress_callback: Optional[ProgressCallback] = None,
+    ) -> Tuple[DocumentRecord, Dict[str, int]]:
+        with self._mutation_lock:
+            result = self._update(
+                self.documents[document_id],
+                file_path,
+                sha256,
+                chunks,
+                embedding_model,
+                progress_callback,
+            )
+        self._maybe_compact()
+        return result
+
+    def upsert_document(
+        self,
+        original_filename: str,
+        file_path: str,
+        sha256: str,
+        chunks: List[Document],
+        embedding_model: Embeddings,
+        progress_callback: Optional[ProgressCallback] = None,
+    ) -> Tuple[DocumentRecord, Dict[str, int]]:
+        """Updates the latest document uploaded under original_filename, or adds
+        it if there is none. The lookup and the change share the mutation lock,
+        so concurrent uploads of one file never create two documents."""
+        with self._mutation_lock:
+            existing = self.find_document_by_filename(original_filename)
+            if existing is None:
+                result = self._add(
+                    original_filename,
+                    file_path,
+                    sha256,
+                    chunks,
+                    embedding_model,
+                    progress_callback,
+                )
+            elif existing.sha256 == sha256:
+                logger.info(
+                    f"Document unchanged since last upload: {original_filename}"
+                )
+                result = existing, self.unchanged_stats(existing)
+            else:
+                logger.info(
+                    f"Re-ingesting new version of document {existing.document_id}"
+                )
+                result = self._update(
+                    existing,
+                    file_path,
+                    sha256,
+                    chunks,
+                    embedding_model,
+                    progress_callback,
+                )
+        self._maybe_compact()
+        return result
+
+    @staticmethod
+    def unchanged_stats(record: DocumentRecord) -> Dict[str, int]:
+        return {
+            "chunks_added": 0,
+            "chunks_reused": len(record.chunk_ids),
+            "chunks_removed": 0,
+        }
+
+    def _add(
+        self,
+        original_filename: str,
+        file_path: str,
+        sha256: str,
+        chunks: List[Document],
+        embedding_model: Embeddings,
+        progress_callback: Optional[ProgressCallback],
+    ) -> Tuple[DocumentRecord, Dict[str, int]]:
+        self._ensure_writable()
+        record = DocumentRecord(
+            document_id=uuid.uuid4().hex,
+            original_filename=original_filename,
+            file_path=file_path,
+            sha256=sha256,
+            chunk_ids=[uuid.uuid4().hex for _ in chunks],
+            chunk_hashes=[self._hash_chunk(chunk) for chunk in chunks],
+            created_at=time.time(),
+        )
+        embeddings = self.vector_store_service.embed_documents(
+            chunks, embedding_model, progress_callback
+        )
+        self._commit(
+            self._delta(record, added=(record.chunk_ids, chunks, embeddings)),
+            embedding_model,
+        )
+        logger.info(
+            f"Added document {record.document_id} ({len(chunks)} chunks) to corpus"
+        )
+        return record, {
+            "chunks_added": len(chunks),
+            "chunks_reused": 0,
+            "chunks_removed": 0,
+        }
+
+    def _update(
+        self,
+        previous: DocumentRecord,
+        file_path: str,
+        sha256: str,
+        chunks: List[Document],
+        embedding_model: Embeddings,
+        progress_callback: Optional[ProgressCallback],
+    ) -> Tuple[DocumentRecord, Dict[str, int]]:
+        self._ensure_writable()
+
+        # Match new chunks to old ones by content hash; each old chunk id can
+        # be reused once, so repeated passages are matched one-for-one.
+        reusable = defaultdict(list)
+        for chunk_id, chunk_hash in zip(previous.chunk_ids, previous.chunk_hashes):
+            reusable[chunk_hash].append(chunk_id)
+
+        chunk_ids, chunk_hashes = [], []
+        reused, added_chunks, added_ids = {}, [], []
+        for chunk in chunks:
+            chunk_hash = self._hash_chunk(chunk)
+            if reusable[chunk_hash]:
+                chunk_id = reusable[chunk_hash].pop()
+                reused[chunk_id] = chunk
+            else:
+                chunk_id = uuid.uuid4().hex
+                added_chunks.append(chunk)
+                added_ids.append(chunk_id)
+            chunk_ids.append(chunk_id)
+            chunk_hashes.append(chunk_hash)
+        stale_ids = [
+            chunk_id for chunk_id in previous.chunk_ids if chunk_id not in reused
+        ]
+
+        added_embeddings = []
+        if added_chunks:
+            added_embeddings = self.vector_store_service.embed_documents(
+                added_chunks, embedding_model, progress_callback
+            )
+        record = previous.model_copy(
+            update={
+                "file_path": file_path,
+                "sha256": sha256,
+                "chunk_ids": chunk_ids,
+                "chunk_hashes": chunk_hashes,
+                "updated_at": time.time(),
+            }
+        )
+        # Unchanged text may have moved page or file, so reused chunks are
+        # refreshed in the docstore.
+        self._commit(
+            self._delta(
+                record,
+                added=(added_ids, added_chunks, added_embeddings),
+                deleted_ids=stale_ids,
+                refreshed=reused,
+            ),
+            embedding_model,
+        )
+
+        stats = {
+            "chunks_added": len(added_chunks),
+            "chunks_reused": len(reused),
+            "chunks_removed": len(stale_ids),
+        }
+        logger.info(f"Updated document {previous.document_id} in corpus: {stats}")
+        return record, stats
+
+    def find_document_by_filename(
+        self, original_filename: str
+    ) -> Optional[DocumentRecord]:
+        with self.index_lock.read():
+            matches = [
+                record
+                for record in self.documents.values()
+                if record.original_filename == original_filename
+            ]
+        return max(matches, key=lambda record: record.created_at, default=None)
+
+    def delete_document(self, document_id: str) -> Optional[DocumentRecord]:
+        with self._mutation_lock:
+            record = self.documents.get(document_id)
+            if record is None:
+                return None
+            self._ensure_writable()
+            self._commit(
+                self._delta(record, deleted_ids=record.chunk_ids, removed=True),
+                self.vector_store.embedding_function,
+            )
+            logger.info(f"Deleted document {document_id} from corpus")
+        self._maybe_compact()
+        return record
+
+    def list_documents(self) -> List[DocumentRecord]:
+        return list(self.documents.values())
+
+    def is_empty(self) -> bool:
+        return self.vector_store is None or not self.documents
+
+    def index_manifest(self) -> Dict[str, Any]:
+        return {
+            "embedding_provider": settings.EMBEDDING.PROVIDER_TYPE,
+            "embedding_model": settings.EMBEDDING.NAME,
+        }
+
+    @staticmethod
+    def _hash_chunk(chunk: Document) -> str:
+        return hashlib.sha256(chunk.page_content.encode()).hexdigest()
+
+    def _ensure_writable(self):
+        if self._read_only and self.vector_store is not None:
+            logger.info("Copying memory-mapped index into memory before updating it")
+            with self.index_lock.write():
+                self.vector_store_service.make_writable(self.vector_store)
+            self._read_only = False
+
+    def _delta(
+        self,
+        record: DocumentRecord,
+        added: Tuple[List[str], List[Document], List[List[float]]] = ([], [], []),
+        deleted_ids: Optional[List[str]] = None,
+        refreshed: Optional[Dict[str, Document]] = None,
+        removed: bool = False,
+    ) -> Dict[str, Any]:
+        added_ids, added_chunks, added_embeddings = added
+        return {
+            **self.index_manifest(),
+            "document_id": record.document_id,
+            "record": None if removed else record.model_dump(),
+            "added_ids": added_ids,
+            "added_chunks": added_chunks,
+            "added_embeddings": np.asarray(added_embeddings, dtype=np.float32),
+            "deleted_ids": deleted_ids or [],
+            "refreshed": refreshed or {},
+        }
+
+    def _commit(self, delta: Dict[str, Any], embedding_model: Embeddings):
+        self._apply(delta, embedding_model)
+        self._last_delta = self.vector_store_service.append_delta(delta)
+        self.version = self._delta_version()
+
+    def _delta_version(self) -> str:
+        return f"{self._snapshot_version or 'empty'}+{self._last_delta}"
+
+    def _apply(self, delta: Dict[str, Any], embedding_model: Embeddings):
+        # Shared by live changes and startup replay, so both build the same index.
+        vector_store = self.vector_store
+        if delta["added_ids"]:
+            vector_store = self.vector_store_service.add_embeddings(
+                vector_store,
+                delta["added_chunks"],
+                delta["added_embeddings"],
+                delta["added_ids"],
+                embedding_model,
+                write_lock=self.index_lock,
+            )
+        if vector_store is not None:
+            self.vector_store_service.delete_documents(
+                vector_store, delta["deleted_ids"], write_lock=self.index_lock
+            )
+        with self.index_lock.write():
+            self.vector_store = vector_store
+            if delta["refreshed"]:
+                vector_store.docstore.delete(list(delta["refreshed"]))
+                vector_store.docstore.add(delta["refreshed"])
+            if delta["record"] is None:
+                self.documents.pop(delta["document_id"], None)
+            else:
+                self.documents[delta["document_id"]] = DocumentRecord(
+                    **delta["record"]
+                )
+
+    def _maybe_compact(self):
+        with self._mutation_lock:
+            if (
+                self._compacting
+                or self._last_delta - self._snapshot_delta < self.compact_after_deltas
+            ):
+                return
+            self._compacting = True
+        threading.Thread(
+            target=self._compact, name="corpus-compaction", daemon=True
+        ).start()
+
+    def compact(self):
+        """Writes a snapshot of the whole corpus, folding in every logged delta."""
+        with self._mutation_lock:
+            if self.vector_store is None or self._last_delta == self._snapshot_delta:
+                return
+            # Copying in memory is quick; the slow write happens off the lock.
+            vector_store = self.vector_store_service.copy_vector_store(
+                self.vector_store
+            )
+            delta_sequence = self._last_delta
+            manifest = {
+                **self.index_manifest(),
+                "documents": [
+                    record.model_dump() for record in self.documents.values()
+                ],
+                "delta_sequence": delta_sequence,
+            }
+        version = self.vector_store_service.save_vector_store(vector_store, manifest)
+        with self._mutation_lock:
+            self._snapshot_version = version
+            self._snapshot_delta = delta_sequence
+        logger.info(
+            f"Folded index deltas up to {delta_sequence} into version {version}"
+        )
+
+    def _compact(self):
+        try:
+            self.compact()
+        except Exception as e:
+            logger.exception(f"Failed to compact the corpus index: {str(e)}")
+        finally:
+            self._compacting = False
+        # Deltas logged while the snapshot was written may call for another.
+        self._maybe_compact()
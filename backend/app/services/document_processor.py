@@ -1,26 +1,116 @@
+import multiprocessing
 from abc import ABC, abstractmethod
-from typing import List
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Optional, Tuple
 
 from langchain.docstore.document import Document
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from pypdf import PdfReader
+
+from app.models.ingestion import ProgressCallback
 
 
 class DocumentProcessor(ABC):
     @abstractmethod
-    def process(self, file_path: str) -> List[Document]:
+    def process(
+        self, file_path: str, progress_callback: Optional[ProgressCallback] = None
+    ) -> List[Document]:
         pass
 
 
+def _process_page_range(
+    file_path: str, start: int, end: int, chunk_size: int, chunk_overlap: int
+) -> Tuple[int, int, List[Document]]:
+    # Runs in a worker process: extract and split pages [start, end) on their own.
+    reader = PdfReader(file_path)
+    pages = [
+        Document(
+            page_content=reader.pages[page_number].extract_text(),
+            metadata={"source": file_path, "page": page_number},
+        )
+        for page_number in range(start, end)
+    ]
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size, chunk_overlap=chunk_overlap
+    )
+    return start, end - start, splitter.split_documents(pages)
+
+
 class PDFProcessor(DocumentProcessor):
-    def __init__(self, chunk_size: int = 1500, chunk_overlap: int = 100):
+    def __init__(
+        self,
+        chunk_size: int = 1500,
+        chunk_overlap: int = 100,
+        max_workers: int = 1,
+        pages_per_task: int = 50,
+        parallel_min_pages: int = 100,
+    ):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.max_workers = max_workers
+        self.pages_per_task = pages_per_task
+        self.parallel_min_pages = parallel_min_pages
 
-    def process(self, file_path: str) -> List[Document]:
+    def process(
+        self, file_path: str, progress_callback: Optional[ProgressCallback] = None
+    ) -> List[Document]:
+        if self.max_workers > 1:
+            page_count = len(PdfReader(file_path).pages)
+            if page_count >= self.parallel_min_pages:
+                return self.process_parallel(file_path, page_count, progress_callback)
+        return self.process_serial(file_path, progress_callback)
+
+    def process_serial(
+        self, file_path: str, progress_callback: Optional[ProgressCallback] = None
+    ) -> List[Document]:
         loader = PyPDFLoader(file_path)
-        pages = loader.load()
+        pages = []
+        for page in loader.lazy_load():
+            pages.append(page)
+            if progress_callback:
+                progress_callback("parsing", len(pages), None)
         splitter = RecursiveCharacterTextSplitter(
             chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap
         )
         return splitter.split_documents(pages)
+
+    def process_parallel(
+        self,
+        file_path: str,
+        page_count: int,
+        progress_callback: Optional[ProgressCallback] = None,
+    ) -> List[Document]:
+        page_ranges = [
+            (start, min(start + self.pages_per_task, page_count))
+            for start in range(0, page_count, self.pages_per_task)
+        ]
+        chunks_by_range = {}
+        pages_parsed = 0
+        # Ingestion runs on a thread of a multithreaded server; forking it could
+        # copy locks held by other threads into the workers, so spawn them.
+        with ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as executor:
+            futures = [
+                executor.submit(
+                    _process_page_range,
+                    file_path,
+                    start,
+                    end,
+                    self.chunk_size,
+                    self.chunk_overlap,
+                )
+                for start, end in page_ranges
+            ]
+            for future in as_completed(futures):
+                start, parsed, chunks = future.result()
+                chunks_by_range[start] = chunks
+                pages_parsed += parsed
+                if progress_callback:
+                    progress_callback("parsing", pages_parsed, page_count)
+
+        return [
+            chunk for start, _ in page_ranges for chunk in chunks_by_range[start]
+        ]
@@ -1,30 +1,88 @@
 import os
+from typing import Any, Dict, Optional
 
+from app.core.config import settings
 from app.core.logger import get_logger
 from app.factories.embedding_factory import get_embedding_model
+from app.models.corpus import DocumentRecord
+from app.models.ingestion import ProgressCallback
+from app.services.corpus_service import CorpusService
 from app.services.document_processor import DocumentProcessor, PDFProcessor
-from app.services.vector_store_service import VectorStoreService
-from langchain.vectorstores import VectorStore
+from app.services.embedding_cache import CachedEmbeddings, EmbeddingCache
 
 logger = get_logger()
 
 
 class DocumentService:
-    def __init__(self, vector_store_service: VectorStoreService):
-        self.vector_store_service = vector_store_service
+    def __init__(
+        self,
+        corpus_service: CorpusService,
+        embedding_cache: Optional[EmbeddingCache] = None,
+    ):
+        self.corpus_service = corpus_service
+        self.embedding_cache = embedding_cache
         logger.info("DocumentService initialized")
 
-    def process_document(self, file_path: str) -> VectorStore:
+    def process_document(
+        self,
+        file_path: str,
+        original_filename: str,
+        sha256: str,
+        progress_callback: Optional[ProgressCallback] = None,
+    ) -> Dict[str, Any]:
         logger.info(f"Processing document: {file_path}")
+        # Skip parsing a file already ingested; upsert_document checks again
+        # under the corpus lock in case another upload got there first.
+        existing = self.corpus_service.find_document_by_filename(original_filename)
+        if existing is not None and existing.sha256 == sha256:
+            logger.info(f"Document unchanged since last upload: {original_filename}")
+            return self._stats(existing, CorpusService.unchanged_stats(existing))
+
         processor = self._get_document_processor(file_path)
-        documents = processor.process(file_path)
-        logger.info("Document processed, creating vector store")
+        documents = processor.process(file_path, progress_callback)
+        logger.info(f"Document processed into {len(documents)} chunks")
+        embedding_model = self._get_embedding_model()
+        record, chunk_stats = self.corpus_service.upsert_document(
+            original_filename,
+            file_path,
+            sha256,
+            documents,
+            embedding_model,
+            progress_callback,
+        )
+        stats = self._stats(record, chunk_stats)
+        if isinstance(embedding_model, CachedEmbeddings):
+            stats.update(embedding_model.stats())
+            logger.info(
+                f"Embedding cache hits: {stats['cache_hits']}, misses: {stats['cache_misses']}"
+            )
+        logger.info("Document added to corpus successfully")
+        return stats
+
+    def _stats(
+        self, record: DocumentRecord, chunk_stats: Dict[str, int]
+    ) -> Dict[str, Any]:
+        return {
+            "document_id": record.document_id,
+            "chunks": len(record.chunk_ids),
+            **chunk_stats,
+            "corpus_chunks": self.corpus_service.num_chunks,
+            "index_version": self.corpus_service.version,
+        }
+
+    def load_corpus(self) -> bool:
+        return self.corpus_service.load(get_embedding_model())
+
+    def _get_embedding_model(self):
         embedding_model = get_embedding_model()
-        vector_store = self.vector_store_service.create_vector_store(
-            documents, embedding_model
+        if self.embedding_cache is None:
+            return embedding_model
+        return CachedEmbeddings(
+            embedding_model,
+            self.embedding_cache,
+            provider=settings.EMBEDDING.PROVIDER_TYPE,
+            model_name=settings.EMBEDDING.NAME,
         )
-        logger.info("Vector store created successfully")
-        return vector_store
 
     def _get_document_processor(self, file_path: str) -> DocumentProcessor:
         _, file_extension = os.path.splitext(file_path)
@@ -34,4 +92,10 @@ class DocumentService:
         processor_class = processors.get(file_extension.lower())
         if not processor_class:
             raise ValueError(f"Unsupported file type: {file_extension}")
-        return processor_class()
+        return processor_class(
+            chunk_size=settings.DOCUMENT_PROCESSING.CHUNK_SIZE,
+            chunk_overlap=settings.DOCUMENT_PROCESSING.CHUNK_OVERLAP,
+            max_workers=settings.DOCUMENT_PROCESSING.MAX_WORKERS,
+            pages_per_task=settings.DOCUMENT_PROCESSING.PAGES_PER_TASK,
+            parallel_min_pages=settings.DOCUMENT_PROCESSING.PARALLEL_MIN_PAGES,
+        )
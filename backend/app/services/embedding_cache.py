@@ -0,0 +1,157 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+from app.core.logger import get_logger
+
+logger = get_logger()
+
+
+class EmbeddingCache:
+    """SQLite store of float32 embedding vectors keyed on provider, model and text hash."""
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                provider TEXT NOT NULL,
+                model_name TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (provider, model_name, text_hash)
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_embeddings_last_used ON embeddings (last_used)"
+        )
+        self._conn.commit()
+        logger.info(f"Embedding cache opened at {path}")
+
+    @staticmethod
+    def hash_text(text: str) -> str:
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def get_many(
+        self, provider: str, model_name: str, text_hashes: List[str]
+    ) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit.
+            for start in range(0, len(text_hashes), 500):
+                chunk = text_hashes[start : start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE provider = ? AND model_name = ? AND text_hash IN ({placeholders})",
+                    [provider, model_name, *chunk],
+                ).fetchall()
+                for text_hash, vector in rows:
+                    found[text_hash] = np.frombuffer(vector, dtype=np.float32).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? "
+                    "WHERE provider = ? AND model_name = ? AND text_hash = ?",
+                    [(now, provider, model_name, text_hash) for text_hash in found],
+                )
+                self._conn.commit()
+        return found
+
+    def put_many(
+        self, provider: str, model_name: str, items: Dict[str, List[float]]
+    ):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings "
+                "(provider, model_name, text_hash, vector, last_used) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (
+                        provider,
+                        model_name,
+                        text_hash,
+                        np.asarray(vector, dtype=np.float32).tobytes(),
+                        now,
+                    )
+                    for text_hash, vector in items.items()
+                ],
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE (provider, model_name, text_hash) IN ("
+                "SELECT provider, model_name, text_hash FROM embeddings "
+                "ORDER BY last_used LIMIT ?)",
+                (overflow,),
+            )
+            logger.info(f"Evicted {overflow} entries from the embedding cache")
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an embedding model so only cache misses reach the provider."""
+
+    def __init__(
+        self,
+        embedding_model: Embeddings,
+        cache: EmbeddingCache,
+        provider: str,
+        model_name: str,
+    ):
+        self.embedding_model = embedding_model
+        self.cache = cache
+        self.provider = provider
+        self.model_name = model_name
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        text_hashes = [EmbeddingCache.hash_text(text) for text in texts]
+        cached = self.cache.get_many(self.provider, self.model_name, text_hashes)
+
+        missing = {}
+        for text_hash, text in zip(text_hashes, texts):
+            if text_hash not in cached:
+                missing.setdefault(text_hash, text)
+        if missing:
+            vectors = self.embedding_model.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(self.provider, self.model_name, computed)
+            cached.update(computed)
+
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        return [cached[text_hash] for text_hash in text_hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embedding_model.embed_query(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        # The cache holds document vectors; queries skip it.
+        return self.embedding_model.embed_queries(texts)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"cache_hits": self.hits, "cache_misses": self.misses}
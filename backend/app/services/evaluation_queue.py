@@ -0,0 +1,397 @@
+import asyncio
+import json
+import threading
+import time
+import uuid
+from contextlib import suppress
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.core.logger import get_logger
+from app.models.evaluation import EvaluationJob, EvaluationJobState, EvaluationRecord
+from app.models.qa import Answer
+from app.services.evaluation_sampler import EvaluationSampler
+from app.services.evaluation_service import EvaluationService
+
+logger = get_logger()
+
+
+class EvaluationQueue:
+    """Answers awaiting evaluation, kept in the database and judged by workers.
+
+    Only answers chosen by the sampler are queued, and an answer already
+    evaluated or queued with the same question, text and sources is skipped.
+    Each worker claims up to batch_size due jobs, judges them together and
+    stores the results and job updates in one transaction, using its own
+    short-lived sessions. A failed judgement is retried after
+    retry_backoff_seconds, doubling per attempt, and kept as FAILED after
+    max_attempts. A claim is a lease, renewed while its batch is judged;
+    jobs whose lease lapses because their process died are claimed again by
+    any worker, and a clean stop releases its claims at once.
+    """
+
+    def __init__(
+        self,
+        evaluation_service: EvaluationService,
+        sampler: EvaluationSampler,
+        session_factory: Callable[[], Session],
+        workers: int,
+        batch_size: int,
+        max_attempts: int,
+        retry_backoff_seconds: float,
+        poll_seconds: float,
+        lease_seconds: float,
+    ):
+        self.evaluation_service = evaluation_service
+        self.sampler = sampler
+        self.session_factory = session_factory
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self._claims: Set[str] = set()
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        # Counters updated from threadpool threads.
+        self._stats_lock = threading.Lock()
+        self.sampled = 0
+        self.unsampled = 0
+        self.duplicates = 0
+        self.completed = 0
+        self.retried = 0
+
+    async def enqueue(self, items: List[Tuple[str, Answer]], sample: bool = True):
+        """Queue answers for evaluation; sample=False queues every answer."""
+        weighted = []
+        for question, answer in items:
+            weight = self.sampler.sample(answer) if sample else 1.0
+            if weight is None:
+                self.unsampled += 1
+            else:
+                weighted.append((question, answer, weight))
+        if not weighted:
+            return
+        # Evaluation is best effort; a queueing error never fails the answer.
+        try:
+            await run_in_threadpool(self._insert, weighted)
+        except Exception as e:
+            logger.exception(f"Failed to queue {len(weighted)} evaluations: {str(e)}")
+            return
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self):
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._work()) for _ in range(self.workers)
+        ]
+        logger.info(f"Evaluation queue started with {self.workers} workers")
+
+    async def stop(self):
+        claims = list(self._claims)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._wakeup = None
+        # Hand back the batches cancelled mid-judgement rather than leaving
+        # them until their lease lapses.
+        if claims:
+            released = await run_in_threadpool(self._release, claims)
+            logger.info(f"Released {released} claimed evaluations on shutdown")
+
+    def stats(self) -> Dict[str, int]:
+        with self.session_factory() as db:
+            counts = dict(
+                db.query(EvaluationJob.state, func.count())
+                .group_by(EvaluationJob.state)
+                .all()
+            )
+        stats = {
+            state.value.lower(): counts.get(state.value, 0)
+            for state in EvaluationJobState
+        }
+        stats.update(
+            sampled=self.sampled,
+            unsampled=self.unsampled,
+            duplicates=self.duplicates,
+            completed=self.completed,
+            retried=self.retried,
+        )
+        return stats
+
+    async def _work(self):
+        while True:
+            # Cleared before claiming, so a job queued during the claim still
+            # wakes this worker.
+            self._wakeup.clear()
+            try:
+                jobs = await run_in_threadpool(self._claim)
+            except Exception as e:
+                logger.exception(f"Failed to claim evaluations: {str(e)}")
+                jobs = []
+            if jobs:
+                claim = jobs[0].claim
+                self._claims.add(claim)
+                try:
+                    await self._process(jobs)
+                except Exception as e:
+                    # Left RUNNING; claimed again once the lease lapses.
+                    logger.exception(f"Failed to finish evaluations: {str(e)}")
+                finally:
+                    self._claims.discard(claim)
+                continue
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+
+    async def _process(self, jobs: List[EvaluationJob]):
+        heartbeat = asyncio.create_task(self._renew_lease(jobs[0].claim))
+        try:
+            results = await self.evaluation_service.evaluate_batch(jobs)
+        finally:
+            heartbeat.cancel()
+        try:
+            await run_in_threadpool(self._finish, jobs, results)
+        except Exception as e:
+            # Count a batch that could not be stored as a failed attempt.
+            logger.exception(f"Failed to store evaluations: {str(e)}")
+            await run_in_threadpool(self._finish, jobs, [e] * len(jobs))
+
+    def _insert(self, items: List[Tuple[str, Answer, float]]):
+        now = time.time()
+        keyed = [
+            (
+                (
+                    EvaluationRecord.create_id(question),
+                    EvaluationRecord.create_content_hash(answer.answer, answer.sources),
+                ),
+                question,
+                answer,
+                weight,
+            )
+            for question, answer, weight in items
+        ]
+        with self.session_factory() as db:
+            known = self._known(db, [key for key, _, _, _ in keyed])
+            jobs = []
+            for key, question, answer, weight in keyed:
+                if key in known:
+                    continue
+                known.add(key)
+                jobs.append(
+                    EvaluationJob(
+                        question=question,
+                        answer=answer.answer,
+                        sources=json.dumps(answer.sources),
+                        document_ids=json.dumps(answer.document_ids),
+                        content_hash=key[1],
+                        sample_weight=weight,
+                        state=EvaluationJobState.PENDING.value,
+                        attempts=0,
+                        available_at=now,
+                        created_at=now,
+                    )
+                )
+            db.add_all(jobs)
+            db.commit()
+        with self._stats_lock:
+            self.sampled += len(jobs)
+            self.duplicates += len(keyed) - len(jobs)
+
+    @staticmethod
+    def _known(db: Session, keys: List[Tuple[str, str]]) -> Set[Tuple[str, str]]:
+        # (record id, content hash) pairs already evaluated or waiting to be.
+        evaluated = db.query(EvaluationRecord.id, EvaluationRecord.content_hash).filter(
+            EvaluationRecord.id.in_({record_id for record_id, _ in keys})
+        )
+        queued = db.query(EvaluationJob.question, EvaluationJob.content_hash).filter(
+            EvaluationJob.content_hash.in_({content_hash for _, content_hash in keys}),
+            EvaluationJob.state != EvaluationJobState.FAILED.value,
+        )
+        known = {tuple(row) for row in evaluated}
+        known.update(
+            (EvaluationRecord.create_id(question), content_hash)
+            for question, content_hash in queued
+        )
+        return known
+
+    async def _renew_lease(self, claim: str):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await run_in_threadpool(self._renew, claim)
+            except Exception as e:
+                logger.exception(f"Failed to renew evaluation lease: {str(e)}")
+
+    def _renew(self, claim: str):
+        with self.session_factory() as db:
+            db.query(EvaluationJob).filter(
+                EvaluationJob.claim == claim,
+                EvaluationJob.state == EvaluationJobState.RUNNING.value,
+            ).update({EvaluationJob.claimed_at: time.time()}, synchronize_session=False)
+            db.commit()
+
+    def _release(self, claims: List[str]) -> int:
+        with self.session_factory() as db:
+            released = (
+                db.query(EvaluationJob)
+                .filter(
+                    EvaluationJob.claim.in_(claims),
+                    EvaluationJob.state == EvaluationJobState.RUNNING.value,
+                )
+                .update(
+                    {
+                        EvaluationJob.state: EvaluationJobState.PENDING.value,
+                        EvaluationJob.claim: None,
+                        EvaluationJob.claimed_at: None,
+                    },
+                    synchronize_session=False,
+                )
+            )
+            db.commit()
+        return released
+
+    def _reclaim_expired(self, db: Session, now: float):
+        # Claims not renewed within the lease belong to a process that died;
+        # claims held by live workers, here or in other processes, are kept.
+        reclaimed = (
+            db.query(EvaluationJob)
+            .filter(
+                EvaluationJob.state == EvaluationJobState.RUNNING.value,
+                or_(
+                    EvaluationJob.claimed_at.is_(None),
+                    EvaluationJob.claimed_at < now - self.lease_seconds,
+                ),
+            )
+            .update(
+                {
+                    EvaluationJob.state: EvaluationJobState.PENDING.value,
+                    EvaluationJob.claim: None,
+                    EvaluationJob.claimed_at: None,
+                },
+                synchronize_session=False,
+            )
+        )
+        if reclaimed:
+            logger.warning(f"Requeued {reclaimed} evaluations whose lease lapsed")
+
+    def _claim(self) -> List[EvaluationJob]:
+        # A single UPDATE marks the batch as ours, so concurrent workers never
+        # claim the same job.
+        claim = uuid.uuid4().hex
+        now = time.time()
+        with self.session_factory() as db:
+            self._reclaim_expired(db, now)
+            due = (
+                db.query(EvaluationJob.id)
+                .filter(
+                    EvaluationJob.state == EvaluationJobState.PENDING.value,
+                    EvaluationJob.available_at <= now,
+                )
+                .order_by(EvaluationJob.id)
+                .limit(self.batch_size)
+            )
+            claimed = (
+                db.query(EvaluationJob)
+                .filter(
+                    EvaluationJob.id.in_(due.scalar_subquery()),
+                    EvaluationJob.state == EvaluationJobState.PENDING.value,
+                )
+                .update(
+                    {
+                        EvaluationJob.state: EvaluationJobState.RUNNING.value,
+                        EvaluationJob.claim: claim,
+                        EvaluationJob.claimed_at: now,
+                    },
+                    synchronize_session=False,
+                )
+            )
+            db.commit()
+            if not claimed:
+                return []
+            return db.query(EvaluationJob).filter(EvaluationJob.claim == claim).all()
+
+    def _finish(self, jobs: List[EvaluationJob], results: List):
+        claim = jobs[0].claim
+        now = time.time()
+        with self.session_factory() as db:
+            # A batch whose lease lapsed may have been claimed again; leave
+            # those jobs to whoever holds them now.
+            held = {
+                job_id
+                for (job_id,) in db.query(EvaluationJob.id).filter(
+                    EvaluationJob.claim == claim
+                )
+            }
+            if len(held) < len(jobs):
+                logger.warning(
+                    f"Dropping {len(jobs) - len(held)} evaluations whose lease lapsed"
+                )
+            outcomes = [
+                (job, result) for job, result in zip(jobs, results) if job.id in held
+            ]
+            succeeded = [
+                (job, result)
+                for job, result in outcomes
+                if not isinstance(result, BaseException)
+            ]
+            failed = [
+                (job, result)
+                for job, result in outcomes
+                if isinstance(result, BaseException)
+            ]
+            self.evaluation_service.store_evaluations(
+                db,
+                [job for job, _ in succeeded],
+                [result for _, result in succeeded],
+            )
+            if succeeded:
+                db.query(EvaluationJob).filter(
+                    EvaluationJob.id.in_([job.id for job, _ in succeeded]),
+                    EvaluationJob.claim == claim,
+                ).delete(synchronize_session=False)
+            for job, error in failed:
+                attempts = job.attempts + 1
+                db.query(EvaluationJob).filter(
+                    EvaluationJob.id == job.id, EvaluationJob.claim == claim
+                ).update(
+                    {
+                        EvaluationJob.state: (
+                            EvaluationJobState.FAILED.value
+                            if attempts >= self.max_attempts
+                            else EvaluationJobState.PENDING.value
+                        ),
+                        EvaluationJob.attempts: attempts,
+                        EvaluationJob.available_at: now
+                        + self.retry_backoff_seconds * 2 ** (attempts - 1),
+                        EvaluationJob.claim: None,
+                        EvaluationJob.claimed_at: None,
+                        EvaluationJob.last_error: repr(error),
+                    },
+                    synchronize_session=False,
+                )
+            db.commit()
+
+        with self._stats_lock:
+            self.completed += len(succeeded)
+            self.retried += sum(
+                job.attempts + 1 < self.max_attempts for job, _ in failed
+            )
+        for job, error in failed:
+            if job.attempts + 1 < self.max_attempts:
+                logger.warning(
+                    f"Evaluation of question: {job.question} failed, "
+                    f"will retry: {error!r}"
+                )
+            else:
+                logger.error(
+                    f"Giving up on evaluation of question: {job.question} "
+                    f"after {self.max_attempts} attempts: {error!r}"
+                )
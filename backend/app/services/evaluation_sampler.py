@@ -0,0 +1,65 @@
+import random
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from app.models.qa import Answer
+
+# Recent answers needed before any answer is judged low-confidence.
+MIN_CONFIDENCE_HISTORY = 100
+
+
+class EvaluationSampler:
+    """Picks which answers are sent to the judge LLM.
+
+    An answer is sampled at sample_rate, or at the highest rate set for any
+    document it drew on. Answers whose confidence ranks in the lowest
+    low_confidence_quantile of the last confidence_window answers are always
+    evaluated; ranking keeps this independent of how widely cosine similarities
+    spread for a given embedding model and corpus. A sampled
+    answer is weighted by one over its chance of being sampled, so weighted
+    metrics estimate all answered traffic.
+    """
+
+    def __init__(
+        self,
+        sample_rate: float,
+        document_sample_rates: Dict[str, float],
+        low_confidence_quantile: float,
+        confidence_window: int = 1000,
+    ):
+        self.sample_rate = sample_rate
+        self.document_sample_rates = document_sample_rates
+        self.low_confidence_quantile = low_confidence_quantile
+        self._confidences: Deque[float] = deque(maxlen=confidence_window)
+        self._random = random.Random()
+
+    def probability(self, answer: Answer) -> float:
+        if self._is_low_confidence(answer.confidence):
+            return 1.0
+        rates = [
+            self.document_sample_rates[document_id]
+            for document_id in answer.document_ids
+            if document_id in self.document_sample_rates
+        ]
+        return min(1.0, max(rates, default=self.sample_rate))
+
+    def sample(self, answer: Answer) -> Optional[float]:
+        """The sample weight if the answer should be evaluated, else None."""
+        probability = self.probability(answer)
+        if answer.confidence is not None:
+            self._confidences.append(answer.confidence)
+        if probability <= 0 or self._random.random() >= probability:
+            return None
+        return 1.0 / probability
+
+    def _is_low_confidence(self, confidence: Optional[float]) -> bool:
+        if (
+            confidence is None
+            or self.low_confidence_quantile <= 0
+            or len(self._confidences) < MIN_CONFIDENCE_HISTORY
+        ):
+            return False
+        # Equal scores count as at or below this one, so a run of identical
+        # scores never forces every answer into evaluation.
+        at_or_below = sum(1 for recent in self._confidences if recent <= confidence)
+        return at_or_below <= self.low_confidence_quantile * len(self._confidences)
@@ -1,23 +1,47 @@
+import asyncio
 import json
+import math
+import time
+from contextlib import nullcontext
 from operator import itemgetter
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple, Union
 
 from app.core.logger import get_logger
 from app.factories.llm_factory import get_llm
-from app.models.evaluation import EvaluationRecord
-from app.models.qa import Answer, EvaluationResult
+from app.models.evaluation import EvaluationDocument, EvaluationJob, EvaluationRecord
+from app.models.qa import BatchEvaluationResult, EvaluationResult, Relevance
+from app.services.llm_scheduler import EVALUATION, LLMScheduler
 from langchain.prompts import PromptTemplate
-from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy import func, insert
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
 
 logger = get_logger()
 
+# Reciprocal-rank credit per judged relevance, as used for MRR.
+RELEVANCE_SCORES = {
+    Relevance.RELEVANT.value: 1.0,
+    Relevance.PARTLY_RELEVANT.value: 0.5,
+    Relevance.NON_RELEVANT.value: 0.0,
+}
+
+# Normal quantile for the 95% confidence intervals reported with metrics.
+CONFIDENCE_Z = 1.96
+
+# Dialects with INSERT ... ON CONFLICT DO UPDATE; others fall back to merge().
+UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
 
 class EvaluationService:
-    def __init__(self):
+    def __init__(self, llm_scheduler: Optional[LLMScheduler] = None):
+        self.llm_scheduler = llm_scheduler
         self.llm = get_llm()
         self.prompt = self._create_evaluation_prompt()
         self.chain = self._create_evaluation_chain()
+        self.batch_prompt = self._create_batch_evaluation_prompt()
+        self.batch_chain = self.batch_prompt | self.llm.with_structured_output(
+            BatchEvaluationResult
+        )
 
     def _create_evaluation_prompt(self):
         template = """
@@ -42,6 +66,36 @@ class EvaluationService:
             template=template, input_variables=["question", "answer", "sources"]
         )
 
+    def _create_batch_evaluation_prompt(self):
+        template = """
+        You are an expert evaluator for a RAG system.
+        Your task is to analyze the relevance of each generated answer to its question.
+        Based on the relevance of each generated answer, you will classify it
+        as "NON_RELEVANT", "PARTLY_RELEVANT", or "RELEVANT".
+
+        Here are the numbered items for evaluation:
+
+        {items}
+
+        Please analyze each item on its own, judging the generated answer in relation
+        to its question and sources, and provide one evaluation per item as follows:
+
+        Item: [the item number]
+        Relevance: [NON_RELEVANT | PARTLY_RELEVANT | RELEVANT]
+        Explanation: [Provide a brief explanation for your evaluation]
+        """
+        return PromptTemplate(template=template, input_variables=["items"])
+
+    @staticmethod
+    def _format_items(jobs: List[EvaluationJob]) -> str:
+        return "\n\n".join(
+            f"Item {number}\n"
+            f"Question: {job.question}\n"
+            f"Generated Answer: {job.answer}\n"
+            f"Question Relevance Sources: {json.loads(job.sources)}"
+            for number, job in enumerate(jobs, start=1)
+        )
+
     def _create_evaluation_chain(self):
         return (
             {
@@ -57,9 +111,58 @@ class EvaluationService:
         self, question: str, answer: str, sources: List[str]
     ) -> EvaluationResult:
         logger.info(f"Evaluating answer for question: {question}")
-        return self.chain.invoke(
-            {"question": question, "answer": answer, "sources": sources}
+        async with self._llm_slot():
+            return await self.chain.ainvoke(
+                {"question": question, "answer": answer, "sources": sources}
+            )
+
+    async def evaluate_batch(
+        self, jobs: List[EvaluationJob]
+    ) -> List[Union[EvaluationResult, Exception]]:
+        # One judge prompt for the whole batch, its verdicts keyed by item
+        # number. Items the reply leaves out, or every item when it cannot be
+        # parsed, are judged one by one instead. A failed judgement is
+        # returned, not raised.
+        verdicts: Dict[int, EvaluationResult] = {}
+        if len(jobs) > 1:
+            logger.info(f"Evaluating a batch of {len(jobs)} answers")
+            try:
+                async with self._llm_slot():
+                    result = await self.batch_chain.ainvoke(
+                        {"items": self._format_items(jobs)}
+                    )
+                verdicts = {
+                    evaluation.item - 1: EvaluationResult(
+                        relevance=evaluation.relevance,
+                        explanation=evaluation.explanation,
+                    )
+                    for evaluation in result.evaluations
+                }
+            except Exception as e:
+                logger.warning(f"Batch evaluation failed, judging singly: {str(e)}")
+        missing = [
+            position for position in range(len(jobs)) if position not in verdicts
+        ]
+        if missing and len(jobs) > 1:
+            logger.warning(f"Batch evaluation left out {len(missing)} answers")
+        results = await asyncio.gather(
+            *(
+                self.evaluate_answer(
+                    jobs[position].question,
+                    jobs[position].answer,
+                    json.loads(jobs[position].sources),
+                )
+                for position in missing
+            ),
+            return_exceptions=True,
         )
+        verdicts.update(zip(missing, results))
+        return [verdicts[position] for position in range(len(jobs))]
+
+    def _llm_slot(self):
+        if self.llm_scheduler is None:
+            return nullcontext()
+        return self.llm_scheduler.slot(EVALUATION)
 
     def calculate_mrr(self, relevance_list: List[bool]) -> float:
         for i, relevant in enumerate(relevance_list):
@@ -67,51 +170,163 @@ class EvaluationService:
                 return 1.0 / (i + 1)
         return 0.0
 
-    @staticmethod
-    def _format_sources(sources: List[Dict]) -> str:
-        formatted_sources = {str(i + 1): source for i, source in enumerate(sources)}
-        return json.dumps(formatted_sources)
+    def get_metrics(
+        self,
+        db: Session,
+        window_seconds: Optional[float] = None,
+        document_id: Optional[str] = None,
+    ) -> Dict[str, float]:
+        # One grouped aggregate over the relevance indexes; no row text is
+        # loaded. Sampled evaluations count by their sample weight.
+        weight = func.coalesce(EvaluationRecord.sample_weight, 1.0)
+        query = db.query(
+            EvaluationRecord.relevance,
+            func.count(),
+            func.sum(weight),
+            func.sum(weight * weight),
+        ).group_by(EvaluationRecord.relevance)
+        if window_seconds is not None:
+            query = query.filter(
+                EvaluationRecord.evaluated_at >= time.time() - window_seconds
+            )
+        if document_id is not None:
+            query = query.join(
+                EvaluationDocument,
+                EvaluationDocument.evaluation_id == EvaluationRecord.id,
+            ).filter(EvaluationDocument.document_id == document_id)
+        groups = {
+            relevance: (count, weights, squared_weights)
+            for relevance, count, weights, squared_weights in query.all()
+        }
 
-    async def evaluate_and_store(self, question: str, answer: Answer, db: Session):
-        try:
-            evaluation = await self.evaluate_answer(
-                question, answer.answer, answer.sources
+        metrics = {
+            relevance.value.lower(): groups.get(relevance.value, (0, 0, 0))[0]
+            for relevance in Relevance
+        }
+        total = sum(count for count, _, _ in groups.values())
+        total_weight = sum(weights for _, weights, _ in groups.values())
+        if not total:
+            return {
+                **metrics,
+                "evaluations": 0,
+                "effective_evaluations": 0.0,
+                "hit_rate": 0.0,
+                "hit_rate_ci_low": 0.0,
+                "hit_rate_ci_high": 0.0,
+                "mrr": 0.0,
+                "mrr_ci_low": 0.0,
+                "mrr_ci_high": 0.0,
+            }
+
+        # Kish effective sample size of the weighted evaluations.
+        effective = total_weight**2 / sum(squared for _, _, squared in groups.values())
+        hit_rate = groups.get(Relevance.RELEVANT.value, (0, 0, 0))[1] / total_weight
+        scores = {
+            relevance: RELEVANCE_SCORES.get(relevance, 0.0) for relevance in groups
+        }
+        mrr = (
+            sum(
+                scores[relevance] * weights
+                for relevance, (_, weights, _) in groups.items()
             )
-            logger.info(f"Evaluating answer, evaluation: {evaluation}")
-
-            record = EvaluationRecord(
-                id=EvaluationRecord.create_id(question),
-                question=question,
-                answer=answer.answer,
-                sources=self._format_sources(answer.sources),
-                relevance=evaluation.relevance,
-                explanation=evaluation.explanation,
+            / total_weight
+        )
+        mrr_variance = (
+            sum(
+                squared * (scores[relevance] - mrr) ** 2
+                for relevance, (_, _, squared) in groups.items()
             )
+            / total_weight**2
+        )
+        mrr_margin = CONFIDENCE_Z * math.sqrt(mrr_variance)
+        hit_rate_low, hit_rate_high = self._wilson_interval(hit_rate, effective)
+        return {
+            **metrics,
+            "evaluations": total,
+            "effective_evaluations": effective,
+            "hit_rate": hit_rate,
+            "hit_rate_ci_low": hit_rate_low,
+            "hit_rate_ci_high": hit_rate_high,
+            "mrr": mrr,
+            "mrr_ci_low": max(0.0, mrr - mrr_margin),
+            "mrr_ci_high": min(1.0, mrr + mrr_margin),
+        }
 
-            # Perform an upsert operation
-            stmt = insert(EvaluationRecord).values(
-                id=record.id,
-                question=record.question,
-                answer=record.answer,
-                sources=record.sources,
-                relevance=record.relevance,
-                explanation=record.explanation,
-            )
+    @staticmethod
+    def _wilson_interval(proportion: float, n: float) -> Tuple[float, float]:
+        z2 = CONFIDENCE_Z**2
+        center = (proportion + z2 / (2 * n)) / (1 + z2 / n)
+        margin = (
+            CONFIDENCE_Z
+            * math.sqrt(proportion * (1 - proportion) / n + z2 / (4 * n * n))
+            / (1 + z2 / n)
+        )
+        return max(0.0, center - margin), min(1.0, center + margin)
 
-            stmt = stmt.on_conflict_do_update(
-                index_elements=["id"],
-                set_={
-                    "answer": stmt.excluded.answer,
-                    "sources": stmt.excluded.sources,
-                    "relevance": stmt.excluded.relevance,
-                    "explanation": stmt.excluded.explanation,
-                },
-            )
+    @staticmethod
+    def _format_sources(sources: List[Dict]) -> str:
+        formatted_sources = {str(i + 1): source for i, source in enumerate(sources)}
+        return json.dumps(formatted_sources)
+
+    def store_evaluations(
+        self,
+        db: Session,
+        jobs: List[EvaluationJob],
+        results: List[EvaluationResult],
+    ):
+        """Upsert the evaluations of a batch of jobs; the caller commits."""
+        evaluated_at = time.time()
+        records: Dict[str, Dict] = {}
+        document_ids: Dict[str, List[str]] = {}
+        for job, result in zip(jobs, results):
+            # A question judged twice in one batch keeps its later result.
+            record_id = EvaluationRecord.create_id(job.question)
+            records[record_id] = {
+                "id": record_id,
+                "question": job.question,
+                "answer": job.answer,
+                "sources": self._format_sources(json.loads(job.sources)),
+                "relevance": result.relevance.value,
+                "explanation": result.explanation,
+                "evaluated_at": evaluated_at,
+                "content_hash": job.content_hash,
+                "sample_weight": job.sample_weight,
+            }
+            document_ids[record_id] = json.loads(job.document_ids)
+        if not records:
+            return
 
-            db.execute(stmt)
-            db.commit()
+        self._upsert_records(db, list(records.values()))
+        db.query(EvaluationDocument).filter(
+            EvaluationDocument.evaluation_id.in_(records)
+        ).delete(synchronize_session=False)
+        links = [
+            {"evaluation_id": record_id, "document_id": document_id}
+            for record_id, ids in document_ids.items()
+            for document_id in set(ids)
+        ]
+        if links:
+            db.execute(insert(EvaluationDocument), links)
+        logger.info(f"Stored {len(records)} evaluations")
 
-            logger.info(f"Evaluation upserted for question: {question}")
-        except Exception as e:
-            logger.exception(f"Error in background evaluation task: {str(e)}")
-            db.rollback()
+    @staticmethod
+    def _upsert_records(db: Session, rows: List[Dict]):
+        dialect_insert = UPSERT_INSERTS.get(db.get_bind().dialect.name)
+        if dialect_insert is None:
+            for row in rows:
+                db.merge(EvaluationRecord(**row))
+            return
+        stmt = dialect_insert(EvaluationRecord).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["id"],
+            set_={
+                "answer": stmt.excluded.answer,
+                "sources": stmt.excluded.sources,
+                "relevance": stmt.excluded.relevance,
+                "explanation": stmt.excluded.explanation,
+                "evaluated_at": stmt.excluded.evaluated_at,
+                "content_hash": stmt.excluded.content_hash,
+                "sample_weight": stmt.excluded.sample_weight,
+            },
+        )
+        db.execute(stmt)
@@ -0,0 +1,112 @@
+import math
+from typing import List
+
+import faiss
+import numpy as np
+
+from app.core.config import IndexSettings
+from app.core.logger import get_logger
+
+logger = get_logger()
+
+FLAT = "flat"
+HNSW = "hnsw"
+IVF_PQ = "ivf_pq"
+AUTO = "auto"
+INDEX_TYPES = (FLAT, HNSW, IVF_PQ)
+
+
+def min_training_vectors(settings: IndexSettings) -> int:
+    # faiss wants roughly 39 training points per PQ centroid.
+    return 39 * 2**settings.PQ_NBITS
+
+
+def select_index_type(settings: IndexSettings, num_vectors: int) -> str:
+    index_type = settings.TYPE.lower()
+    if index_type == AUTO:
+        if num_vectors <= settings.AUTO_FLAT_MAX_VECTORS:
+            index_type = FLAT
+        elif num_vectors <= settings.AUTO_HNSW_MAX_VECTORS:
+            index_type = HNSW
+        else:
+            index_type = IVF_PQ
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unsupported FAISS index type: {settings.TYPE}")
+    if index_type == IVF_PQ and num_vectors < min_training_vectors(settings):
+        # Too few vectors to train the quantizers yet; stay exact until there are.
+        return FLAT
+    return index_type
+
+
+def index_type_of(index: faiss.Index) -> str:
+    if isinstance(index, faiss.IndexHNSW):
+        return HNSW
+    if isinstance(index, faiss.IndexIVF):
+        return IVF_PQ
+    return FLAT
+
+
+def build_index(
+    index_type: str, vectors: np.ndarray, settings: IndexSettings
+) -> faiss.Index:
+    # Vectors are L2-normalised before they reach the index, so ranking by
+    # inner product ranks by cosine similarity.
+    num_vectors, dimension = vectors.shape
+    if index_type == FLAT:
+        index = faiss.IndexFlatIP(dimension)
+    elif index_type == HNSW:
+        index = faiss.IndexHNSWFlat(
+            dimension, settings.HNSW_M, faiss.METRIC_INNER_PRODUCT
+        )
+        index.hnsw.efConstruction = settings.HNSW_EF_CONSTRUCTION
+    elif index_type == IVF_PQ:
+        nlist = settings.IVF_NLIST or max(
+            1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39)
+        )
+        index = faiss.IndexIVFPQ(
+            faiss.IndexFlatIP(dimension),
+            dimension,
+            nlist,
+            _pq_subquantizers(dimension, settings.PQ_M),
+            settings.PQ_NBITS,
+            faiss.METRIC_INNER_PRODUCT,
+        )
+    else:
+        raise ValueError(f"Unsupported FAISS index type: {index_type}")
+
+    if not index.is_trained:
+        logger.info(f"Training {index_type} index on {num_vectors} vectors")
+        index.train(vectors)
+    if num_vectors:
+        index.add(vectors)
+    apply_search_params(index, settings)
+    return index
+
+
+def apply_search_params(index: faiss.Index, settings: IndexSettings):
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = settings.HNSW_EF_SEARCH
+    elif isinstance(index, faiss.IndexIVF):
+        index.nprobe = settings.IVF_NPROBE
+
+
+def reconstruct_all(index: faiss.Index) -> np.ndarray:
+    if isinstance(index, faiss.IndexIVF):
+        index.make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def reconstruct_labels(index: faiss.Index, labels: List[int]) -> np.ndarray:
+    if not isinstance(index, faiss.IndexIVF):
+        return reconstruct_all(index)[labels]
+    # IVF labels are sparse once vectors are removed; look each one up.
+    index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    vectors = np.empty((len(labels), index.d), dtype=np.float32)
+    for row, label in enumerate(labels):
+        vectors[row] = index.reconstruct(int(label))
+    return vectors
+
+
+def _pq_subquantizers(dimension: int, pq_m: int) -> int:
+    # PQ needs the vector dimension to split evenly into sub-vectors.
+    return max(m for m in range(1, min(pq_m, dimension) + 1) if dimension % m == 0)
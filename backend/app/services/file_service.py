@@ -1,22 +1,33 @@
+import hashlib
 import os
+import time
 import uuid
+from typing import Callable
 
 from fastapi import HTTPException, UploadFile
 
 from app.core.config import settings
 from app.core.logger import get_logger
 from app.services.document_service import DocumentService
-from app.services.qa_service import QAService
+from app.services.ingestion_service import IngestionService
 
 logger = get_logger()
 
 
 class FileService:
-    def __init__(self, document_service: DocumentService):
+    def __init__(
+        self, document_service: DocumentService, ingestion_service: IngestionService
+    ):
         self.document_service = document_service
+        self.ingestion_service = ingestion_service
         logger.info("FileService initialized with DocumentService")
 
-    async def process_upload(self, file: UploadFile, original_filename: str):
+    async def process_upload(
+        self,
+        file: UploadFile,
+        original_filename: str,
+        on_complete: Callable[[], None],
+    ):
         try:
             logger.info(f"Processing upload for file: {original_filename}")
 
@@ -31,28 +42,65 @@ class FileService:
             file_path = os.path.join(full_upload_dir, unique_filename)
             logger.info(f"Saving file to: {file_path}")
 
-            with open(file_path, "wb") as buffer:
-                contents = await file.read()
-                buffer.write(contents)
-            logger.info(f"File saved successfully: {file_path}")
-
-            vector_store = self.document_service.process_document(file_path)
-            logger.info("Document processed and vector store created")
+            upload_stats = await self._stream_to_disk(file, file_path)
+            logger.info(
+                f"File saved successfully: {file_path} "
+                f"({upload_stats['size_bytes']} bytes, "
+                f"{upload_stats['bytes_per_sec']:.0f} bytes/sec)"
+            )
 
-            qa_service = QAService(vector_store)
-            logger.info("QAService initialized with the new vector store")
+            job = self.ingestion_service.submit(
+                original_filename,
+                file_path,
+                upload_stats["sha256"],
+                self.document_service,
+                on_complete,
+            )
 
             return {
+                "job_id": job.job_id,
                 "original_filename": original_filename,
                 "saved_filename": unique_filename,
                 "detected_extension": file_extension,
-                "status": "File uploaded and processed successfully",
-                "qa_service": qa_service,
+                "status": "File uploaded, processing has been queued",
+                **upload_stats,
             }
+        except HTTPException:
+            raise
         except Exception as e:
             logger.exception(f"Error processing upload: {str(e)}")
             raise HTTPException(status_code=500, detail=str(e))
 
+    async def _stream_to_disk(self, file: UploadFile, file_path: str) -> dict:
+        chunk_size = settings.UPLOAD.CHUNK_SIZE
+        max_size = settings.UPLOAD.MAX_SIZE_BYTES
+        sha256 = hashlib.sha256()
+        size_bytes = 0
+        start_time = time.perf_counter()
+
+        try:
+            with open(file_path, "wb") as buffer:
+                while chunk := await file.read(chunk_size):
+                    size_bytes += len(chunk)
+                    if size_bytes > max_size:
+                        raise HTTPException(
+                            status_code=413,
+                            detail=f"File exceeds the maximum upload size of {settings.UPLOAD.MAX_SIZE_MB} MB",
+                        )
+                    sha256.update(chunk)
+                    buffer.write(chunk)
+        except BaseException:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            raise
+
+        elapsed = time.perf_counter() - start_time
+        return {
+            "size_bytes": size_bytes,
+            "sha256": sha256.hexdigest(),
+            "bytes_per_sec": size_bytes / elapsed if elapsed > 0 else 0.0,
+        }
+
     def _guess_extension(self, content_type):
         logger.info(f"Guessing file extension for content type: {content_type}")
         guessed_extension = ".bin"
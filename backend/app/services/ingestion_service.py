@@ -0,0 +1,148 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+from fastapi import HTTPException
+
+from app.core.logger import get_logger
+from app.models.ingestion import IngestionJobStatus, IngestionProgress, JobState
+from app.services.document_service import DocumentService
+
+logger = get_logger()
+
+
+class IngestionJob:
+    def __init__(self, original_filename: str, file_path: str, sha256: str):
+        self.job_id = uuid.uuid4().hex
+        self.original_filename = original_filename
+        self.file_path = file_path
+        self.sha256 = sha256
+        self.state = JobState.QUEUED
+        self.progress = IngestionProgress()
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self._embedding_started_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def update_progress(self, stage: str, done: int, total: Optional[int]):
+        with self._lock:
+            self.progress.stage = stage
+            if stage == "parsing":
+                self.progress.pages_parsed = done
+            elif stage == "embedding":
+                now = time.time()
+                if self._embedding_started_at is None:
+                    self._embedding_started_at = now
+                self.progress.chunks_embedded = done
+                self.progress.chunks_total = total
+                elapsed = now - self._embedding_started_at
+                if done and total and elapsed > 0:
+                    self.progress.eta_seconds = (total - done) * elapsed / done
+
+    def to_status(self) -> IngestionJobStatus:
+        with self._lock:
+            return IngestionJobStatus(
+                job_id=self.job_id,
+                original_filename=self.original_filename,
+                saved_filename=os.path.basename(self.file_path),
+                state=self.state,
+                progress=self.progress.model_copy(),
+                created_at=self.created_at,
+                started_at=self.started_at,
+                finished_at=self.finished_at,
+                result=self.result,
+                error=self.error,
+            )
+
+
+class IngestionService:
+    def __init__(self, max_workers: int, max_pending_jobs: int, job_history: int):
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="ingestion"
+        )
+        self.max_active_jobs = max_workers + max_pending_jobs
+        self.job_history = job_history
+        self.jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        logger.info(f"IngestionService initialized with {max_workers} workers")
+
+    def submit(
+        self,
+        original_filename: str,
+        file_path: str,
+        sha256: str,
+        document_service: DocumentService,
+        on_complete: Callable[[], None],
+    ) -> IngestionJob:
+        job = IngestionJob(original_filename, file_path, sha256)
+        with self._lock:
+            active_jobs = sum(
+                1
+                for existing in self.jobs.values()
+                if existing.state in (JobState.QUEUED, JobState.RUNNING)
+            )
+            if active_jobs >= self.max_active_jobs:
+                logger.warning(f"Ingestion queue full, rejecting: {original_filename}")
+                raise HTTPException(
+                    status_code=503,
+                    detail="Too many documents are being processed. Please retry later.",
+                )
+            self.jobs[job.job_id] = job
+            self._evict_finished_jobs()
+
+        self.executor.submit(self._run, job, document_service, on_complete)
+        logger.info(f"Ingestion job {job.job_id} queued for: {original_filename}")
+        return job
+
+    def get_job(self, job_id: str) -> Optional[IngestionJob]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def list_jobs(self) -> List[IngestionJob]:
+        with self._lock:
+            return list(self.jobs.values())
+
+    def _run(
+        self,
+        job: IngestionJob,
+        document_service: DocumentService,
+        on_complete: Callable[[], None],
+    ):
+        job.state = JobState.RUNNING
+        job.started_at = time.time()
+        logger.info(f"Ingestion job {job.job_id} started")
+        try:
+            stats = document_service.process_document(
+                job.file_path, job.original_filename, job.sha256, job.update_progress
+            )
+            on_complete()
+            job.finished_at = time.time()
+            job.result = {
+                **stats,
+                "elapsed_seconds": job.finished_at - job.started_at,
+            }
+            job.progress.stage = "done"
+            job.progress.eta_seconds = 0.0
+            job.state = JobState.COMPLETED
+            logger.info(f"Ingestion job {job.job_id} completed")
+        except Exception as e:
+            logger.exception(f"Ingestion job {job.job_id} failed: {str(e)}")
+            job.finished_at = time.time()
+            job.error = str(e)
+            job.state = JobState.FAILED
+
+    def _evict_finished_jobs(self):
+        finished = [
+            job_id
+            for job_id, job in self.jobs.items()
+            if job.state in (JobState.COMPLETED, JobState.FAILED)
+        ]
+        for job_id in finished[: max(0, len(self.jobs) - self.job_history)]:
+            del self.jobs[job_id]
@@ -0,0 +1,160 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Optional
+
+from app.core.logger import get_logger
+from fastapi import HTTPException
+
+logger = get_logger()
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+EVALUATION = "evaluation"
+# Highest priority first.
+LANES = (INTERACTIVE, BATCH, EVALUATION)
+
+WAIT_SAMPLES = 1000
+
+
+class LLMScheduler:
+    """Admission control in front of the LLM backend.
+
+    At most max_concurrency calls run at once. Waiting calls queue per lane
+    and are admitted highest lane first, in arrival order within a lane. A
+    full lane or an expired wait is rejected immediately with Retry-After.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_queued: Dict[str, int],
+        max_wait_seconds: Dict[str, float],
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queued = max_queued
+        self.max_wait_seconds = max_wait_seconds
+        self._active = 0
+        self._queues: Dict[str, Deque[asyncio.Future]] = {
+            lane: deque() for lane in LANES
+        }
+        self._waits: Dict[str, Deque[float]] = {
+            lane: deque(maxlen=WAIT_SAMPLES) for lane in LANES
+        }
+        self._admitted = {lane: 0 for lane in LANES}
+        self._rejected = {lane: 0 for lane in LANES}
+        self._timed_out = {lane: 0 for lane in LANES}
+        self._service_seconds: Optional[float] = None
+
+    @asynccontextmanager
+    async def slot(self, lane: str) -> AsyncIterator[None]:
+        start = time.perf_counter()
+        await self._acquire(lane)
+        admitted = time.perf_counter()
+        self._admitted[lane] += 1
+        self._waits[lane].append(admitted - start)
+        try:
+            yield
+        finally:
+            self._record_service(time.perf_counter() - admitted)
+            self._release()
+
+    def check_admission(self, lane: str):
+        # For callers that must reject before committing to a response, such
+        # as streaming; the slot itself is still taken later with slot().
+        if self._has_capacity():
+            return
+        if len(self._queues[lane]) >= self.max_queued.get(lane, 0):
+            self._rejected[lane] += 1
+            raise self._overloaded(429, f"Too many pending {lane} LLM requests")
+
+    def stats(self) -> Dict[str, float]:
+        stats = {
+            "active": self._active,
+            "max_concurrency": self.max_concurrency,
+            "service_seconds": self._service_seconds or 0.0,
+        }
+        for lane in LANES:
+            waits = sorted(self._waits[lane])
+            stats[f"{lane}_queued"] = len(self._queues[lane])
+            stats[f"{lane}_admitted"] = self._admitted[lane]
+            stats[f"{lane}_rejected"] = self._rejected[lane]
+            stats[f"{lane}_timed_out"] = self._timed_out[lane]
+            stats[f"{lane}_wait_p50_seconds"] = self._percentile(waits, 0.50)
+            stats[f"{lane}_wait_p95_seconds"] = self._percentile(waits, 0.95)
+        return stats
+
+    async def _acquire(self, lane: str):
+        if self._has_capacity():
+            self._active += 1
+            return
+        queue = self._queues[lane]
+        if len(queue) >= self.max_queued.get(lane, 0):
+            self._rejected[lane] += 1
+            raise self._overloaded(429, f"Too many pending {lane} LLM requests")
+
+        future = asyncio.get_running_loop().create_future()
+        queue.append(future)
+        try:
+            await asyncio.wait_for(
+                asyncio.shield(future), self.max_wait_seconds.get(lane)
+            )
+        except asyncio.TimeoutError:
+            if future.done():
+                return  # The slot arrived as the wait expired; keep it.
+            queue.remove(future)
+            future.cancel()
+            self._timed_out[lane] += 1
+            raise self._overloaded(503, f"Timed out waiting for the LLM ({lane})")
+        except asyncio.CancelledError:
+            if future.done():
+                self._release()  # Pass on the slot handed to this caller.
+            else:
+                queue.remove(future)
+                future.cancel()
+            raise
+
+    def _release(self):
+        for lane in LANES:
+            queue = self._queues[lane]
+            while queue:
+                future = queue.popleft()
+                if not future.done():
+                    # The slot passes straight to the waiter; _active is unchanged.
+                    future.set_result(None)
+                    return
+        self._active -= 1
+
+    def _has_capacity(self) -> bool:
+        return self._active < self.max_concurrency and not any(
+            self._queues.values()
+        )
+
+    def _record_service(self, seconds: float):
+        if self._service_seconds is None:
+            self._service_seconds = seconds
+        else:
+            self._service_seconds = 0.8 * self._service_seconds + 0.2 * seconds
+
+    def _overloaded(self, status_code: int, detail: str) -> HTTPException:
+        queued = sum(len(queue) for queue in self._queues.values())
+        retry_after = max(
+            1,
+            math.ceil(
+                (self._service_seconds or 1.0) * (queued + 1) / self.max_concurrency
+            ),
+        )
+        logger.warning(f"{detail}; asking client to retry after {retry_after}s")
+        return HTTPException(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": str(retry_after)},
+        )
+
+    @staticmethod
+    def _percentile(values, quantile: float) -> float:
+        if not values:
+            return 0.0
+        return values[min(len(values) - 1, int(quantile * len(values)))]
@@ -1,34 +1,221 @@
+import asyncio
 import json
-from operator import itemgetter
+import re
+import time
+from contextlib import nullcontext
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
 
+import faiss
+import numpy as np
+from app.core.concurrency import ReadWriteLock, SingleFlight
+from app.core.config import settings
 from app.core.logger import get_logger
 from app.factories.llm_factory import get_llm
-from app.models.qa import Answer, AnswerWithSources, Question
+from app.models.qa import (
+    Answer,
+    AnswerWithSources,
+    BatchAnswerItem,
+    Question,
+    RetrievedChunk,
+)
+from app.services.answer_cache import SemanticAnswerCache
+from app.services.context_packer import ContextPacker
+from app.services.llm_scheduler import BATCH, INTERACTIVE, LLMScheduler
 from fastapi import HTTPException
+from langchain.docstore.document import Document
 from langchain.prompts import PromptTemplate
 from langchain.vectorstores import VectorStore
+from langchain_core.exceptions import OutputParserException
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.utils.json import parse_json_markdown, parse_partial_json
+from starlette.concurrency import run_in_threadpool
 
 logger = get_logger()
 
+STRUCTURED = "structured"
+CITATIONS = "citations"
+# "[2]" or "[1, 3]"
+CITATION_PATTERN = re.compile(r"\[(\d+(?:\s*,\s*\d+)*)\]")
+
 
 class QAService:
-    def __init__(self, vector_store: VectorStore):
+    def __init__(
+        self,
+        vector_store: VectorStore,
+        index_version: Optional[str] = None,
+        index_lock: Optional[ReadWriteLock] = None,
+        answer_cache: Optional[SemanticAnswerCache] = None,
+        single_flight: Optional[SingleFlight] = None,
+        llm_scheduler: Optional[LLMScheduler] = None,
+        document_ids: Optional[Dict[str, str]] = None,
+    ):
         self.vector_store = vector_store
+        self.index_version = index_version
+        self.index_lock = index_lock or ReadWriteLock()
+        self.answer_cache = answer_cache
+        self.single_flight = single_flight or SingleFlight()
+        self.llm_scheduler = llm_scheduler
+        # Chunk "source" metadata (the stored file path) -> corpus document id.
+        self.document_ids = document_ids or {}
         self.llm = get_llm()
         self.retriever = self.vector_store.as_retriever()
+        self.answer_mode = settings.QA.ANSWER_MODE
+        if self.answer_mode not in (STRUCTURED, CITATIONS):
+            raise ValueError(f"Unsupported answer mode: {self.answer_mode}")
+        self.context_packer = ContextPacker(
+            max_tokens=settings.QA.CONTEXT_MAX_TOKENS,
+            chunk_overlap=settings.DOCUMENT_PROCESSING.CHUNK_OVERLAP,
+            chars_per_token=settings.QA.CHARS_PER_TOKEN,
+        )
         self.prompt = self._create_prompt()
-        self.chain = self._create_chain()
-        logger.info("QAService initialized with vector store and LLM")
-
-    def _create_chain(self):
-        return (
-            {
-                "context": itemgetter("question") | self.retriever,
-                "question": itemgetter("question"),
-            }
-            | self.prompt
-            | self.llm.with_structured_output(AnswerWithSources)
+        self.citation_prompt = self._create_citation_prompt()
+        self.answer_chain = self.prompt | self.llm.with_structured_output(
+            AnswerWithSources
+        )
+        self.citation_chain = self.citation_prompt | self.llm | StrOutputParser()
+        if self.answer_mode == CITATIONS:
+            self.stream_chain = self.citation_chain
+        else:
+            # Structured output arrives whole, so streamed answers ask for the
+            # same fields as JSON text and the answer is read off as it grows.
+            self.stream_chain = (
+                self._create_stream_prompt() | self.llm | StrOutputParser()
+            )
+        logger.info(
+            f"QAService initialized with vector store and LLM "
+            f"({self.answer_mode} answers)"
+        )
+
+    def _retrieve(self, inputs: Dict[str, Any]) -> List[Document]:
+        # The question may already be embedded for the answer cache; reuse it.
+        embedding = inputs.get("embedding")
+        if embedding is None:
+            embedding = self.vector_store.embeddings.embed_query(inputs["question"])
+        # The corpus index is updated in place; never search it mid-update.
+        with self.index_lock.read():
+            documents_and_scores = (
+                self.vector_store.similarity_search_with_score_by_vector(
+                    embedding, **self.retriever.search_kwargs
+                )
+            )
+        return self._pack_context(inputs["question"], documents_and_scores)
+
+    def _pack_context(
+        self, question: str, documents_and_scores: List[Tuple[Document, float]]
+    ) -> List[Document]:
+        # Results arrive best-first; scores (cosine similarities) are only
+        # carried along for the answer's confidence.
+        packed = self.context_packer.pack(
+            [(document, float(score)) for document, score in documents_and_scores]
+        )
+        unpacked_tokens = self.context_packer.estimate_tokens(
+            self.prompt.format(
+                context=[document for document, _ in documents_and_scores],
+                question=question,
+            )
         )
+        packed_tokens = self.context_packer.estimate_tokens(
+            self.prompt.format(
+                context=self.context_packer.format(packed), question=question
+            )
+        )
+        logger.info(
+            f"Prompt tokens (estimated): {unpacked_tokens} -> {packed_tokens}, "
+            f"{len(packed)}/{len(documents_and_scores)} chunks kept"
+        )
+        return packed
+
+    async def _aretrieve(self, inputs: Dict[str, Any]) -> List[Document]:
+        # Query embedding and FAISS search block; run them on the bounded
+        # threadpool so the event loop keeps serving other requests.
+        return await run_in_threadpool(self._retrieve, inputs)
+
+    async def _embed_question(self, question: str) -> Optional[List[float]]:
+        if self.answer_cache is None:
+            return None
+        return await run_in_threadpool(
+            self.vector_store.embeddings.embed_query, question
+        )
+
+    def _embed_questions(self, questions: List[str]) -> List[List[float]]:
+        return self.vector_store.embeddings.embed_queries(questions)
+
+    def _search_batch(
+        self, embeddings: List[List[float]]
+    ) -> List[List[Tuple[Document, float]]]:
+        if not embeddings:
+            return []
+        k = self.retriever.search_kwargs.get("k", 4)
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if getattr(self.vector_store, "_normalize_L2", False):
+            faiss.normalize_L2(vectors)
+        with self.index_lock.read():
+            # One search over the whole matrix instead of a call per question.
+            scores, indices = self.vector_store.index.search(vectors, k)
+            return [
+                [
+                    (
+                        self.vector_store.docstore.search(
+                            self.vector_store.index_to_docstore_id[i]
+                        ),
+                        float(score),
+                    )
+                    for i, score in zip(row_indices, row_scores)
+                    if i != -1
+                ]
+                for row_indices, row_scores in zip(indices, scores)
+            ]
+
+    def retrieve(
+        self,
+        question: str,
+        k: int,
+        fetch_k: int,
+        min_score: Optional[float] = None,
+        sources: Optional[Set[str]] = None,
+        page_from: Optional[int] = None,
+        page_to: Optional[int] = None,
+    ) -> List[RetrievedChunk]:
+        start_time = time.perf_counter()
+        embedding = self.vector_store.embeddings.embed_query(question)
+
+        def matches(metadata: Dict[str, Any]) -> bool:
+            if sources is not None and metadata.get("source") not in sources:
+                return False
+            page = metadata.get("page")
+            if page_from is not None and (page is None or page < page_from):
+                return False
+            if page_to is not None and (page is None or page > page_to):
+                return False
+            return True
+
+        filtered = sources is not None or page_from is not None or page_to is not None
+        with self.index_lock.read():
+            # With a filter FAISS fetches fetch_k candidates and keeps the
+            # first k that match.
+            documents_and_scores = (
+                self.vector_store.similarity_search_with_score_by_vector(
+                    embedding,
+                    k=k,
+                    filter=matches if filtered else None,
+                    fetch_k=fetch_k,
+                )
+            )
+        chunks = [
+            RetrievedChunk(
+                content=document.page_content,
+                score=float(score),
+                metadata=document.metadata,
+            )
+            for document, score in documents_and_scores
+        ]
+        if min_score is not None:
+            chunks = [chunk for chunk in chunks if chunk.score >= min_score]
+        logger.info(
+            f"Retrieved {len(chunks)} chunks in "
+            f"{(time.perf_counter() - start_time) * 1000:.1f}ms"
+        )
+        return chunks
 
     def _create_prompt(self):
         template = """
@@ -48,27 +235,341 @@ class QAService:
         prompt = PromptTemplate.from_template(template)
         return prompt
 
+    def _create_stream_prompt(self):
+        template = """
+            You are an assistant that provides answers to questions based on
+            a given context. 
+
+            Answer the question based on the context. If you can't answer the
+            question, reply "I don't know".
+
+            Be as concise as possible and go straight to the point.
+
+            Reply with a JSON object only, with two keys: "answer", your answer,
+            and "sources", the list of context passages you used, each copied
+            exactly.
+
+            Context: {context}
+
+            Question: {question}
+            """
+
+        return PromptTemplate.from_template(template)
+
+    def _create_citation_prompt(self):
+        template = """
+            You are an assistant that provides answers to questions based on
+            a given context. The context is a list of numbered passages.
+
+            Answer the question based on the context. If you can't answer the
+            question, reply "I don't know".
+
+            Cite the passages you used by their number in square brackets,
+            like [1] or [2][3]. Do not repeat the passages themselves.
+
+            Be as concise as possible and go straight to the point.
+
+            Context:
+            {context}
+
+            Question: {question}
+            """
+
+        return PromptTemplate.from_template(template)
+
     async def answer_question(self, question: Question) -> Answer:
+        # Identical questions asked while one is already being answered wait
+        # for that answer instead of running their own retrieval and generation.
+        key = (" ".join(question.question.lower().split()), self.index_version)
+        return await self.single_flight.do(
+            key, lambda: self._answer_question(question)
+        )
+
+    async def _answer_question(self, question: Question) -> Answer:
         try:
             logger.info(f"Received question: {question.question}")
-            result = self.chain.invoke({"question": question.question})
-            logger.info(f"Generated answer: {result}")
-
-            if isinstance(result, dict) and "answer" in result and "sources" in result:
-                try:
-                    sources = json.loads(result["sources"])
-                except json.JSONDecodeError:
-                    sources = [
-                        s.strip() for s in result["sources"].strip("[]").split(",")
-                    ]
+            start_time = time.perf_counter()
+            embedding = await self._embed_question(question.question)
+            embedded = time.perf_counter()
+            if embedding is not None:
+                cached = self.answer_cache.lookup(embedding, self.index_version)
+                if cached is not None:
+                    return cached.model_copy(
+                        update={"timings": {"embedding": embedded - start_time}}
+                    )
 
-                return Answer(answer=result["answer"], sources=sources)
-            else:
-                logger.error(f"Unexpected result structure: {result}")
-                raise HTTPException(
-                    status_code=500,
-                    detail="Unexpected response structure from the chain",
+            documents = await self._aretrieve(
+                {"question": question.question, "embedding": embedding}
+            )
+            retrieved = time.perf_counter()
+            answer = await self._generate(question.question, documents)
+            answer.timings = {
+                "embedding": embedded - start_time,
+                "retrieval": retrieved - embedded,
+                "generation": time.perf_counter() - retrieved,
+            }
+            logger.info(f"Generated answer: {answer}")
+            if embedding is not None:
+                self.answer_cache.store(
+                    question.question,
+                    embedding,
+                    answer,
+                    time.perf_counter() - start_time,
+                    self.index_version,
                 )
+            return answer
+        except HTTPException:
+            raise
         except Exception as e:
             logger.exception(f"Error processing question: {str(e)}")
             raise HTTPException(status_code=500, detail=str(e))
+
+    async def _generate(
+        self, question: str, documents: List[Document], lane: str = INTERACTIVE
+    ) -> Answer:
+        if self.answer_mode == CITATIONS:
+            async with self._llm_slot(lane):
+                text = await self.citation_chain.ainvoke(
+                    {
+                        "context": self.context_packer.format_numbered(documents),
+                        "question": question,
+                    }
+                )
+            return self._cite(text, documents)
+        async with self._llm_slot(lane):
+            result = await self.answer_chain.ainvoke(
+                {
+                    "context": self.context_packer.format(documents),
+                    "question": question,
+                }
+            )
+        answer = self._to_answer(result)
+        answer.document_ids = self._document_ids(documents)
+        answer.confidence = self._confidence(documents)
+        return answer
+
+    def _document_ids(self, documents: List[Document]) -> List[str]:
+        document_ids = []
+        for document in documents:
+            document_id = self.document_ids.get(document.metadata.get("source"))
+            if document_id is not None and document_id not in document_ids:
+                document_ids.append(document_id)
+        return document_ids
+
+    @staticmethod
+    def _confidence(documents: List[Document]) -> float:
+        # An answer drawing on no retrieved chunk has nothing backing it.
+        return max(
+            (document.metadata.get("relevance_score", 0.0) for document in documents),
+            default=0.0,
+        )
+
+    def _llm_slot(self, lane: str):
+        if self.llm_scheduler is None:
+            return nullcontext()
+        return self.llm_scheduler.slot(lane)
+
+    def _cite(self, text: str, documents: List[Document]) -> Answer:
+        # Map [n] markers back to the numbered context passages, in the order
+        # they are first cited; numbers outside the context are ignored.
+        cited = []
+        for match in CITATION_PATTERN.finditer(text):
+            for number in match.group(1).split(","):
+                index = int(number) - 1
+                if 0 <= index < len(documents) and index not in cited:
+                    cited.append(index)
+        cited_documents = [documents[index] for index in cited]
+        return Answer(
+            answer=text.strip(),
+            sources=[document.page_content for document in cited_documents],
+            document_ids=self._document_ids(cited_documents),
+            confidence=self._confidence(cited_documents),
+        )
+
+    def _to_answer(self, result: Any) -> Answer:
+        if isinstance(result, dict) and "answer" in result and "sources" in result:
+            sources = result["sources"]
+            if isinstance(sources, str):
+                try:
+                    sources = json.loads(sources)
+                except json.JSONDecodeError:
+                    sources = [s.strip() for s in sources.strip("[]").split(",")]
+            if not isinstance(sources, list):
+                sources = [sources]
+            return Answer(
+                answer=result["answer"], sources=[str(source) for source in sources]
+            )
+        logger.error(f"Unexpected result structure: {result}")
+        raise HTTPException(
+            status_code=500,
+            detail="Unexpected response structure from the chain",
+        )
+
+    @staticmethod
+    def _partial_answer(text: str) -> Optional[str]:
+        """The "answer" field of a JSON reply still being streamed, or None once
+        the reply is clearly not JSON."""
+        stripped = text.lstrip()
+        if stripped.startswith("`"):
+            # A fenced ```json block; wait until the fence is complete.
+            stripped = stripped.lstrip("`")
+            if "json".startswith(stripped.strip()):
+                return ""
+            stripped = stripped.removeprefix("json").lstrip()
+        if not stripped:
+            return ""
+        if not stripped.startswith("{"):
+            return None
+        parsed = parse_partial_json(stripped)
+        if isinstance(parsed, dict) and isinstance(parsed.get("answer"), str):
+            return parsed["answer"]
+        return ""
+
+    def _parse_streamed(self, text: str) -> Optional[Answer]:
+        try:
+            result = parse_json_markdown(text)
+        except (OutputParserException, ValueError):
+            return None
+        if not isinstance(result, dict) or not {"answer", "sources"} <= result.keys():
+            return None
+        return self._to_answer(result)
+
+    async def answer_batch(
+        self, questions: List[str], max_concurrency: int
+    ) -> List[BatchAnswerItem]:
+        logger.info(f"Received batch of {len(questions)} questions")
+        start_time = time.perf_counter()
+        embeddings = await run_in_threadpool(self._embed_questions, questions)
+
+        answers: List[Optional[Answer]] = [None] * len(questions)
+        pending = []
+        for i, embedding in enumerate(embeddings):
+            if self.answer_cache is not None:
+                answers[i] = self.answer_cache.lookup(embedding, self.index_version)
+            if answers[i] is None:
+                pending.append(i)
+        contexts = await run_in_threadpool(
+            self._search_batch, [embeddings[i] for i in pending]
+        )
+        logger.info(
+            f"Embedded and retrieved {len(questions)} questions in "
+            f"{time.perf_counter() - start_time:.3f}s"
+        )
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def generate(
+            i: int, documents_and_scores: List[Tuple[Document, float]]
+        ) -> Answer:
+            async with semaphore:
+                generation_start = time.perf_counter()
+                documents = self._pack_context(questions[i], documents_and_scores)
+                answer = await self._generate(questions[i], documents, lane=BATCH)
+                if self.answer_cache is not None:
+                    self.answer_cache.store(
+                        questions[i],
+                        embeddings[i],
+                        answer,
+                        time.perf_counter() - generation_start,
+                        self.index_version,
+                    )
+                return answer
+
+        outcomes = await asyncio.gather(
+            *(generate(i, results) for i, results in zip(pending, contexts)),
+            return_exceptions=True,
+        )
+        errors = {}
+        for i, outcome in zip(pending, outcomes):
+            if isinstance(outcome, Exception):
+                logger.error(f"Error answering batch question {i}: {outcome}")
+                errors[i] = getattr(outcome, "detail", None) or str(outcome)
+            else:
+                answers[i] = outcome
+
+        logger.info(
+            f"Answered batch of {len(questions)} questions "
+            f"({len(errors)} failed) in {time.perf_counter() - start_time:.3f}s"
+        )
+        return [
+            BatchAnswerItem(question=question, answer=answers[i], error=errors.get(i))
+            for i, question in enumerate(questions)
+        ]
+
+    async def stream_answer(
+        self, question: Question
+    ) -> AsyncIterator[Dict[str, Any]]:
+        logger.info(f"Received streaming question: {question.question}")
+        start_time = time.perf_counter()
+        embedding = await self._embed_question(question.question)
+        if embedding is not None:
+            cached = self.answer_cache.lookup(embedding, self.index_version)
+            if cached is not None:
+                yield {"event": "sources", "data": {"sources": cached.sources}}
+                yield {"event": "token", "data": {"token": cached.answer}}
+                yield {"event": "done", "data": cached.model_dump(), "answer": cached}
+                return
+
+        documents = await self._aretrieve(
+            {"question": question.question, "embedding": embedding}
+        )
+        sources = [document.page_content for document in documents]
+        logger.info(
+            f"Retrieved {len(documents)} chunks in {time.perf_counter() - start_time:.3f}s"
+        )
+        yield {"event": "sources", "data": {"sources": sources}}
+
+        if self.answer_mode == CITATIONS:
+            context = self.context_packer.format_numbered(documents)
+        else:
+            context = self.context_packer.format(documents)
+        tokens, streamed = [], ""
+        async with self._llm_slot(INTERACTIVE):
+            async for token in self.stream_chain.astream(
+                {"context": context, "question": question.question}
+            ):
+                if not tokens:
+                    logger.info(
+                        f"Time to first token: {time.perf_counter() - start_time:.3f}s"
+                    )
+                tokens.append(token)
+                if self.answer_mode == CITATIONS:
+                    yield {"event": "token", "data": {"token": token}}
+                    continue
+                answer_so_far = self._partial_answer("".join(tokens))
+                if answer_so_far is None:
+                    # Not JSON after all; pass the reply through as it comes.
+                    answer_so_far = "".join(tokens)
+                if answer_so_far.startswith(streamed) and answer_so_far != streamed:
+                    yield {
+                        "event": "token",
+                        "data": {"token": answer_so_far[len(streamed) :]},
+                    }
+                    streamed = answer_so_far
+
+        text = "".join(tokens)
+        cacheable = True
+        if self.answer_mode == CITATIONS:
+            answer = self._cite(text, documents)
+        else:
+            answer = self._parse_streamed(text)
+            if answer is None:
+                # Without the model's sources this is not a structured answer;
+                # keep it out of the cache that /answer also reads.
+                logger.warning("Streamed answer is not JSON; reporting all sources")
+                answer = Answer(answer=text.strip(), sources=sources)
+                cacheable = False
+            answer.document_ids = self._document_ids(documents)
+            answer.confidence = self._confidence(documents)
+        if embedding is not None and cacheable:
+            self.answer_cache.store(
+                question.question,
+                embedding,
+                answer,
+                time.perf_counter() - start_time,
+                self.index_version,
+            )
+        logger.info(
+            f"Streamed answer of {len(tokens)} tokens in {time.perf_counter() - start_time:.3f}s"
+        )
+        yield {"event": "done", "data": answer.model_dump(), "answer": answer}
@@ -1,29 +1,574 @@
+import json
+import os
+import pickle
+import shutil
+import time
+import uuid
+import warnings
 from abc import ABC, abstractmethod
-from typing import List
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple
 
+import faiss
+import numpy as np
 from langchain.docstore.document import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain.embeddings.base import Embeddings
 from langchain.vectorstores import VectorStore
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from tenacity import Retrying, stop_after_attempt, wait_exponential
 
+from app.core.concurrency import ReadWriteLock
+from app.core.config import IndexSettings
 from app.core.logger import get_logger
+from app.models.ingestion import ProgressCallback
+from app.services.faiss_index import (
+    FLAT,
+    HNSW,
+    IVF_PQ,
+    apply_search_params,
+    build_index,
+    index_type_of,
+    reconstruct_all,
+    reconstruct_labels,
+    select_index_type,
+)
 
 logger = get_logger()
 
+# Subdirectory of the index directory holding changes made since a snapshot.
+DELTA_DIR = "deltas"
+
 
 class VectorStoreService(ABC):
     @abstractmethod
     def create_vector_store(
-        self, documents: List[Document], embedding_model: Embeddings
+        self,
+        documents: List[Document],
+        embedding_model: Embeddings,
+        progress_callback: Optional[ProgressCallback] = None,
+    ) -> VectorStore:
+        pass
+
+    @abstractmethod
+    def add_documents(
+        self,
+        vector_store: Optional[VectorStore],
+        documents: List[Document],
+        ids: List[str],
+        embedding_model: Embeddings,
+        progress_callback: Optional[ProgressCallback] = None,
+        write_lock: Optional[ReadWriteLock] = None,
+    ) -> VectorStore:
+        pass
+
+    @abstractmethod
+    def embed_documents(
+        self,
+        documents: List[Document],
+        embedding_model: Embeddings,
+        progress_callback: Optional[ProgressCallback] = None,
+    ) -> List[List[float]]:
+        pass
+
+    @abstractmethod
+    def add_embeddings(
+        self,
+        vector_store: Optional[VectorStore],
+        documents: List[Document],
+        embeddings: List[List[float]],
+        ids: List[str],
+        embedding_model: Embeddings,
+        write_lock: Optional[ReadWriteLock] = None,
     ) -> VectorStore:
         pass
 
+    @abstractmethod
+    def delete_documents(
+        self,
+        vector_store: VectorStore,
+        ids: List[str],
+        write_lock: Optional[ReadWriteLock] = None,
+    ):
+        pass
+
+    @abstractmethod
+    def make_writable(self, vector_store: VectorStore):
+        pass
+
+    @abstractmethod
+    def copy_vector_store(self, vector_store: VectorStore) -> VectorStore:
+        pass
+
+    @abstractmethod
+    def save_vector_store(
+        self, vector_store: VectorStore, manifest: Dict[str, Any]
+    ) -> str:
+        pass
+
+    @abstractmethod
+    def load_latest_vector_store(
+        self, embedding_model: Embeddings, manifest_filter: Dict[str, Any]
+    ) -> Optional[Tuple[VectorStore, Dict[str, Any]]]:
+        pass
+
+    @abstractmethod
+    def append_delta(self, delta: Dict[str, Any]) -> int:
+        pass
+
+    @abstractmethod
+    def load_deltas(self, after: int) -> List[Tuple[int, Dict[str, Any]]]:
+        pass
+
 
 class FAISSVectorStoreService(VectorStoreService):
+    def __init__(
+        self,
+        batch_size: int = 64,
+        max_concurrent_batches: int = 4,
+        max_retries: int = 3,
+        retry_backoff_seconds: float = 1.0,
+        index_dir: str = "indexes",
+        keep_versions: int = 3,
+        mmap: bool = True,
+        index_settings: Optional[IndexSettings] = None,
+    ):
+        self.batch_size = batch_size
+        self.max_concurrent_batches = max_concurrent_batches
+        self.max_retries = max_retries
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.index_dir = index_dir
+        self.keep_versions = keep_versions
+        self.mmap = mmap
+        self.index_settings = index_settings or IndexSettings()
+        self._last_delta: Optional[int] = None
+
     def create_vector_store(
-        self, documents: List[Document], embedding_model: Embeddings
+        self,
+        documents: List[Document],
+        embedding_model: Embeddings,
+        progress_callback: Optional[ProgressCallback] = None,
     ) -> VectorStore:
+        ids = [uuid.uuid4().hex for _ in documents]
+        return self.add_documents(
+            None, documents, ids, embedding_model, progress_callback
+        )
+
+    def add_documents(
+        self,
+        vector_store: Optional[FAISS],
+        documents: List[Document],
+        ids: List[str],
+        embedding_model: Embeddings,
+        progress_callback: Optional[ProgressCallback] = None,
+        write_lock: Optional[ReadWriteLock] = None,
+    ) -> FAISS:
+        embeddings = self.embed_documents(documents, embedding_model, progress_callback)
+        return self.add_embeddings(
+            vector_store, documents, embeddings, ids, embedding_model, write_lock
+        )
+
+    def embed_documents(
+        self,
+        documents: List[Document],
+        embedding_model: Embeddings,
+        progress_callback: Optional[ProgressCallback] = None,
+    ) -> List[List[float]]:
+        logger.info(
+            f"Embedding chunks with embedding model: {type(embedding_model).__name__}"
+        )
+        if not documents:
+            raise ValueError("No text could be extracted from the document.")
+
+        batches = [
+            documents[start : start + self.batch_size]
+            for start in range(0, len(documents), self.batch_size)
+        ]
+        logger.info(
+            f"Embedding {len(documents)} chunks in {len(batches)} batches, "
+            f"{self.max_concurrent_batches} in flight"
+        )
+
+        embeddings: Dict[int, List[List[float]]] = {}
+        chunks_embedded = 0
+        with ThreadPoolExecutor(
+            max_workers=self.max_concurrent_batches, thread_name_prefix="embedding"
+        ) as executor:
+            futures = {
+                executor.submit(self._embed_batch, batch, embedding_model): position
+                for position, batch in enumerate(batches)
+            }
+            try:
+                for future in as_completed(futures):
+                    position = futures[future]
+                    embeddings[position] = future.result()
+                    chunks_embedded += len(batches[position])
+                    if progress_callback:
+                        progress_callback(
+                            "embedding", chunks_embedded, len(documents)
+                        )
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+        return [
+            embedding
+            for position in range(len(batches))
+            for embedding in embeddings[position]
+        ]
+
+    def add_embeddings(
+        self,
+        vector_store: Optional[FAISS],
+        documents: List[Document],
+        embeddings: List[List[float]],
+        ids: List[str],
+        embedding_model: Embeddings,
+        write_lock: Optional[ReadWriteLock] = None,
+    ) -> FAISS:
+        # Callers embed every chunk first, so a failed document leaves no
+        # chunks behind in the index that no record owns.
+        write_lock = write_lock or ReadWriteLock()
+        text_embeddings = [
+            (doc.page_content, embedding)
+            for doc, embedding in zip(documents, embeddings)
+        ]
+        metadatas = [doc.metadata for doc in documents]
+        if vector_store is None:
+            empty = np.empty((0, len(embeddings[0])), dtype=np.float32)
+            vector_store = self._wrap(
+                embedding_model,
+                build_index(FLAT, empty, self.index_settings),
+                InMemoryDocstore(),
+                {},
+            )
+        with write_lock.write():
+            if index_type_of(vector_store.index) == IVF_PQ:
+                self._add_labelled(vector_store, text_embeddings, metadatas, ids)
+            else:
+                vector_store.add_embeddings(
+                    text_embeddings, metadatas=metadatas, ids=ids
+                )
+        self._maybe_convert_index(vector_store, write_lock)
+        return vector_store
+
+    def delete_documents(
+        self,
+        vector_store: FAISS,
+        ids: List[str],
+        write_lock: Optional[ReadWriteLock] = None,
+    ):
+        if not ids:
+            return
+        write_lock = write_lock or ReadWriteLock()
+        removed = set(ids)
+        index_type = index_type_of(vector_store.index)
+        if index_type == HNSW:
+            # HNSW graphs do not support removal, so rebuild from what remains.
+            # Writers are serialised by the corpus, so the rebuild reads the
+            # live index while searches continue and is swapped in afterwards.
+            kept = [
+                (label, docstore_id)
+                for label, docstore_id in sorted(
+                    vector_store.index_to_docstore_id.items()
+                )
+                if docstore_id not in removed
+            ]
+            vectors = reconstruct_all(vector_store.index)[
+                [label for label, _ in kept]
+            ]
+            new_index = build_index(
+                select_index_type(self.index_settings, len(kept)),
+                vectors,
+                self.index_settings,
+            )
+            with write_lock.write():
+                vector_store.index = new_index
+                vector_store.index_to_docstore_id = {
+                    label: docstore_id for label, (_, docstore_id) in enumerate(kept)
+                }
+                vector_store.docstore.delete(ids)
+        elif index_type == IVF_PQ:
+            # IVF lists keep the labels of the remaining vectors, whereas
+            # FAISS.delete renumbers the mapping from zero; drop only the
+            # removed labels and leave the rest where they are.
+            labels = [
+                label
+                for label, docstore_id in vector_store.index_to_docstore_id.items()
+                if docstore_id in removed
+            ]
+            with write_lock.write():
+                vector_store.index.remove_ids(np.asarray(labels, dtype=np.int64))
+                for label in labels:
+                    del vector_store.index_to_docstore_id[label]
+                vector_store.docstore.delete(ids)
+        else:
+            with write_lock.write():
+                vector_store.delete(ids)
+        logger.info(f"Deleted {len(ids)} chunks from FAISS vector store")
+
+    def _add_labelled(
+        self,
+        vector_store: FAISS,
+        text_embeddings: List[Tuple[str, List[float]]],
+        metadatas: List[Dict[str, Any]],
+        ids: List[str],
+    ):
+        # After removals IVF labels are sparse, and FAISS.add_embeddings would
+        # label new vectors from ntotal onwards, colliding with live labels.
+        vectors = np.asarray(
+            [embedding for _, embedding in text_embeddings], dtype=np.float32
+        )
+        faiss.normalize_L2(vectors)
+        start = max(vector_store.index_to_docstore_id, default=-1) + 1
+        labels = range(start, start + len(ids))
+        vector_store.index.add_with_ids(vectors, np.asarray(labels, dtype=np.int64))
+        vector_store.docstore.add(
+            {
+                docstore_id: Document(page_content=text, metadata=metadata)
+                for docstore_id, (text, _), metadata in zip(
+                    ids, text_embeddings, metadatas
+                )
+            }
+        )
+        vector_store.index_to_docstore_id.update(zip(labels, ids))
+
+    def _maybe_convert_index(self, vector_store: FAISS, write_lock: ReadWriteLock):
+        current_type = index_type_of(vector_store.index)
+        target_type = select_index_type(
+            self.index_settings, vector_store.index.ntotal
+        )
+        # IVF-PQ codes are lossy, so never rebuild other index types from them.
+        if target_type == current_type or current_type == IVF_PQ:
+            return
         logger.info(
-            f"Creating FAISS vector store with embedding model: {type(embedding_model).__name__}"
+            f"Converting {vector_store.index.ntotal}-vector index from "
+            f"{current_type} to {target_type}"
+        )
+        # Writers are serialised by the corpus, so the new index can be built
+        # while searches continue on the old one and swapped in afterwards.
+        new_index = build_index(
+            target_type, reconstruct_all(vector_store.index), self.index_settings
+        )
+        with write_lock.write():
+            vector_store.index = new_index
+
+    def make_writable(self, vector_store: FAISS):
+        # Memory-mapped indexes are read-only; copy into memory before mutating.
+        vector_store.index = faiss.clone_index(vector_store.index)
+
+    def _embed_batch(
+        self, batch: List[Document], embedding_model: Embeddings
+    ) -> List[List[float]]:
+        texts = [doc.page_content for doc in batch]
+        for attempt in Retrying(
+            stop=stop_after_attempt(self.max_retries),
+            wait=wait_exponential(multiplier=self.retry_backoff_seconds),
+            reraise=True,
+        ):
+            with attempt:
+                if attempt.retry_state.attempt_number > 1:
+                    logger.warning(
+                        f"Retrying embedding batch of {len(texts)} chunks "
+                        f"(attempt {attempt.retry_state.attempt_number})"
+                    )
+                return embedding_model.embed_documents(texts)
+
+    def copy_vector_store(self, vector_store: FAISS) -> FAISS:
+        # Documents are never mutated in place, so the docstore copy is shallow.
+        return self._wrap(
+            vector_store.embedding_function,
+            faiss.clone_index(vector_store.index),
+            InMemoryDocstore(dict(vector_store.docstore._dict)),
+            dict(vector_store.index_to_docstore_id),
+        )
+
+    @staticmethod
+    def _wrap(
+        embedding_model: Embeddings,
+        index: faiss.Index,
+        docstore: InMemoryDocstore,
+        index_to_docstore_id: Dict[int, str],
+    ) -> FAISS:
+        # Embeddings are normalised on the way in, so inner product scores are
+        # cosine similarities in [-1, 1]. LangChain warns that normalising only
+        # applies to Euclidean distance, but normalises all the same.
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore", "Normalizing L2 is not applicable")
+            return FAISS(
+                embedding_function=embedding_model,
+                index=index,
+                docstore=docstore,
+                index_to_docstore_id=index_to_docstore_id,
+                normalize_L2=True,
+                distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+            )
+
+    def _migrate_to_cosine(self, vector_store: FAISS):
+        # Indexes saved before scores were cosine similarities hold raw vectors
+        # under L2 distance; normalise and rebuild them as the same index type.
+        labels = sorted(vector_store.index_to_docstore_id)
+        vectors = reconstruct_labels(vector_store.index, labels)
+        faiss.normalize_L2(vectors)
+        index_type = index_type_of(vector_store.index)
+        logger.warning(
+            f"Rebuilding {len(labels)}-vector L2 {index_type} index for cosine "
+            "similarity; it is saved that way at the next compaction"
+        )
+        vector_store.index = build_index(index_type, vectors, self.index_settings)
+        vector_store.index_to_docstore_id = {
+            label: vector_store.index_to_docstore_id[old_label]
+            for label, old_label in enumerate(labels)
+        }
+
+    def save_vector_store(self, vector_store: FAISS, manifest: Dict[str, Any]) -> str:
+        os.makedirs(self.index_dir, exist_ok=True)
+        version = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        staging_path = os.path.join(self.index_dir, f".{version}.tmp")
+        # Write into a staging directory and rename, so a crash mid-save never
+        # leaves a half-written version behind for the next startup to load.
+        vector_store.save_local(staging_path)
+        manifest = {
+            **manifest,
+            "version": version,
+            "created_at": time.time(),
+            "num_vectors": vector_store.index.ntotal,
+            "index_type": index_type_of(vector_store.index),
+        }
+        with open(os.path.join(staging_path, "manifest.json"), "w") as f:
+            json.dump(manifest, f)
+        os.rename(staging_path, os.path.join(self.index_dir, version))
+        logger.info(f"Saved FAISS index version {version} to {self.index_dir}")
+        self._prune_versions()
+        return version
+
+    def load_latest_vector_store(
+        self, embedding_model: Embeddings, manifest_filter: Dict[str, Any]
+    ) -> Optional[Tuple[FAISS, Dict[str, Any]]]:
+        for version in reversed(self._list_versions()):
+            path = os.path.join(self.index_dir, version)
+            try:
+                with open(os.path.join(path, "manifest.json")) as f:
+                    manifest = json.load(f)
+                mismatched = {
+                    key: manifest.get(key)
+                    for key, value in manifest_filter.items()
+                    if manifest.get(key) != value
+                }
+                if mismatched:
+                    logger.warning(
+                        f"Skipping index version {version}, built with {mismatched}"
+                    )
+                    continue
+                vector_store, mmapped = self._load_version(path, embedding_model)
+                manifest["mmapped"] = mmapped
+                logger.info(
+                    f"Loaded FAISS index version {version} "
+                    f"({vector_store.index.ntotal} vectors)"
+                )
+                return vector_store, manifest
+            except Exception as e:
+                logger.exception(f"Failed to load index version {version}: {str(e)}")
+        logger.info(f"No usable FAISS index found in {self.index_dir}")
+        return None
+
+    def append_delta(self, delta: Dict[str, Any]) -> int:
+        # Callers serialise writers, so sequence numbers are handed out in order.
+        delta_dir = os.path.join(self.index_dir, DELTA_DIR)
+        os.makedirs(delta_dir, exist_ok=True)
+        if self._last_delta is None:
+            self._last_delta = max(
+                [sequence for sequence, _ in self._list_deltas()]
+                + [manifest.get("delta_sequence", 0) for manifest in self._manifests()],
+                default=0,
+            )
+        sequence = self._last_delta + 1
+        staging_path = os.path.join(delta_dir, f".{sequence:012d}.tmp")
+        with open(staging_path, "wb") as f:
+            pickle.dump(delta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(staging_path, os.path.join(delta_dir, f"{sequence:012d}.pkl"))
+        self._last_delta = sequence
+        return sequence
+
+    def load_deltas(self, after: int) -> List[Tuple[int, Dict[str, Any]]]:
+        deltas = []
+        for sequence, path in self._list_deltas():
+            if sequence > after:
+                with open(path, "rb") as f:
+                    deltas.append((sequence, pickle.load(f)))
+        return deltas
+
+    def _list_deltas(self) -> List[Tuple[int, str]]:
+        delta_dir = os.path.join(self.index_dir, DELTA_DIR)
+        if not os.path.isdir(delta_dir):
+            return []
+        return sorted(
+            (int(name[: -len(".pkl")]), os.path.join(delta_dir, name))
+            for name in os.listdir(delta_dir)
+            if name.endswith(".pkl") and not name.startswith(".")
+        )
+
+    def _manifests(self) -> List[Dict[str, Any]]:
+        manifests = []
+        for version in self._list_versions():
+            try:
+                with open(os.path.join(self.index_dir, version, "manifest.json")) as f:
+                    manifests.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return manifests
+
+    def _load_version(
+        self, path: str, embedding_model: Embeddings
+    ) -> Tuple[FAISS, bool]:
+        index_file = os.path.join(path, "index.faiss")
+        index = None
+        mmapped = False
+        if self.mmap:
+            try:
+                index = faiss.read_index(
+                    index_file, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+                )
+                mmapped = True
+            except RuntimeError:
+                logger.info("Index type cannot be memory-mapped, reading into memory")
+        if index is None:
+            index = faiss.read_index(index_file)
+        apply_search_params(index, self.index_settings)
+        with open(os.path.join(path, "index.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        vector_store = self._wrap(
+            embedding_model, index, docstore, index_to_docstore_id
+        )
+        if index.metric_type != faiss.METRIC_INNER_PRODUCT:
+            self._migrate_to_cosine(vector_store)
+            mmapped = False
+        return vector_store, mmapped
+
+    def _list_versions(self) -> List[str]:
+        if not os.path.isdir(self.index_dir):
+            return []
+        return sorted(
+            name
+            for name in os.listdir(self.index_dir)
+            if not name.startswith(".")
+            and name != DELTA_DIR
+            and os.path.isdir(os.path.join(self.index_dir, name))
+        )
+
+    def _prune_versions(self):
+        versions = self._list_versions()
+        for version in versions[: max(0, len(versions) - self.keep_versions)]:
+            shutil.rmtree(os.path.join(self.index_dir, version), ignore_errors=True)
+            logger.info(f"Removed old FAISS index version {version}")
+        # Keep every delta a remaining version may still need replayed.
+        folded = min(
+            (manifest.get("delta_sequence", 0) for manifest in self._manifests()),
+            default=0,
         )
-        return FAISS.from_documents(documents, embedding_model)
+        for sequence, path in self._list_deltas():
+            if sequence <= folded:
+                os.remove(path)
@@ -0,0 +1,114 @@
+"""Recall-vs-latency comparison of FAISS index types against the flat baseline.
+
+Run from the backend directory:
+
+    python -m benchmarks.index_types --num-vectors 200000 --dimension 4096
+    python -m benchmarks.index_types --from-index indexes/<version>
+"""
+
+import argparse
+import os
+import time
+
+import faiss
+import numpy as np
+
+from app.core.config import settings
+from app.services.faiss_index import FLAT, HNSW, IVF_PQ, build_index, reconstruct_all
+
+
+def _synthetic_vectors(num_vectors: int, dimension: int, seed: int) -> np.ndarray:
+    # Clustered data behaves more like real embeddings than uniform noise.
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal(
+        (max(1, num_vectors // 1000), dimension), dtype=np.float32
+    )
+    assignments = rng.integers(0, len(centers), size=num_vectors)
+    noise = rng.standard_normal((num_vectors, dimension), dtype=np.float32)
+    return centers[assignments] + 0.3 * noise
+
+
+def _search_latencies(index: faiss.Index, queries: np.ndarray, k: int):
+    # One query at a time, the way the retriever issues them.
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - start)
+        results.append(ids[0])
+    return np.array(results), np.array(latencies)
+
+
+def _recall(results: np.ndarray, ground_truth: np.ndarray) -> float:
+    hits = sum(
+        len(set(found) & set(expected))
+        for found, expected in zip(results, ground_truth)
+    )
+    return hits / ground_truth.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--from-index", help="Saved index version directory")
+    parser.add_argument("--num-vectors", type=int, default=100_000)
+    parser.add_argument("--dimension", type=int, default=4096)
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 16, 64])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.from_index:
+        source = faiss.read_index(os.path.join(args.from_index, "index.faiss"))
+        vectors = reconstruct_all(source).astype(np.float32)
+    else:
+        vectors = _synthetic_vectors(args.num_vectors, args.dimension, args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    sample = rng.choice(len(vectors), size=args.num_queries, replace=False)
+    noise = rng.standard_normal((args.num_queries, vectors.shape[1]), dtype=np.float32)
+    queries = vectors[sample] + 0.05 * noise
+    print(f"{len(vectors)} vectors, dimension {vectors.shape[1]}, k={args.k}")
+
+    index_settings = settings.VECTOR_STORE.INDEX
+    runs = [(FLAT, None)]
+    runs += [(HNSW, ef) for ef in args.ef_search]
+    runs += [(IVF_PQ, nprobe) for nprobe in args.nprobe]
+
+    built = {}
+    ground_truth = None
+    print(
+        f"{'index':<8} {'param':>10} {'build s':>9} {'MB':>9} "
+        f"{'recall':>7} {'p50 ms':>8} {'p95 ms':>8}"
+    )
+    for index_type, param in runs:
+        if index_type not in built:
+            start = time.perf_counter()
+            index = build_index(index_type, vectors, index_settings)
+            built[index_type] = (index, time.perf_counter() - start)
+        index, build_time = built[index_type]
+        if index_type == HNSW:
+            index.hnsw.efSearch = param
+        elif index_type == IVF_PQ:
+            index.nprobe = param
+
+        results, latencies = _search_latencies(index, queries, args.k)
+        if ground_truth is None:
+            ground_truth = results
+        size_mb = faiss.serialize_index(index).nbytes / 1024 / 1024
+        if index_type == HNSW:
+            label = f"ef={param}"
+        elif index_type == IVF_PQ:
+            label = f"nprobe={param}"
+        else:
+            label = "-"
+        print(
+            f"{index_type:<8} {label:>10} {build_time:9.1f} {size_mb:9.1f} "
+            f"{_recall(results, ground_truth):7.3f} "
+            f"{np.percentile(latencies, 50) * 1000:8.2f} "
+            f"{np.percentile(latencies, 95) * 1000:8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
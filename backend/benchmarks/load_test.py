@@ -0,0 +1,340 @@
+"""Replay questions against the QA API and report latency percentiles.
+
+Questions come from a JSONL file, one object per line with a "question" (or
+"title") field, or are generated. Without --base-url the app runs in-process
+on the deterministic fake model providers, with its data in a temporary
+directory, so no model server is needed. Run from the backend directory:
+
+    python -m benchmarks.load_test --synthetic 200 --concurrency 8
+    python -m benchmarks.load_test --replay ../requests.jsonl --rate 5 --llm-latency 1
+    python -m benchmarks.load_test --base-url http://localhost:8000 --skip-ingestion
+
+Retrieval and generation times come from the Server-Timing header of
+/api/qa/answer; answers served from the answer cache have neither. With
+--recordings, in-process model calls are recorded to or replayed from that
+file (see [recording] in config.toml), so a run can be repeated exactly.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import tempfile
+import time
+from collections import Counter, defaultdict
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Dict, List
+
+import httpx
+
+WORDS = (
+    "pump valve sensor filter motor controller pressure flow limit alarm "
+    "calibration maintenance interval schedule inspection replacement "
+    "temperature voltage current signal cable connector housing seal "
+    "startup shutdown reset fault warning display setting mode manual"
+).split()
+
+QUESTION_TEMPLATES = (
+    "What is the {0} {1} for the {2}?",
+    "How do I reset the {0} after a {1} {2}?",
+    "Which {0} setting affects the {1} {2}?",
+    "When is {0} {1} of the {2} required?",
+)
+
+
+def _sentence(rng: random.Random) -> str:
+    return " ".join(rng.choices(WORDS, k=rng.randint(8, 14))).capitalize() + "."
+
+
+def _synthetic_pdf(path: str, pages: int, seed: int):
+    # Minimal text-only PDF, enough for the PDF loader to extract every line.
+    rng = random.Random(seed)
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for _ in range(pages):
+        lines = " ".join(f"({_sentence(rng)}) Tj T*" for _ in range(45))
+        stream = f"BT /F1 10 Tf 14 TL 50 760 Td {lines} ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>"
+
+    content, offsets = b"%PDF-1.4\n", []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(content))
+        content += f"{number} 0 obj\n{body}\nendobj\n".encode()
+    xref = len(content)
+    content += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    content += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    content += (
+        f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+        f"startxref\n{xref}\n%%EOF\n"
+    ).encode()
+    with open(path, "wb") as f:
+        f.write(content)
+
+
+def _synthetic_questions(count: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    return [
+        rng.choice(QUESTION_TEMPLATES).format(*rng.sample(WORDS, 3))
+        for _ in range(count)
+    ]
+
+
+def _replayed_questions(path: str) -> List[str]:
+    questions = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                question = record.get("question") or record.get("title")
+                if question:
+                    questions.append(question)
+    return questions
+
+
+def _in_process_app(workdir: str, args):
+    # Settings are read when services are first built, so pointing them at
+    # the fake providers and a scratch directory must precede importing main.
+    from app.core.config import ProviderSettings, RecordingSettings, settings
+
+    settings.LLM = ProviderSettings(PROVIDER_TYPE="fake", NAME="fake")
+    settings.EMBEDDING = ProviderSettings(PROVIDER_TYPE="fake", NAME="fake")
+    settings.UPLOAD_DIR = os.path.join(workdir, "uploads")
+    settings.DATABASE_URL = f"sqlite:///{os.path.join(workdir, 'sql_app.db')}"
+    settings.VECTOR_STORE.INDEX_DIR = os.path.join(workdir, "indexes")
+    settings.EMBEDDING_CACHE.PATH = os.path.join(workdir, "embedding_cache.db")
+    settings.WANDB_API_KEY = ""
+    if args.recordings:
+        settings.RECORDING = RecordingSettings(
+            MODE=args.recording_mode, PATH=args.recordings
+        )
+
+    from app.models import model_service
+    from app.models.embedding.fake import FakeEmbedding
+    from app.models.llm.fake import FakeLLM
+
+    model_service.llm_factories["fake"] = FakeLLM(latency_seconds=args.llm_latency)
+    model_service.embedding_factories["fake"] = FakeEmbedding(
+        latency_seconds=args.embedding_latency
+    )
+
+    from main import app
+
+    return app
+
+
+@asynccontextmanager
+async def _lifespan(app):
+    # ASGITransport skips startup and shutdown handlers; run the ASGI
+    # lifespan protocol against the app directly.
+    receive, send = asyncio.Queue(), asyncio.Queue()
+    scope = {"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}
+    task = asyncio.create_task(app(scope, receive.get, send.put))
+    await receive.put({"type": "lifespan.startup"})
+    message = await send.get()
+    if message["type"] != "lifespan.startup.complete":
+        raise RuntimeError(f"App startup failed: {message.get('message')}")
+    try:
+        yield
+    finally:
+        await receive.put({"type": "lifespan.shutdown"})
+        await send.get()
+        await task
+
+
+async def _ingest(client: httpx.AsyncClient, path: str) -> float:
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        response = await client.post(
+            "/api/files/upload",
+            files={"file": (os.path.basename(path), f, "application/pdf")},
+            data={"original_filename": os.path.basename(path)},
+        )
+    response.raise_for_status()
+    job_id = response.json()["job_id"]
+    while True:
+        job = (await client.get(f"/api/files/jobs/{job_id}")).json()
+        if job["state"] == "COMPLETED":
+            return time.perf_counter() - start
+        if job["state"] == "FAILED":
+            raise RuntimeError(f"Ingestion of {path} failed: {job['error']}")
+        await asyncio.sleep(0.05)
+
+
+def _parse_server_timing(header: str) -> Dict[str, float]:
+    timings = {}
+    for entry in filter(None, (part.strip() for part in header.split(","))):
+        name, *params = entry.split(";")
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "dur":
+                timings[name.strip()] = float(value) / 1000
+    return timings
+
+
+class Results:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Counter = Counter()
+
+    def record(self, status: str, latency: float, timings: Dict[str, float]):
+        self.statuses[status] += 1
+        if status == "200":
+            self.latencies["end-to-end"].append(latency)
+            for stage in ("retrieval", "generation"):
+                if stage in timings:
+                    self.latencies[stage].append(timings[stage])
+
+
+async def _ask(client: httpx.AsyncClient, question: str, results: Results):
+    start = time.perf_counter()
+    try:
+        response = await client.post("/api/qa/answer", json={"question": question})
+    except httpx.HTTPError as e:
+        results.record(type(e).__name__, time.perf_counter() - start, {})
+        return
+    results.record(
+        str(response.status_code),
+        time.perf_counter() - start,
+        _parse_server_timing(response.headers.get("Server-Timing", "")),
+    )
+
+
+async def _closed_loop(client, questions: List[str], total: int, concurrency: int):
+    # Each worker sends its next question as soon as the last one returns.
+    results, counter = Results(), iter(range(total))
+
+    async def worker():
+        for i in counter:
+            await _ask(client, questions[i % len(questions)], results)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results
+
+
+async def _open_loop(client, questions: List[str], total: int, rate: float, seed: int):
+    # Poisson arrivals at the given rate, whether or not earlier requests
+    # have finished, so queueing shows up as latency instead of lower load.
+    results, rng, tasks = Results(), random.Random(seed), []
+    for i in range(total):
+        question = questions[i % len(questions)]
+        tasks.append(asyncio.create_task(_ask(client, question, results)))
+        await asyncio.sleep(rng.expovariate(rate))
+    await asyncio.gather(*tasks)
+    return results
+
+
+def _percentile(values: List[float], quantile: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(quantile * len(ordered)) - 1)]
+
+
+def _report(ingestion: List[float], results: Results, elapsed: float, total: int):
+    phases = {"ingestion": ingestion, **results.latencies}
+    print(f"{'phase':<12} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for phase in ("ingestion", "retrieval", "generation", "end-to-end"):
+        values = phases.get(phase) or []
+        if not values:
+            print(f"{phase:<12} {0:>6} {'-':>9} {'-':>9} {'-':>9}")
+            continue
+        p50, p95, p99 = (_percentile(values, q) * 1000 for q in (0.50, 0.95, 0.99))
+        print(f"{phase:<12} {len(values):>6} {p50:9.1f} {p95:9.1f} {p99:9.1f}")
+
+    succeeded = results.statuses.get("200", 0)
+    errors = total - succeeded
+    print(
+        f"{total} requests in {elapsed:.2f}s: {succeeded / elapsed:.2f} answers/s, "
+        f"{errors} errors ({errors / total:.1%})"
+    )
+    if errors:
+        failures = {s: n for s, n in results.statuses.items() if s != "200"}
+        print(f"errors by status: {failures}")
+
+
+async def _run(args, app=None):
+    if args.replay:
+        questions = _replayed_questions(args.replay)
+    else:
+        questions = _synthetic_questions(args.synthetic, args.seed)
+    if not questions:
+        raise SystemExit("No questions to send")
+    total = args.requests or len(questions)
+
+    async with AsyncExitStack() as stack:
+        if app is not None:
+            await stack.enter_async_context(_lifespan(app))
+            client = httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=app),
+                base_url="http://load-test",
+                timeout=args.timeout,
+            )
+        else:
+            client = httpx.AsyncClient(
+                base_url=args.base_url,
+                timeout=args.timeout,
+                limits=httpx.Limits(max_connections=None),
+            )
+        await stack.enter_async_context(client)
+
+        ingestion = []
+        if not args.skip_ingestion:
+            documents = args.documents
+            if not documents:
+                documents = [os.path.join(args.workdir, "synthetic.pdf")]
+                _synthetic_pdf(documents[0], args.pages, args.seed)
+            for path in documents:
+                ingestion.append(await _ingest(client, path))
+
+        start = time.perf_counter()
+        if args.rate:
+            results = await _open_loop(client, questions, total, args.rate, args.seed)
+        else:
+            results = await _closed_loop(client, questions, total, args.concurrency)
+        elapsed = time.perf_counter() - start
+
+    _report(ingestion, results, elapsed, total)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", help="Benchmark a running server instead")
+    parser.add_argument("--replay", help="JSONL file of questions to send")
+    parser.add_argument("--synthetic", type=int, default=100)
+    parser.add_argument("--requests", type=int, help="Default: one per question")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rate", type=float, help="Open-loop arrivals per second")
+    parser.add_argument("--documents", nargs="+", help="PDFs to ingest first")
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--skip-ingestion", action="store_true")
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--embedding-latency", type=float, default=0.0)
+    parser.add_argument("--recordings", help="Model call recordings file")
+    parser.add_argument(
+        "--recording-mode", choices=("record", "replay", "strict"), default="replay"
+    )
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="load-test-") as workdir:
+        args.workdir = workdir
+        app = None
+        if not args.base_url:
+            app = _in_process_app(workdir, args)
+        asyncio.run(_run(args, app))
+
+
+if __name__ == "__main__":
+    main()
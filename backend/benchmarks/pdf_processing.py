@@ -0,0 +1,60 @@
+"""Compare serial and parallel PDF chunking.
+
+Run from the backend directory:
+
+    python -m benchmarks.pdf_processing path/to/manual.pdf --workers 2 4 8
+"""
+
+import argparse
+import time
+
+from pypdf import PdfReader
+
+from app.services.document_processor import PDFProcessor
+
+
+def _time_call(fn, repeat: int):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("file_path")
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--pages-per-task", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    page_count = len(PdfReader(args.file_path).pages)
+    print(f"{args.file_path}: {page_count} pages")
+
+    serial = PDFProcessor()
+    serial_time, serial_chunks = _time_call(
+        lambda: serial.process_serial(args.file_path), args.repeat
+    )
+    print(f"serial      {serial_time:8.2f}s  {len(serial_chunks)} chunks")
+
+    serial_pages = [chunk.metadata["page"] for chunk in serial_chunks]
+    for workers in args.workers:
+        processor = PDFProcessor(
+            max_workers=workers, pages_per_task=args.pages_per_task
+        )
+        parallel_time, chunks = _time_call(
+            lambda: processor.process_parallel(args.file_path, page_count),
+            args.repeat,
+        )
+        in_order = [chunk.metadata["page"] for chunk in chunks] == serial_pages
+        print(
+            f"workers={workers:<3} {parallel_time:8.2f}s  {len(chunks)} chunks  "
+            f"speedup {serial_time / parallel_time:5.2f}x  page order matches: {in_order}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Measure /api/qa/answer throughput at increasing numbers of in-flight requests.
+
+Start the backend with a document loaded, then run from the backend directory:
+
+    python -m benchmarks.qa_concurrency --concurrency 1 2 4 8 16 --requests 32
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+DEFAULT_QUESTIONS = [
+    "What is this document about?",
+    "Summarise the main points.",
+    "What are the key requirements?",
+    "Which steps are described first?",
+]
+
+
+async def _worker(client, url, questions, queue, latencies, errors):
+    while True:
+        try:
+            i = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        start = time.perf_counter()
+        try:
+            response = await client.post(
+                url, json={"question": questions[i % len(questions)]}
+            )
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+        except httpx.HTTPError:
+            errors.append(i)
+
+
+async def _run_level(base_url, questions, concurrency, total, timeout):
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(i)
+    latencies, errors = [], []
+    url = f"{base_url}/api/qa/answer"
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(
+                _worker(client, url, questions, queue, latencies, errors)
+                for _ in range(concurrency)
+            )
+        )
+        elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--timeout", type=float, default=600.0)
+    args = parser.parse_args()
+
+    print(f"{'in-flight':>9} {'req/s':>8} {'mean s':>8} {'max s':>8} {'errors':>7}")
+    for concurrency in args.concurrency:
+        latencies, errors, elapsed = await _run_level(
+            args.base_url, DEFAULT_QUESTIONS, concurrency, args.requests, args.timeout
+        )
+        mean = statistics.mean(latencies) if latencies else float("nan")
+        worst = max(latencies) if latencies else float("nan")
+        print(
+            f"{concurrency:>9} {len(latencies) / elapsed:8.2f} {mean:8.2f} "
+            f"{worst:8.2f} {len(errors):>7}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,123 @@
+"""Exercise replica routing against local stub model servers.
+
+Starts one stub HTTP server per replica, each with its own response delay and
+failure rate, then sends requests through RoutingTransport. Run from the
+backend directory:
+
+    python -m benchmarks.replica_routing --delays 0.05 0.05 0.5 --failure-rates 0 0 0
+    python -m benchmarks.replica_routing --failure-rates 0 0 1 --hedge-after 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+from app.models.routing import EndpointRouter, RoutingTransport
+
+
+def _stub_server(delay: float, failure_rate: float) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(delay)
+            if random.random() < failure_rate:
+                self.send_response(500)
+                self.end_headers()
+                return
+            body = json.dumps({"response": "ok", "port": self.server.server_port})
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            try:
+                self.wfile.write(body.encode())
+            except ConnectionError:
+                pass  # A hedged request whose twin answered first.
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def _run(router: EndpointRouter, base_url: str, total: int, concurrency: int):
+    latencies, errors = [], 0
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(
+        base_url=base_url, transport=RoutingTransport(router), timeout=60
+    ) as client:
+
+        async def one():
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/api/generate", json={"prompt": "hi"})
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        return latencies, errors, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--delays", type=float, nargs="+", default=[0.05, 0.05, 0.5])
+    parser.add_argument("--failure-rates", type=float, nargs="+")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--eject-after", type=int, default=3)
+    parser.add_argument("--ejection-seconds", type=float, default=5.0)
+    parser.add_argument("--hedge-after", type=float, default=0.0)
+    args = parser.parse_args()
+
+    failure_rates = args.failure_rates or [0.0] * len(args.delays)
+    servers = [
+        _stub_server(delay, failure_rate)
+        for delay, failure_rate in zip(args.delays, failure_rates)
+    ]
+    urls = [f"http://127.0.0.1:{server.server_port}" for server in servers]
+    router = EndpointRouter(
+        urls,
+        eject_after_failures=args.eject_after,
+        ejection_seconds=args.ejection_seconds,
+        hedge_after_seconds=args.hedge_after,
+    )
+    latencies, errors, elapsed = asyncio.run(
+        _run(router, urls[0], args.requests, args.concurrency)
+    )
+    for server in servers:
+        server.shutdown()
+
+    latencies.sort()
+    p50 = statistics.median(latencies) if latencies else float("nan")
+    p95 = latencies[int(0.95 * (len(latencies) - 1))] if latencies else float("nan")
+    print(
+        f"{args.requests} requests in {elapsed:.2f}s, {errors} errors, "
+        f"p50 {p50 * 1000:.0f}ms, p95 {p95 * 1000:.0f}ms"
+    )
+    print(
+        f"{'replica':<24} {'delay':>6} {'fail':>5} {'reqs':>5} "
+        f"{'errors':>6} {'hedges':>6}"
+    )
+    for url, delay, failure_rate in zip(urls, args.delays, failure_rates):
+        stats = router.stats()[url]
+        print(
+            f"{url:<24} {delay:6.2f} {failure_rate:5.2f} {stats['requests']:>5} "
+            f"{stats['failures']:>6} {stats['hedges']:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,8 @@ from fastapi.responses import JSONResponse
 
 from app.api.routes import router as api_router
 from app.core.config import settings
+from app.core.dependencies import get_evaluation_queue, load_persisted_qa_service
+from app.factories.llm_factory import check_llm_available
 from app.core.logger import LoggerMiddleware, get_logger
 
 logger = get_logger()
@@ -15,6 +17,29 @@ app.add_middleware(LoggerMiddleware)
 app.include_router(api_router, prefix="/api")
 
 
+@app.on_event("startup")
+async def restore_index():
+    load_persisted_qa_service()
+
+
+@app.on_event("startup")
+async def check_models():
+    try:
+        await check_llm_available()
+    except (ConnectionError, ValueError) as e:
+        logger.warning(f"LLM not available at startup: {e}")
+
+
+@app.on_event("startup")
+async def start_evaluation_queue():
+    get_evaluation_queue().start()
+
+
+@app.on_event("shutdown")
+async def stop_evaluation_queue():
+    await get_evaluation_queue().stop()
+
+
 # Add exception handler for logging unhandled exceptions
 @app.exception_handler(Exception)
 async def unhandled_exception_handler(request: Request, exc: Exception):
@@ -0,0 +1,29 @@
+import os
+import sys
+import tempfile
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Settings are read from config.toml in the working directory on import.
+os.chdir(BACKEND_DIR)
+sys.path.insert(0, BACKEND_DIR)
+
+from app.core.config import settings  # noqa: E402
+
+# Keep the database and log that app modules open on import out of the tree.
+SCRATCH_DIR = tempfile.mkdtemp(prefix="backend-tests-")
+settings.DATABASE_URL = f"sqlite:///{os.path.join(SCRATCH_DIR, 'sql_app.db')}"
+settings.LOGGING.FILE = os.path.join(SCRATCH_DIR, "app.log")
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    from app.models.evaluation import Base
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'evaluations.db'}")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
@@ -0,0 +1,47 @@
+from app.models.qa import Answer
+from app.services.answer_cache import SemanticAnswerCache
+
+
+def _answer(text: str) -> Answer:
+    return Answer(answer=text, sources=[])
+
+
+def _cache(max_entries: int = 2) -> SemanticAnswerCache:
+    return SemanticAnswerCache(
+        similarity_threshold=0.95, max_entries=max_entries, ttl_seconds=3600
+    )
+
+
+def test_lookup_matches_similar_questions_only():
+    cache = _cache()
+    cache.store("reset pump", [1.0, 0.0, 0.0], _answer("pump"), 1.0, "v1")
+    cache.store("reset valve", [0.0, 1.0, 0.0], _answer("valve"), 1.0, "v1")
+
+    assert cache.lookup([0.99, 0.05, 0.0], "v1").answer == "pump"
+    assert cache.lookup([0.0, 2.0, 0.1], "v1").answer == "valve"
+    assert cache.lookup([0.0, 0.0, 1.0], "v1") is None
+    assert cache.stats()["hits"] == 2
+
+
+def test_least_recently_used_entry_is_evicted_and_its_row_reused():
+    cache = _cache()
+    cache.store("pump", [1.0, 0.0, 0.0], _answer("pump"), 1.0, "v1")
+    cache.store("valve", [0.0, 1.0, 0.0], _answer("valve"), 1.0, "v1")
+    cache.lookup([1.0, 0.0, 0.0], "v1")
+    cache.store("filter", [0.0, 0.0, 1.0], _answer("filter"), 1.0, "v1")
+
+    assert cache.lookup([0.0, 1.0, 0.0], "v1") is None
+    assert cache.lookup([1.0, 0.0, 0.0], "v1").answer == "pump"
+    assert cache.lookup([0.0, 0.0, 1.0], "v1").answer == "filter"
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["evictions"] == 1
+
+
+def test_new_index_version_drops_every_entry():
+    cache = _cache()
+    cache.store("pump", [1.0, 0.0, 0.0], _answer("pump"), 1.0, "v1")
+
+    assert cache.lookup([1.0, 0.0, 0.0], "v2") is None
+    cache.store("valve", [0.0, 1.0, 0.0], _answer("valve"), 1.0, "v2")
+    assert cache.stats()["entries"] == 1
+    assert cache.stats()["invalidations"] == 1
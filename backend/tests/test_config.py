@@ -0,0 +1,15 @@
+from app.core.config import load_config
+
+
+def test_vector_store_index_section_is_loaded(tmp_path):
+    config = open("config.toml").read()
+    config = config.replace('TYPE = "auto"', 'TYPE = "hnsw"')
+    config = config.replace("HNSW_M = 32", "HNSW_M = 48")
+    path = tmp_path / "config.toml"
+    path.write_text(config)
+
+    settings = load_config(str(path))
+
+    assert settings.VECTOR_STORE.INDEX.TYPE == "hnsw"
+    assert settings.VECTOR_STORE.INDEX.HNSW_M == 48
+    assert settings.VECTOR_STORE.KEEP_VERSIONS == 3
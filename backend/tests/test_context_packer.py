@@ -0,0 +1,42 @@
+from langchain.docstore.document import Document
+
+from app.services.context_packer import ContextPacker
+
+
+def _packer(max_tokens: int = 100) -> ContextPacker:
+    return ContextPacker(max_tokens=max_tokens, chunk_overlap=40, chars_per_token=1)
+
+
+def test_chunks_are_packed_in_rank_order_whatever_their_scores():
+    ranked = [
+        (Document(page_content="first " * 5), -3.0),
+        (Document(page_content="second " * 5), 7.0),
+        (Document(page_content="third " * 20), 9.0),
+        (Document(page_content="fourth " * 5), 0.5),
+    ]
+
+    packed = _packer().pack(ranked)
+
+    # The third chunk no longer fits; later, smaller ones still do.
+    assert [document.page_content.split()[0] for document in packed] == [
+        "first",
+        "second",
+        "fourth",
+    ]
+    assert [document.metadata["relevance_score"] for document in packed] == [
+        -3.0,
+        7.0,
+        0.5,
+    ]
+
+
+def test_overlap_with_a_packed_neighbour_is_trimmed():
+    shared = "the pump must be vented before restart"
+    ranked = [
+        (Document(page_content=f"Step one. {shared}", metadata={"source": "a"}), 1),
+        (Document(page_content=f"{shared} and step two.", metadata={"source": "a"}), 1),
+    ]
+
+    packed = _packer().pack(ranked)
+
+    assert packed[1].page_content == "and step two."
@@ -0,0 +1,142 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from langchain.docstore.document import Document
+
+from app.models.embedding.fake import HashingEmbeddings
+from app.services.corpus_service import CorpusService
+from app.services.vector_store_service import FAISSVectorStoreService
+
+
+def _chunks(*texts: str) -> List[Document]:
+    return [
+        Document(page_content=text, metadata={"page": page})
+        for page, text in enumerate(texts)
+    ]
+
+
+def _corpus(tmp_path) -> CorpusService:
+    return CorpusService(FAISSVectorStoreService(index_dir=str(tmp_path)))
+
+
+def test_update_reuses_unchanged_chunks_and_removes_stale_ones(tmp_path):
+    corpus, embeddings = _corpus(tmp_path), HashingEmbeddings(32, 0)
+    record, _ = corpus.add_document(
+        "manual.pdf", "v1.pdf", "v1", _chunks("pump", "valve"), embeddings
+    )
+
+    updated, stats = corpus.update_document(
+        record.document_id, "v2.pdf", "v2", _chunks("valve", "filter"), embeddings
+    )
+
+    assert stats == {"chunks_added": 1, "chunks_reused": 1, "chunks_removed": 1}
+    assert updated.chunk_ids[0] == record.chunk_ids[1]
+    docstore = corpus.vector_store.docstore
+    assert docstore.search(updated.chunk_ids[0]).metadata == {"page": 0}
+    assert sorted(corpus.vector_store.index_to_docstore_id.values()) == sorted(
+        updated.chunk_ids
+    )
+
+
+def test_update_with_no_text_in_common(tmp_path):
+    corpus, embeddings = _corpus(tmp_path), HashingEmbeddings(32, 0)
+    record, _ = corpus.add_document(
+        "manual.pdf", "v1.pdf", "v1", _chunks("pump", "valve"), embeddings
+    )
+
+    updated, stats = corpus.update_document(
+        record.document_id, "v2.pdf", "v2", _chunks("filter", "motor"), embeddings
+    )
+
+    assert stats == {"chunks_added": 2, "chunks_reused": 0, "chunks_removed": 2}
+    assert corpus.vector_store.index.ntotal == 2
+    assert corpus.documents[record.document_id] == updated
+
+
+def test_changes_are_replayed_from_the_delta_log(tmp_path):
+    embeddings = HashingEmbeddings(32, 0)
+    corpus = CorpusService(
+        FAISSVectorStoreService(index_dir=str(tmp_path)), compact_after_deltas=100
+    )
+    kept, _ = corpus.add_document(
+        "manual.pdf", "v1.pdf", "v1", _chunks("pump", "valve"), embeddings
+    )
+    dropped, _ = corpus.add_document(
+        "guide.pdf", "g.pdf", "g", _chunks("motor"), embeddings
+    )
+    kept, _ = corpus.update_document(
+        kept.document_id, "v2.pdf", "v2", _chunks("valve", "filter"), embeddings
+    )
+    corpus.delete_document(dropped.document_id)
+
+    # No snapshot has been written; only the per-document deltas.
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["deltas"]
+    restored = _corpus(tmp_path)
+    assert restored.load(embeddings)
+    assert restored.documents == corpus.documents
+    assert restored.version == corpus.version
+    assert restored.vector_store.index_to_docstore_id == (
+        corpus.vector_store.index_to_docstore_id
+    )
+    assert restored.vector_store.docstore.search(kept.chunk_ids[0]).metadata == {
+        "page": 0
+    }
+
+
+def test_compaction_folds_deltas_into_a_snapshot(tmp_path):
+    embeddings = HashingEmbeddings(32, 0)
+    service = FAISSVectorStoreService(index_dir=str(tmp_path), keep_versions=1)
+    corpus = CorpusService(service, compact_after_deltas=100)
+    corpus.add_document("manual.pdf", "m.pdf", "m", _chunks("pump"), embeddings)
+    corpus.add_document("guide.pdf", "g.pdf", "g", _chunks("motor"), embeddings)
+
+    corpus.compact()
+    corpus.add_document("notes.pdf", "n.pdf", "n", _chunks("valve"), embeddings)
+
+    # Deltas folded into the snapshot are pruned; later ones are replayed.
+    assert [sequence for sequence, _ in service.load_deltas(0)] == [3]
+    restored = _corpus(tmp_path)
+    assert restored.load(embeddings)
+    assert sorted(r.original_filename for r in restored.list_documents()) == [
+        "guide.pdf",
+        "manual.pdf",
+        "notes.pdf",
+    ]
+    assert restored.vector_store.index.ntotal == 3
+
+
+def test_concurrent_uploads_of_one_file_make_one_document(tmp_path):
+    corpus, embeddings = _corpus(tmp_path), HashingEmbeddings(32, 0)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(
+            executor.map(
+                lambda version: corpus.upsert_document(
+                    "manual.pdf",
+                    f"{version}.pdf",
+                    version,
+                    _chunks("pump", version),
+                    embeddings,
+                ),
+                ["v1", "v2", "v3", "v4"],
+            )
+        )
+
+    assert len(corpus.documents) == 1
+    assert len({record.document_id for record, _ in results}) == 1
+    assert corpus.vector_store.index.ntotal == 2
+
+
+def test_upsert_adds_when_the_previous_version_was_deleted(tmp_path):
+    corpus, embeddings = _corpus(tmp_path), HashingEmbeddings(32, 0)
+    record, _ = corpus.upsert_document(
+        "manual.pdf", "v1.pdf", "v1", _chunks("pump"), embeddings
+    )
+    corpus.delete_document(record.document_id)
+
+    readded, stats = corpus.upsert_document(
+        "manual.pdf", "v2.pdf", "v2", _chunks("pump"), embeddings
+    )
+
+    assert readded.document_id != record.document_id
+    assert stats["chunks_added"] == 1
+    assert list(corpus.documents) == [readded.document_id]
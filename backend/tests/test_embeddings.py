@@ -0,0 +1,51 @@
+import json
+from typing import List
+
+import httpx
+
+from app.models.base import ModelConfig
+from app.models.embedding.fake import HashingEmbeddings
+from app.models.embedding.ollama import RoutedOllamaEmbeddings
+from app.models.recording import RECORD, STRICT, ModelRecorder, RecordingStore
+
+
+class CountingEmbeddings(HashingEmbeddings):
+    def __init__(self):
+        super().__init__(16, 0.0)
+        self.queries: List[str] = []
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        self.queries.extend(texts)
+        return super().embed_queries(texts)
+
+
+def test_ollama_queries_carry_the_query_instruction():
+    prompts = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        prompts.append(json.loads(request.content)["prompt"])
+        return httpx.Response(200, json={"embedding": [float(len(prompts))]})
+
+    embeddings = RoutedOllamaEmbeddings(
+        model="nomic-embed-text",
+        http_client=httpx.Client(
+            base_url="http://ollama", transport=httpx.MockTransport(handler)
+        ),
+    )
+
+    assert embeddings.embed_queries(["pump", "valve"]) == [[1.0], [2.0]]
+    assert prompts == ["query: pump", "query: valve"]
+
+
+def test_recorded_queries_replay_as_single_queries(tmp_path):
+    config = ModelConfig(provider="fake", model_name="hashing")
+    store = RecordingStore(str(tmp_path / "recordings.db"))
+    model = CountingEmbeddings()
+    recording = ModelRecorder(store, RECORD).wrap_embedding_model(model, config)
+
+    vectors = recording.embed_queries(["pump", "valve"])
+
+    assert model.queries == ["pump", "valve"]
+    replay = ModelRecorder(store, STRICT).wrap_embedding_model(model, config)
+    assert replay.embed_queries(["valve"]) == [vectors[1]]
+    assert replay.embed_query("pump") == vectors[0]
@@ -0,0 +1,157 @@
+import asyncio
+import time
+from typing import List
+
+import pytest
+from app.models.evaluation import EvaluationJob, EvaluationJobState, EvaluationRecord
+from app.models.qa import Answer, EvaluationResult, Relevance
+from app.services.evaluation_queue import EvaluationQueue
+from app.services.evaluation_sampler import EvaluationSampler
+from app.services.evaluation_service import EvaluationService
+
+
+class JudgeStub(EvaluationService):
+    """Judges every answer RELEVANT, except questions mentioning "fail"."""
+
+    def __init__(self):
+        self.llm_scheduler = None
+
+    async def evaluate_batch(self, jobs: List[EvaluationJob]):
+        return [
+            RuntimeError("judge unavailable")
+            if "fail" in job.question
+            else EvaluationResult(relevance=Relevance.RELEVANT, explanation="ok")
+            for job in jobs
+        ]
+
+
+def _queue(session_factory, **kwargs) -> EvaluationQueue:
+    options = dict(
+        workers=1,
+        batch_size=2,
+        max_attempts=2,
+        retry_backoff_seconds=10,
+        poll_seconds=1,
+        lease_seconds=60,
+    )
+    options.update(kwargs)
+    return EvaluationQueue(
+        JudgeStub(),
+        EvaluationSampler(1.0, {}, 0.0),
+        session_factory=session_factory,
+        **options,
+    )
+
+
+def _answer(text: str = "Open the valve [1].") -> Answer:
+    return Answer(answer=text, sources=["passage"], document_ids=["doc"])
+
+
+def _jobs(session_factory) -> List[EvaluationJob]:
+    with session_factory() as db:
+        return db.query(EvaluationJob).order_by(EvaluationJob.id).all()
+
+
+def test_due_jobs_are_claimed_once_in_batches(session_factory):
+    queue = _queue(session_factory)
+    asyncio.run(
+        queue.enqueue([(f"question {i}", _answer()) for i in range(3)], sample=False)
+    )
+
+    first, second = queue._claim(), queue._claim()
+
+    assert [len(first), len(second)] == [2, 1]
+    assert len({job.id for job in first + second}) == 3
+    assert queue._claim() == []
+    assert queue.stats()["running"] == 3
+
+
+def test_duplicate_answers_are_queued_once(session_factory):
+    queue = _queue(session_factory)
+    items = [("reset the pump", _answer()), ("reset the pump", _answer())]
+    asyncio.run(queue.enqueue(items, sample=False))
+    asyncio.run(queue._process(queue._claim()))
+
+    # Already evaluated; a different answer to the same question is new.
+    asyncio.run(queue.enqueue(items[:1], sample=False))
+    asyncio.run(
+        queue.enqueue([("reset the pump", _answer("Press reset."))], sample=False)
+    )
+
+    assert queue.duplicates == 2
+    assert [job.answer for job in _jobs(session_factory)] == ["Press reset."]
+
+
+def test_success_stores_the_evaluation_and_deletes_the_job(session_factory):
+    queue = _queue(session_factory)
+    asyncio.run(queue.enqueue([("reset the pump", _answer())], sample=False))
+
+    asyncio.run(queue._process(queue._claim()))
+
+    assert _jobs(session_factory) == []
+    with session_factory() as db:
+        record = db.query(EvaluationRecord).one()
+    assert record.relevance == Relevance.RELEVANT.value
+    assert queue.completed == 1
+
+
+def test_failed_judgement_backs_off_then_gives_up(session_factory):
+    queue = _queue(session_factory)
+    asyncio.run(queue.enqueue([("fail to reset", _answer())], sample=False))
+
+    asyncio.run(queue._process(queue._claim()))
+    (job,) = _jobs(session_factory)
+    assert job.state == EvaluationJobState.PENDING.value
+    assert job.attempts == 1
+    assert job.available_at == pytest.approx(time.time() + 10, abs=1)
+    assert queue._claim() == []
+
+    with session_factory() as db:
+        db.query(EvaluationJob).update({EvaluationJob.available_at: 0})
+        db.commit()
+    asyncio.run(queue._process(queue._claim()))
+
+    (job,) = _jobs(session_factory)
+    assert job.state == EvaluationJobState.FAILED.value
+    assert job.attempts == 2
+    assert "judge unavailable" in job.last_error
+    assert queue.retried == 1
+
+
+def test_only_lapsed_leases_are_claimed_by_other_processes(session_factory):
+    owner, sibling = _queue(session_factory), _queue(session_factory)
+    asyncio.run(owner.enqueue([("reset the pump", _answer())], sample=False))
+    jobs = owner._claim()
+
+    # A live claim, renewed by its owner, is left alone.
+    owner._renew(jobs[0].claim)
+    assert sibling._claim() == []
+
+    with session_factory() as db:
+        db.query(EvaluationJob).update({EvaluationJob.claimed_at: time.time() - 61})
+        db.commit()
+    reclaimed = sibling._claim()
+    assert [job.id for job in reclaimed] == [job.id for job in jobs]
+
+    # The original owner finishing late must not touch the reclaimed job.
+    asyncio.run(owner._process(jobs))
+    assert owner.completed == 0
+    (job,) = _jobs(session_factory)
+    assert job.claim == reclaimed[0].claim
+
+    asyncio.run(sibling._process(reclaimed))
+    assert sibling.completed == 1
+    assert _jobs(session_factory) == []
+
+
+def test_released_claims_are_pending_again(session_factory):
+    queue = _queue(session_factory)
+    asyncio.run(queue.enqueue([("reset the pump", _answer())], sample=False))
+    (job,) = queue._claim()
+
+    assert queue._release([job.claim]) == 1
+
+    (job,) = _jobs(session_factory)
+    assert job.state == EvaluationJobState.PENDING.value
+    assert job.claim is None
+    assert len(queue._claim()) == 1
@@ -0,0 +1,78 @@
+import math
+
+import numpy as np
+import pytest
+
+from app.models.qa import Answer
+from app.services.evaluation_sampler import MIN_CONFIDENCE_HISTORY, EvaluationSampler
+
+
+def _answer(confidence, document_ids=()) -> Answer:
+    return Answer(
+        answer="", sources=[], document_ids=list(document_ids), confidence=confidence
+    )
+
+
+def _l2_confidences(count: int) -> np.ndarray:
+    # What the FAISS relevance function yields for an L2 index over
+    # unnormalised 4096-dim embeddings: 1 - squared distance / sqrt(2),
+    # with distances in the thousands, so every score is far below zero.
+    rng = np.random.default_rng(0)
+    distances = rng.gamma(shape=25.0, scale=160.0, size=count)
+    return 1.0 - distances / math.sqrt(2)
+
+
+def _sampler(low_confidence_quantile: float, sample_rate: float = 0.05):
+    sampler = EvaluationSampler(sample_rate, {}, low_confidence_quantile)
+    sampler._random.seed(0)
+    return sampler
+
+
+def test_sample_rate_holds_for_unbounded_l2_scores():
+    sampler = _sampler(low_confidence_quantile=0.05)
+    confidences = _l2_confidences(20000)
+    assert confidences.max() < 0
+
+    weights = [sampler.sample(_answer(float(c))) for c in confidences]
+    sampled = [weight for weight in weights if weight is not None]
+
+    # 5% forced as low-confidence, plus 5% of the other 95%.
+    assert len(sampled) / len(weights) == pytest.approx(0.0975, abs=0.01)
+    forced = sum(1 for weight in sampled if weight == 1.0)
+    assert forced / len(weights) == pytest.approx(0.05, abs=0.01)
+
+
+def test_forced_evaluations_are_the_lowest_scores():
+    sampler = _sampler(low_confidence_quantile=0.05, sample_rate=0.0)
+    confidences = _l2_confidences(5000)
+
+    forced = [
+        float(c) for c in confidences if sampler.sample(_answer(float(c))) is not None
+    ]
+
+    assert forced
+    assert max(forced) < np.quantile(confidences, 0.1)
+
+
+def test_low_confidence_needs_history_and_can_be_turned_off():
+    for quantile, history in ((0.05, MIN_CONFIDENCE_HISTORY - 1), (0.0, 1000)):
+        sampler = _sampler(low_confidence_quantile=quantile, sample_rate=0.0)
+        for _ in range(history):
+            sampler.sample(_answer(0.0))
+        assert sampler.probability(_answer(-1e6)) == 0.0
+
+
+def test_identical_scores_do_not_force_evaluation():
+    sampler = _sampler(low_confidence_quantile=0.05, sample_rate=0.0)
+    for _ in range(500):
+        sampler.sample(_answer(0.0))
+    assert sampler.probability(_answer(0.0)) == 0.0
+    assert sampler.probability(_answer(-0.1)) == 1.0
+
+
+def test_document_rates_override_and_set_the_weight():
+    sampler = EvaluationSampler(0.05, {"manual": 0.5}, 0.0)
+    assert sampler.probability(_answer(None, ["manual", "other"])) == 0.5
+    assert sampler.probability(_answer(None, ["other"])) == 0.05
+    sampler = EvaluationSampler(0.05, {"manual": 1.0}, 0.0)
+    assert sampler.sample(_answer(None, ["manual"])) == 1.0
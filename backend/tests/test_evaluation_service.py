@@ -0,0 +1,261 @@
+import asyncio
+import json
+import time
+
+import pytest
+from langchain_core.runnables import RunnableLambda
+
+from app.models.evaluation import (
+    EvaluationDocument,
+    EvaluationJob,
+    EvaluationJobState,
+    EvaluationRecord,
+)
+from app.models.llm.fake import FakeChatModel
+from app.models.qa import (
+    BatchEvaluationResult,
+    EvaluationResult,
+    ItemEvaluation,
+    Relevance,
+)
+from app.services import evaluation_service
+from app.services.evaluation_queue import EvaluationQueue
+from app.services.evaluation_service import EvaluationService
+
+
+class MetricsOnly(EvaluationService):
+    """Reads stored evaluations; never calls the judge LLM."""
+
+    def __init__(self):
+        self.llm_scheduler = None
+
+
+class BatchJudge(FakeChatModel):
+    """Judges items RELEVANT, leaving out those whose question says "skip".
+
+    The batch reply fails outright when any question says "garbled".
+    """
+
+    calls: list = []
+
+    def with_structured_output(self, schema, **kwargs):
+        async def judge(prompt_value):
+            text = prompt_value.to_string()
+            self.calls.append(schema)
+            if schema is EvaluationResult:
+                return EvaluationResult(
+                    relevance=Relevance.PARTLY_RELEVANT, explanation=""
+                )
+            if "garbled" in text:
+                raise ValueError("Failed to parse BatchEvaluationResult")
+            items = text.split("Item ")[1:]
+            return BatchEvaluationResult(
+                evaluations=[
+                    ItemEvaluation(
+                        item=int(item.split()[0]),
+                        relevance=Relevance.RELEVANT,
+                        explanation="",
+                    )
+                    for item in items
+                    if "skip" not in item
+                ]
+            )
+
+        return RunnableLambda(judge)
+
+
+def _judge(monkeypatch, questions):
+    monkeypatch.setattr(evaluation_service, "get_llm", lambda: BatchJudge(calls=[]))
+    service = EvaluationService()
+    jobs = [
+        EvaluationJob(question=question, answer="answer", sources=json.dumps(["s"]))
+        for question in questions
+    ]
+    results = asyncio.run(service.evaluate_batch(jobs))
+    return [result.relevance for result in results], service.llm.calls
+
+
+def test_batch_is_judged_in_one_prompt(monkeypatch):
+    relevances, calls = _judge(monkeypatch, ["q1", "q2", "q3"])
+
+    assert relevances == [Relevance.RELEVANT] * 3
+    assert calls == [BatchEvaluationResult]
+
+
+def test_items_left_out_of_the_batch_verdict_are_judged_singly(monkeypatch):
+    relevances, calls = _judge(monkeypatch, ["q1", "skip q2", "q3"])
+
+    assert relevances == [
+        Relevance.RELEVANT,
+        Relevance.PARTLY_RELEVANT,
+        Relevance.RELEVANT,
+    ]
+    assert calls == [BatchEvaluationResult, EvaluationResult]
+
+
+def test_unparseable_batch_verdict_falls_back_to_single_judgements(monkeypatch):
+    relevances, calls = _judge(monkeypatch, ["q1", "garbled q2"])
+
+    assert relevances == [Relevance.PARTLY_RELEVANT] * 2
+    assert calls == [BatchEvaluationResult, EvaluationResult, EvaluationResult]
+
+
+def _store(session_factory, rows):
+    """Stores (question, relevance, sample_weight, age_seconds, document_id)."""
+    now = time.time()
+    with session_factory() as db:
+        for question, relevance, weight, age, document_id in rows:
+            record_id = EvaluationRecord.create_id(question)
+            db.add(
+                EvaluationRecord(
+                    id=record_id,
+                    question=question,
+                    answer="answer",
+                    sources="[]",
+                    relevance=relevance.value,
+                    explanation="",
+                    evaluated_at=now - age,
+                    content_hash="hash",
+                    sample_weight=weight,
+                )
+            )
+            db.add(EvaluationDocument(evaluation_id=record_id, document_id=document_id))
+        db.commit()
+
+
+def _metrics(session_factory, **kwargs):
+    with session_factory() as db:
+        return MetricsOnly().get_metrics(db, **kwargs)
+
+
+def test_wilson_interval_matches_reference_values():
+    assert EvaluationService._wilson_interval(0.5, 100) == pytest.approx(
+        (0.4038, 0.5962), abs=1e-4
+    )
+    assert EvaluationService._wilson_interval(0.8, 10) == pytest.approx(
+        (0.4902, 0.9433), abs=1e-4
+    )
+    # Unlike the normal interval it stays informative at the boundaries.
+    assert EvaluationService._wilson_interval(0.0, 100) == pytest.approx(
+        (0.0, 0.0370), abs=1e-4
+    )
+
+
+def test_unweighted_metrics(session_factory):
+    relevances = [Relevance.RELEVANT] * 6 + [Relevance.PARTLY_RELEVANT] * 2
+    relevances += [Relevance.NON_RELEVANT] * 2
+    _store(
+        session_factory,
+        [(f"q{i}", relevance, 1.0, 0, "doc") for i, relevance in enumerate(relevances)],
+    )
+
+    metrics = _metrics(session_factory)
+
+    assert metrics["relevant"] == 6
+    assert metrics["partly_relevant"] == 2
+    assert metrics["non_relevant"] == 2
+    assert metrics["evaluations"] == 10
+    assert metrics["effective_evaluations"] == pytest.approx(10)
+    assert metrics["hit_rate"] == pytest.approx(0.6)
+    assert (
+        metrics["hit_rate_ci_low"],
+        metrics["hit_rate_ci_high"],
+    ) == pytest.approx(EvaluationService._wilson_interval(0.6, 10))
+    assert metrics["mrr"] == pytest.approx(0.7)
+    # Variance: (6 * 0.3^2 + 2 * 0.2^2 + 2 * 0.7^2) / 10^2 = 0.016.
+    margin = 1.96 * 0.016**0.5
+    assert metrics["mrr_ci_low"] == pytest.approx(0.7 - margin)
+    assert metrics["mrr_ci_high"] == pytest.approx(min(1.0, 0.7 + margin))
+
+
+def test_sample_weights_drive_rates_and_effective_size(session_factory):
+    # Two always-evaluated answers and two sampled at 5%.
+    _store(
+        session_factory,
+        [
+            ("q1", Relevance.RELEVANT, 1.0, 0, "doc"),
+            ("q2", Relevance.RELEVANT, 1.0, 0, "doc"),
+            ("q3", Relevance.NON_RELEVANT, 20.0, 0, "doc"),
+            ("q4", Relevance.NON_RELEVANT, 20.0, 0, "doc"),
+        ],
+    )
+
+    metrics = _metrics(session_factory)
+
+    assert metrics["evaluations"] == 4
+    assert metrics["hit_rate"] == pytest.approx(2 / 42)
+    assert metrics["mrr"] == pytest.approx(2 / 42)
+    assert metrics["effective_evaluations"] == pytest.approx(42**2 / 802)
+    assert metrics["hit_rate_ci_low"] <= metrics["hit_rate"]
+    assert metrics["hit_rate_ci_high"] >= metrics["hit_rate"]
+
+
+def test_window_and_document_filters(session_factory):
+    _store(
+        session_factory,
+        [
+            ("recent pump", Relevance.RELEVANT, 1.0, 10, "pump"),
+            ("old pump", Relevance.NON_RELEVANT, 1.0, 7200, "pump"),
+            ("recent valve", Relevance.NON_RELEVANT, 1.0, 10, "valve"),
+        ],
+    )
+
+    assert _metrics(session_factory, window_seconds=3600)["evaluations"] == 2
+    pump = _metrics(session_factory, document_id="pump")
+    assert pump["evaluations"] == 2
+    assert pump["hit_rate"] == pytest.approx(0.5)
+    recent_pump = _metrics(session_factory, window_seconds=3600, document_id="pump")
+    assert recent_pump["evaluations"] == 1
+    assert recent_pump["hit_rate"] == pytest.approx(1.0)
+
+
+def test_no_evaluations_reports_zeros(session_factory):
+    metrics = _metrics(session_factory)
+
+    assert metrics["evaluations"] == 0
+    assert metrics["relevant"] == 0
+    assert metrics["hit_rate"] == metrics["mrr"] == 0.0
+    assert metrics["hit_rate_ci_high"] == metrics["mrr_ci_high"] == 0.0
+
+
+def test_known_keys_cover_records_and_live_jobs(session_factory):
+    _store(session_factory, [("evaluated", Relevance.RELEVANT, 1.0, 0, "doc")])
+    now = time.time()
+    with session_factory() as db:
+        for question, state in [
+            ("queued", EvaluationJobState.PENDING),
+            ("running", EvaluationJobState.RUNNING),
+            ("gave up", EvaluationJobState.FAILED),
+        ]:
+            db.add(
+                EvaluationJob(
+                    question=question,
+                    answer="answer",
+                    sources="[]",
+                    document_ids="[]",
+                    content_hash="hash",
+                    state=state.value,
+                    available_at=now,
+                    created_at=now,
+                )
+            )
+        db.commit()
+
+    keys = [
+        (EvaluationRecord.create_id(question), content_hash)
+        for question in ["evaluated", "queued", "running", "gave up", "new"]
+        for content_hash in ["hash", "other"]
+    ]
+    with session_factory() as db:
+        known = EvaluationQueue._known(db, keys)
+
+    # Same question with a different answer is new; failed jobs may be retried.
+    assert known >= {
+        (EvaluationRecord.create_id(question), "hash")
+        for question in ["evaluated", "queued", "running"]
+    }
+    assert not known & {
+        (EvaluationRecord.create_id("gave up"), "hash"),
+        (EvaluationRecord.create_id("new"), "hash"),
+    }
+    assert all(content_hash == "hash" for _, content_hash in known)
@@ -0,0 +1,44 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.models.base import ModelConfig
+from app.models.llm.ollama import OllamaLLM
+
+CONFIG = ModelConfig(
+    provider="ollama", model_name="llama3", base_url="http://ollama:11434"
+)
+
+
+def _check(response: httpx.Response):
+    llm = OllamaLLM()
+    llm._clients[CONFIG.endpoints] = httpx.AsyncClient(
+        base_url=CONFIG.endpoints[0],
+        transport=httpx.MockTransport(lambda request: response),
+    )
+    asyncio.run(llm.check_available(CONFIG, timeout=1.0))
+
+
+def test_listed_model_is_available():
+    _check(httpx.Response(200, json={"models": [{"name": "llama3"}]}))
+
+
+@pytest.mark.parametrize(
+    "response",
+    [
+        httpx.Response(200, json={"models": [{"name": "mistral"}]}),
+        httpx.Response(200, json={}),
+        httpx.Response(200, json=["llama3"]),
+        httpx.Response(200, text="not json"),
+    ],
+)
+def test_missing_model_or_unexpected_response_is_a_value_error(response):
+    # ensure_llm_available reports ValueError as 503, not 500.
+    with pytest.raises(ValueError):
+        _check(response)
+
+
+def test_unreachable_service_is_a_connection_error():
+    with pytest.raises(ConnectionError):
+        _check(httpx.Response(502))
@@ -0,0 +1,90 @@
+import asyncio
+import json
+from typing import Any, Dict, List
+
+import pytest
+from langchain.docstore.document import Document
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+
+from app.models.embedding.fake import HashingEmbeddings
+from app.models.llm.fake import FakeChatModel
+from app.models.qa import Question
+from app.services import qa_service
+from app.services.answer_cache import SemanticAnswerCache
+from app.services.qa_service import QAService
+from app.services.vector_store_service import FAISSVectorStoreService
+
+PASSAGES = ["Vent the pump before restarting it.", "Close the valve to drain it."]
+
+
+class ScriptedChatModel(FakeChatModel):
+    """Streams a fixed reply, a few characters at a time."""
+
+    reply: str
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        for start in range(0, len(self.reply), 3):
+            yield ChatGenerationChunk(
+                message=AIMessageChunk(content=self.reply[start : start + 3])
+            )
+
+
+def _service(monkeypatch, reply: str) -> QAService:
+    monkeypatch.setattr(qa_service, "get_llm", lambda: ScriptedChatModel(reply=reply))
+    vector_store = FAISSVectorStoreService().add_documents(
+        None,
+        [Document(page_content=passage) for passage in PASSAGES],
+        ["pump", "valve"],
+        HashingEmbeddings(32, 0),
+    )
+    return QAService(
+        vector_store,
+        index_version="v1",
+        answer_cache=SemanticAnswerCache(
+            similarity_threshold=0.95, max_entries=10, ttl_seconds=3600
+        ),
+    )
+
+
+def _stream(service: QAService, question: str) -> List[Dict[str, Any]]:
+    async def collect():
+        stream = service.stream_answer(Question(question=question))
+        return [event async for event in stream]
+
+    return asyncio.run(collect())
+
+
+def _tokens(events: List[Dict[str, Any]]) -> str:
+    return "".join(
+        event["data"]["token"] for event in events if event["event"] == "token"
+    )
+
+
+@pytest.mark.parametrize("fence", [False, True])
+def test_streamed_structured_answer_reports_the_sources_used(monkeypatch, fence):
+    reply = json.dumps({"answer": "Vent it first.", "sources": [PASSAGES[0]]})
+    if fence:
+        reply = f"```json\n{reply}\n```"
+    service = _service(monkeypatch, reply)
+
+    events = _stream(service, "How do I restart the pump?")
+
+    assert _tokens(events) == "Vent it first."
+    done = events[-1]
+    assert done["event"] == "done"
+    assert done["data"] == {"answer": "Vent it first.", "sources": [PASSAGES[0]]}
+    embedding = service.vector_store.embeddings.embed_query(
+        "How do I restart the pump?"
+    )
+    assert service.answer_cache.lookup(embedding, "v1") == done["answer"]
+
+
+def test_unparseable_streamed_answer_is_not_cached(monkeypatch):
+    service = _service(monkeypatch, "Vent the pump first.")
+
+    events = _stream(service, "How do I restart the pump?")
+
+    assert _tokens(events) == "Vent the pump first."
+    assert sorted(events[-1]["data"]["sources"]) == sorted(PASSAGES)
+    assert service.answer_cache.stats()["entries"] == 0
@@ -0,0 +1,105 @@
+import asyncio
+import time
+from collections import Counter
+
+import httpx
+
+from app.models.routing import EndpointRouter, RoutingTransport
+
+REPLICAS = ["http://a:11434", "http://b:11434", "http://c:11434"]
+
+
+def _router(replicas=REPLICAS, **kwargs) -> EndpointRouter:
+    options = dict(eject_after_failures=2, ejection_seconds=60, hedge_after_seconds=0)
+    options.update(kwargs)
+    return EndpointRouter(replicas, **options)
+
+
+def _client(router: EndpointRouter, handler) -> httpx.Client:
+    mock = httpx.MockTransport(handler)
+    return httpx.Client(
+        base_url=REPLICAS[0],
+        transport=RoutingTransport(router, transport=mock, async_transport=mock),
+    )
+
+
+def test_requests_go_to_the_replica_with_fewest_in_flight():
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, headers={"replica": request.url.host})
+
+    router = _router()
+    client = _client(router, handler)
+
+    def send() -> httpx.Response:
+        # Streamed responses hold their replica until the body is closed.
+        return client.send(client.build_request("POST", "/api/chat"), stream=True)
+
+    a, b, c = send(), send(), send()
+    assert [r.headers["replica"] for r in (a, b, c)] == ["a", "b", "c"]
+    b.close()
+    d = send()
+    assert d.headers["replica"] == "b"
+    for response in (a, c, d):
+        response.close()
+
+    assert [stats["outstanding"] for stats in router.stats().values()] == [0, 0, 0]
+
+
+def test_failing_replica_is_ejected_and_returns_after_ejection():
+    router = _router(REPLICAS[:2], ejection_seconds=0.2)
+    failing = {"a"}
+    served = Counter()
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        served[request.url.host] += 1
+        return httpx.Response(503 if request.url.host in failing else 200)
+
+    client = _client(router, handler)
+
+    # Each failure on a is retried on b; the second ejects a.
+    assert [client.post("/api/chat").status_code for _ in range(4)] == [200] * 4
+    assert served == {"a": 2, "b": 4}
+    assert router.stats()[REPLICAS[0]]["ejected"] == 1.0
+
+    failing.clear()
+    time.sleep(0.25)
+    assert client.post("/api/chat").status_code == 200
+    assert served["a"] == 3
+    assert router.stats()[REPLICAS[0]]["ejected"] == 0.0
+
+
+def test_slow_request_is_hedged_and_the_loser_cancelled():
+    router = _router(REPLICAS[:2], hedge_after_seconds=0.05)
+    cancelled = asyncio.Event()
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.host == "a":
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+        return httpx.Response(200, text=request.url.host)
+
+    async def request():
+        mock = httpx.MockTransport(handler)
+        async with httpx.AsyncClient(
+            base_url=REPLICAS[0],
+            transport=RoutingTransport(router, async_transport=mock),
+        ) as client:
+            start = time.monotonic()
+            response = await client.post("/api/chat")
+            elapsed = time.monotonic() - start
+            # The loser is cancelled as the winner returns.
+            await asyncio.wait_for(cancelled.wait(), timeout=1)
+            return response.text, elapsed
+
+    text, elapsed = asyncio.run(request())
+
+    assert text == "b"
+    assert elapsed < 1
+    a, b = (router.stats()[url] for url in REPLICAS[:2])
+    assert b["hedges"] == 1
+    # The abandoned request neither stays in flight nor counts as a failure.
+    assert (a["outstanding"], a["failures"]) == (0, 0)
+    assert (b["outstanding"], b["failures"]) == (0, 0)
@@ -0,0 +1,228 @@
+import zlib
+from typing import List
+
+import faiss
+import numpy as np
+import pytest
+from langchain.docstore.document import Document
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+
+from app.core.concurrency import ReadWriteLock
+from app.core.config import IndexSettings
+from app.models.embedding.fake import HashingEmbeddings
+from app.services import faiss_index, vector_store_service
+from app.services.faiss_index import HNSW, IVF_PQ, index_type_of
+from app.services.vector_store_service import FAISSVectorStoreService
+
+DIMENSION = 16
+
+
+class FailingEmbeddings(HashingEmbeddings):
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if any("unembeddable" in text for text in texts):
+            raise RuntimeError("embedding provider unavailable")
+        return super().embed_documents(texts)
+
+
+def _documents(prefix: str, count: int) -> List[Document]:
+    return [
+        Document(page_content=f"{prefix} passage {i}", metadata={"page": i})
+        for i in range(count)
+    ]
+
+
+def _service(**kwargs) -> FAISSVectorStoreService:
+    return FAISSVectorStoreService(
+        batch_size=2, max_retries=1, retry_backoff_seconds=0, **kwargs
+    )
+
+
+def test_failed_batch_leaves_the_index_untouched():
+    service, embeddings = _service(), FailingEmbeddings(32, 0)
+    documents = _documents("pump", 4)
+    vector_store = service.add_documents(
+        None, documents, [f"old-{i}" for i in range(4)], embeddings
+    )
+
+    failing = _documents("valve", 5) + [Document(page_content="unembeddable")]
+    with pytest.raises(RuntimeError):
+        service.add_documents(
+            vector_store, failing, [f"new-{i}" for i in range(6)], embeddings
+        )
+
+    assert vector_store.index.ntotal == 4
+    assert sorted(vector_store.index_to_docstore_id.values()) == [
+        f"old-{i}" for i in range(4)
+    ]
+
+
+class ClusteredEmbeddings(Embeddings):
+    """Texts named "cluster <c> ..." embed close to basis vector c."""
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = np.random.default_rng(zlib.crc32(text.encode())).normal(
+            scale=0.05, size=DIMENSION
+        )
+        vector[int(text.split()[1])] += 10.0
+        return vector.tolist()
+
+
+def _clustered(start: int, count: int, clusters: range) -> List[Document]:
+    return [
+        Document(page_content=f"cluster {clusters[i % len(clusters)]} passage {i}")
+        for i in range(start, start + count)
+    ]
+
+
+def _cluster_of(document: Document) -> int:
+    return int(document.page_content.split()[1])
+
+
+def _search_cluster(vector_store, cluster: int, k: int = 10) -> List[Document]:
+    centroid = [0.0] * DIMENSION
+    centroid[cluster] = 10.0
+    return vector_store.similarity_search_by_vector(centroid, k=k)
+
+
+def test_ivf_pq_delete_keeps_labels_mapped_to_their_documents():
+    service = _service(
+        index_settings=IndexSettings(
+            TYPE="ivf_pq", IVF_NLIST=8, IVF_NPROBE=8, PQ_M=8, PQ_NBITS=4
+        )
+    )
+    documents = _clustered(0, 700, range(10))
+    ids = [f"doc-{i}" for i in range(700)]
+    vector_store = service.add_documents(None, documents, ids, ClusteredEmbeddings())
+    assert index_type_of(vector_store.index) == IVF_PQ
+
+    # Removing a prefix shifts every remaining position; labels must not move.
+    # Cluster 9 is emptied too, so searching it later finds only new vectors.
+    removed = ids[:100] + [ids[i] for i in range(100, 700) if i % 10 == 9]
+    service.delete_documents(vector_store, removed)
+    assert vector_store.index.ntotal == 540
+    for cluster in range(9):
+        results = _search_cluster(vector_store, cluster)
+        assert len(results) == 10
+        assert all(_cluster_of(document) == cluster for document in results)
+        assert all(int(document.page_content.split()[3]) >= 100 for document in results)
+
+    # New vectors must not reuse labels still held by remaining ones.
+    new_ids = [f"new-{i}" for i in range(20)]
+    service.add_documents(
+        vector_store, _clustered(700, 20, range(9, 10)), new_ids, ClusteredEmbeddings()
+    )
+    assert vector_store.index.ntotal == len(vector_store.index_to_docstore_id) == 560
+    results = _search_cluster(vector_store, 9, k=20)
+    assert sorted(document.page_content for document in results) == sorted(
+        f"cluster 9 passage {i}" for i in range(700, 720)
+    )
+    results = _search_cluster(vector_store, 3)
+    assert all(_cluster_of(document) == 3 for document in results)
+
+
+def test_hnsw_delete_rebuilds_outside_the_write_lock(monkeypatch):
+    service = _service(index_settings=IndexSettings(TYPE="hnsw"))
+    documents = _clustered(0, 40, range(4))
+    ids = [f"doc-{i}" for i in range(40)]
+    vector_store = service.add_documents(None, documents, ids, ClusteredEmbeddings())
+    assert index_type_of(vector_store.index) == HNSW
+
+    write_lock, held_during_build = ReadWriteLock(), []
+
+    def build_index(*args):
+        held_during_build.append(write_lock._writer)
+        return faiss_index.build_index(*args)
+
+    monkeypatch.setattr(vector_store_service, "build_index", build_index)
+    service.delete_documents(
+        vector_store, [f"doc-{i}" for i in range(0, 40, 4)], write_lock=write_lock
+    )
+
+    assert held_during_build == [False]
+    assert vector_store.index.ntotal == 30
+    results = _search_cluster(vector_store, 0)
+    assert all(_cluster_of(document) != 0 for document in results)
+    for cluster in range(1, 4):
+        results = _search_cluster(vector_store, cluster)
+        assert len(results) == 10
+        assert all(_cluster_of(document) == cluster for document in results)
+
+
+def test_scores_are_cosine_similarities():
+    service, embeddings = _service(), ClusteredEmbeddings()
+    documents = _clustered(0, 8, range(4))
+    vector_store = service.add_documents(
+        None, documents, [f"doc-{i}" for i in range(8)], embeddings
+    )
+
+    query = np.zeros(DIMENSION)
+    query[1], query[2] = 1.0, -1.0
+    results = vector_store.similarity_search_with_score_by_vector(query, k=8)
+
+    for document, score in results:
+        vector = np.asarray(embeddings.embed_query(document.page_content))
+        cosine = vector @ query / (np.linalg.norm(vector) * np.linalg.norm(query))
+        assert score == pytest.approx(cosine, abs=1e-5)
+    assert results[0][1] > 0.6 and results[-1][1] < -0.6
+
+
+def _legacy_ivf_pq(vector_store) -> faiss.Index:
+    # As built before the switch to cosine: L2 over raw vectors, with the
+    # sparse labels IVF lists keep after removals.
+    labels = sorted(vector_store.index_to_docstore_id)
+    vectors = np.asarray(
+        [
+            ClusteredEmbeddings().embed_query(
+                vector_store.docstore.search(vector_store.index_to_docstore_id[label])
+                .page_content
+            )
+            for label in labels
+        ],
+        dtype=np.float32,
+    )
+    index = faiss.IndexIVFPQ(faiss.IndexFlatL2(DIMENSION), DIMENSION, 8, 8, 4)
+    index.train(vectors)
+    index.add_with_ids(vectors, np.asarray(labels, dtype=np.int64))
+    return index
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_pq"])
+def test_legacy_l2_index_is_rebuilt_for_cosine_on_load(tmp_path, index_type):
+    service = _service(index_dir=str(tmp_path))
+    embeddings = ClusteredEmbeddings()
+    documents = _clustered(0, 700, range(8))
+    ids = [f"doc-{i}" for i in range(700)]
+    legacy = FAISS.from_embeddings(
+        [
+            (doc.page_content, embeddings.embed_query(doc.page_content))
+            for doc in documents
+        ],
+        embeddings,
+        ids=ids,
+    )
+    if index_type == "ivf_pq":
+        legacy.index_to_docstore_id = {
+            label: docstore_id
+            for label, docstore_id in legacy.index_to_docstore_id.items()
+            if label % 3
+        }
+        legacy.index = _legacy_ivf_pq(legacy)
+    service.save_vector_store(legacy, {})
+
+    vector_store, _ = service.load_latest_vector_store(embeddings, {})
+
+    assert vector_store.index.metric_type == faiss.METRIC_INNER_PRODUCT
+    assert index_type_of(vector_store.index) == index_type
+    assert sorted(vector_store.index_to_docstore_id.values()) == sorted(
+        legacy.index_to_docstore_id.values()
+    )
+    for cluster in range(8):
+        results = vector_store.similarity_search_with_score_by_vector(
+            [10.0 if i == cluster else 0.0 for i in range(DIMENSION)], k=5
+        )
+        assert all(_cluster_of(document) == cluster for document, _ in results)
+        assert all(0.9 < score <= 1.0 + 1e-5 for _, score in results)
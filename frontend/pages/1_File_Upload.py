@@ -1,4 +1,5 @@
 import os
+import time
 
 import requests
 import streamlit as st
@@ -65,8 +66,36 @@ if uploaded_file is not None:
             f"{BACKEND_URL}/api/files/upload", files=files, data=data
         )
 
-        if response.status_code == 200:
+        if response.status_code in (200, 202):
             result = response.json()
+            job_url = f"{BACKEND_URL}/api/files/jobs/{result['job_id']}"
+
+            # Poll the ingestion job until the document has been indexed
+            progress_bar = st.progress(0.0, text="Queued for processing...")
+            while True:
+                job = requests.get(job_url).json()
+                progress = job["progress"]
+                if job["state"] in ("COMPLETED", "FAILED"):
+                    break
+                if progress["chunks_total"]:
+                    fraction = progress["chunks_embedded"] / progress["chunks_total"]
+                    eta = progress["eta_seconds"]
+                    eta_text = f", ~{eta:.0f}s remaining" if eta is not None else ""
+                    progress_bar.progress(
+                        fraction,
+                        text=f"Embedded {progress['chunks_embedded']}/{progress['chunks_total']} chunks{eta_text}",
+                    )
+                else:
+                    progress_bar.progress(
+                        0.0, text=f"Parsed {progress['pages_parsed']} pages..."
+                    )
+                time.sleep(1)
+
+            if job["state"] == "FAILED":
+                st.error(f"Error processing file: {job['error']}")
+                st.stop()
+
+            progress_bar.progress(1.0, text="Done")
             st.success(
                 f"File processed successfully! Saved as: {result['saved_filename']}"
             )
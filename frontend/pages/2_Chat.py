@@ -1,3 +1,4 @@
+import json
 import os
 import time
 from typing import List
@@ -27,12 +28,22 @@ class Answer:
 
 
 API_ENDPOINT = f"{BACKEND_URL}/api/qa/answer"
+STREAM_ENDPOINT = f"{BACKEND_URL}/api/qa/answer/stream"
 METRICS_ENDPOINT = f"{BACKEND_URL}/api/qa/metrics"
 
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
 
+def stream_events(response):
+    event = None
+    for line in response.iter_lines(decode_unicode=True):
+        if line.startswith("event: "):
+            event = line[len("event: ") :]
+        elif line.startswith("data: "):
+            yield event, json.loads(line[len("data: ") :])
+
+
 def fetch_metrics():
     with st.spinner("Fetching metrics..."):
         metrics_response = requests.get(METRICS_ENDPOINT)
@@ -85,12 +96,31 @@ if prompt:
             st.markdown(prompt)
 
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                response = requests.post(API_ENDPOINT, json={"question": prompt})
-                if response.status_code == 200:
-                    answer_data = response.json()
-                    answer = Answer(**answer_data)
-                    st.markdown(answer.answer)
+            response = requests.post(
+                STREAM_ENDPOINT, json={"question": prompt}, stream=True
+            )
+            if response.status_code == 200:
+                result = {}
+
+                def answer_tokens():
+                    for event, data in stream_events(response):
+                        if event == "token":
+                            yield data["token"]
+                        elif event == "done":
+                            result["answer"] = Answer(**data)
+                        elif event == "error":
+                            result["error"] = data["detail"]
+
+                with st.spinner("Searching the document..."):
+                    tokens = answer_tokens()
+                    first_token = next(tokens, "")
+                st.write_stream(
+                    (token for part in ([first_token], tokens) for token in part)
+                )
+                if "error" in result:
+                    st.error(f"Error: {result['error']}")
+                elif "answer" in result:
+                    answer = result["answer"]
                     if answer.sources:
                         st.markdown("**Sources:**")
                         for source in answer.sources:
@@ -102,8 +132,8 @@ if prompt:
                             "sources": answer.sources,
                         }
                     )
-                else:
-                    st.error(f"Error: {response.status_code} - {response.text}")
+            else:
+                st.error(f"Error: {response.status_code} - {response.text}")
 
 # Clear chat history button
 if st.button("Clear Chat History"):